@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+植物日記 - 數據庫基準測試
+在臨時目錄中建立數據庫並計時，比較改動前後的寫法；結果與機器有關，只適合在同一台機器上比較
+
+用法:
+    python benchmarks/bench_database.py pool       # 共享連接和連接池的並發讀取
+    python benchmarks/bench_database.py listing    # 植物列表：逐株查詢照片和單次聚合查詢
+    python benchmarks/bench_database.py bulk       # 逐條提交和單事務批量寫入
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    from plant_diary.database import PlantDatabase
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from plant_diary.database import PlantDatabase
+
+
+def bench_pool(seconds=3.0, readers=4, plants=100):
+    """
+    多個線程讀取（get_plant）的同時一個線程不斷寫入照片，比較每秒讀取次數
+    
+    關閉讀取緩存，每次讀取都查詢數據庫。
+    """
+    for pooled in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = PlantDatabase(os.path.join(tmp, "bench.db"), pooled=pooled, cache_size=0)
+            plant_ids = [db.add_plant(f"植物{i}") for i in range(plants)]
+            stop = threading.Event()
+            counts = [0] * readers
+            
+            def read(index):
+                rng = random.Random(index)
+                n = 0
+                while not stop.is_set():
+                    db.get_plant(rng.choice(plant_ids))
+                    n += 1
+                counts[index] = n
+            
+            def write():
+                while not stop.is_set():
+                    db.add_photo(plant_ids[0], "bench.jpg")
+            
+            threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+            threads.append(threading.Thread(target=write))
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            db.close()
+        label = "連接池" if pooled else "共享連接"
+        print(f"{label}：{sum(counts) / seconds:,.0f} 次讀取/秒（{readers} 個讀取線程，1 個寫入線程）")
+
+
+def bench_listing(sizes=(1000, 10000), photos_per_plant=3, analysis_chars=800):
+    """比較植物列表的兩種寫法：每株植物一次 get_plant_photos（N+1）和 get_plants_with_stats"""
+    analysis = "葉" * analysis_chars
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = PlantDatabase(os.path.join(tmp, "bench.db"), cache_size=0)
+            with db.transaction():
+                plant_ids = [db.add_plant(f"植物{i}") for i in range(size)]
+            db.add_photos_many(
+                {'plant_id': plant_id, 'photo_path': f"{plant_id}_{n}.jpg",
+                 'ai_analysis': analysis, 'care_suggestions': analysis}
+                for plant_id in plant_ids for n in range(photos_per_plant)
+            )
+            
+            started = time.perf_counter()
+            for plant in db.get_all_plants():
+                db.get_plant_photos(plant['id'])
+            n_plus_one = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            db.get_plants_with_stats()
+            aggregated = time.perf_counter() - started
+            db.close()
+        print(f"{size} 株植物（每株 {photos_per_plant} 張照片）：N+1 {n_plus_one * 1000:,.0f} ms，"
+              f"聚合查詢 {aggregated * 1000:,.0f} ms")
+
+
+def bench_bulk(rows=5000):
+    """比較逐條寫入（每條一次提交）和單事務批量寫入照片記錄的每秒行數"""
+    results = {}
+    for bulk in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = PlantDatabase(os.path.join(tmp, "bench.db"), cache_size=0)
+            plant_id = db.add_plant("植物")
+            timings = {}
+            
+            started = time.perf_counter()
+            if bulk:
+                db.add_photos_many({'plant_id': plant_id, 'photo_path': f"{i}.jpg"} for i in range(rows))
+            else:
+                for i in range(rows):
+                    db.add_photo(plant_id, f"{i}.jpg")
+            timings['insert'] = time.perf_counter() - started
+            photo_ids = [photo.id for photo in db.iter_photos(plant_id, columns=('id',))]
+            
+            started = time.perf_counter()
+            if bulk:
+                db.update_photo_analysis_many((photo_id, "分析", "建議") for photo_id in photo_ids)
+            else:
+                for photo_id in photo_ids:
+                    db.update_photo_analysis(photo_id, "分析", "建議")
+            timings['update'] = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            if bulk:
+                db.delete_photos_many(photo_ids)
+            else:
+                for photo_id in photo_ids:
+                    db.delete_photo(photo_id)
+            timings['delete'] = time.perf_counter() - started
+            db.close()
+        results[bulk] = timings
+    for operation in ('insert', 'update', 'delete'):
+        single = rows / results[False][operation]
+        bulk = rows / results[True][operation]
+        print(f"{operation}：逐條 {single:,.0f} 行/秒，批量 {bulk:,.0f} 行/秒（{rows} 行）")
+
+
+BENCHMARKS = {
+    'pool': bench_pool,
+    'listing': bench_listing,
+    'bulk': bench_bulk,
+}
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="植物日記數據庫基準測試")
+    parser.add_argument('names', nargs='*', help=f"要運行的測試（{'、'.join(BENCHMARKS)}），默認全部")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的測試：{'、'.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
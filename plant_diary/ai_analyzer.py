@@ -8,6 +8,7 @@
 import os
 import base64
 import json
+import mimetypes
 from pathlib import Path
 
 
@@ -24,30 +25,34 @@ class AIAnalyzer:
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.use_openai = self.api_key is not None
     
-    def analyze_plant_photo(self, image_path, chinese_name=None, scientific_name=None):
+    def analyze_plant_photo(self, image, chinese_name=None, scientific_name=None, filename=None):
         """
         分析植物照片
         
         參數:
-            image_path: 照片路徑
+            image: 照片路徑，或以二進制模式打開的文件對象（例如 pack_store.open_photo
+                   返回的已打包照片）
             chinese_name: 植物的中文名稱（可選）
             scientific_name: 植物的學名（可選）
+            filename: 照片文件名（用於判斷圖片格式），默認取自照片路徑
             
         返回:
             dict: 包含 ai_analysis 和 care_suggestions 的字典
         """
-        if not os.path.exists(image_path):
-            return {
-                "ai_analysis": "無法找到圖片文件",
-                "care_suggestions": ""
-            }
+        if not hasattr(image, 'read'):
+            if not os.path.exists(image):
+                return {
+                    "ai_analysis": "無法找到圖片文件",
+                    "care_suggestions": ""
+                }
+            filename = filename or str(image)
         
         if self.use_openai:
-            return self._analyze_with_openai(image_path, chinese_name, scientific_name)
+            return self._analyze_with_openai(image, chinese_name, scientific_name, filename)
         else:
-            return self._analyze_local(image_path, chinese_name, scientific_name)
+            return self._analyze_local(image, chinese_name, scientific_name)
     
-    def _analyze_with_openai(self, image_path, chinese_name=None, scientific_name=None):
+    def _analyze_with_openai(self, image, chinese_name=None, scientific_name=None, filename=None):
         """使用 OpenAI API 分析圖片"""
         try:
             from openai import OpenAI
@@ -55,8 +60,14 @@ class AIAnalyzer:
             client = OpenAI(api_key=self.api_key)
             
             # 讀取圖片並轉換為 base64
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+            if hasattr(image, 'read'):
+                image_bytes = image.read()
+            else:
+                with open(image, "rb") as image_file:
+                    image_bytes = image_file.read()
+            base64_image = base64.b64encode(image_bytes).decode('utf-8')
+            # 上傳的照片可能已轉為 WebP，按擴展名填寫正確的 MIME 類型
+            mime_type = mimetypes.guess_type(str(filename or ""))[0] or "image/jpeg"
             
             # 構建植物信息文本
             plant_info = ""
@@ -97,7 +108,7 @@ class AIAnalyzer:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                    "url": f"data:{mime_type};base64,{base64_image}"
                                 }
                             }
                         ]
@@ -131,14 +142,14 @@ class AIAnalyzer:
             }
             
         except ImportError:
-            return self._analyze_local(image_path, chinese_name, scientific_name)
+            return self._analyze_local(image, chinese_name, scientific_name)
         except Exception as e:
             return {
                 "ai_analysis": f"AI 分析出錯：{str(e)}",
                 "care_suggestions": "請檢查 API 密鑰設置或網絡連接"
             }
     
-    def _analyze_local(self, image_path, chinese_name=None, scientific_name=None):
+    def _analyze_local(self, image, chinese_name=None, scientific_name=None):
         """本地基礎分析（不使用 API）"""
         # 這是一個基礎的佔位實現
         # 實際應用中可以集成其他免費的圖像識別服務
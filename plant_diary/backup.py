@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+植物日記 - 備份與遷移工具
+將整個日記導出為 NDJSON（照片可另外打包為 tar 流），或從導出文件恢復
+
+用法:
+    python -m plant_diary.backup export diary.ndjson --photos-tar photos.tar
+    python -m plant_diary.backup import diary.ndjson --photos-tar photos.tar
+    python -m plant_diary.backup import diary.ndjson --merge      # 目標數據庫已有記錄時
+
+導出和導入都是流式處理，內存佔用與日記大小無關；導入中斷後重新執行同一命令即可續傳。
+"""
+
+import argparse
+import os
+import sys
+import tarfile
+from pathlib import Path
+
+try:
+    from plant_diary.database import PlantDatabase
+    from plant_diary.pack_store import PackStore, PACK_DIR_NAME
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).parent))
+    from database import PlantDatabase
+    from pack_store import PackStore, PACK_DIR_NAME
+
+
+def export_diary(db, ndjson_path, photos_tar=None, pack_store=None):
+    """
+    導出日記
+
+    參數:
+        db: PlantDatabase 實例
+        ndjson_path: NDJSON 輸出路徑
+        photos_tar: 可選，照片 tar 流的輸出路徑
+        pack_store: 可選，照片目錄的 PackStore，已打包的照片從 pack 中讀取
+
+    返回:
+        dict: 導出統計
+    """
+    tar = tarfile.open(photos_tar, 'w|') if photos_tar else None
+    packed = set()
+    missing = 0
+
+    def add_photo_file(record):
+        nonlocal missing
+        name = record['file']
+        if name in packed:
+            return
+        path = Path(record['photo_path'])
+        if path.is_file():
+            # tarfile 按塊複製文件內容，不會把整張照片讀入內存
+            tar.add(str(path), arcname=name, recursive=False)
+        else:
+            packed_file, mtime = pack_store.open(path.name) if pack_store else (None, None)
+            if packed_file is None:
+                missing += 1
+                return
+            info = tarfile.TarInfo(name)
+            info.size = len(packed_file)
+            info.mtime = mtime
+            tar.addfile(info, packed_file)
+        packed.add(name)
+
+    try:
+        with open(ndjson_path, 'wb') as fp:
+            counts = db.export_ndjson(fp, on_photo=add_photo_file if tar else None)
+    finally:
+        if tar is not None:
+            tar.close()
+
+    counts['photo_files'] = len(packed)
+    counts['missing_files'] = missing
+    return counts
+
+
+def extract_photos(photos_tar, photos_dir):
+    """
+    流式解壓照片 tar，已存在且大小一致的文件會跳過（用於續傳）
+
+    返回:
+        tuple: (解壓的文件數, 跳過的文件數)
+    """
+    photos_dir = Path(photos_dir)
+    photos_dir.mkdir(parents=True, exist_ok=True)
+    extracted = 0
+    skipped = 0
+
+    with tarfile.open(photos_tar, 'r|') as tar:
+        for member in tar:
+            # 只接受普通文件，並去掉路徑部分，防止寫到目錄之外
+            if not member.isfile():
+                continue
+            name = os.path.basename(member.name)
+            if not name or name.startswith('.'):
+                continue
+
+            target = photos_dir / name
+            if target.exists() and target.stat().st_size == member.size:
+                skipped += 1
+                continue
+
+            # 先寫入臨時文件再改名，中斷時不會留下不完整的照片
+            temp_path = target.with_name(f".{name}.part")
+            source = tar.extractfile(member)
+            with open(temp_path, 'wb') as out:
+                while True:
+                    chunk = source.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            os.replace(temp_path, target)
+            extracted += 1
+
+    return extracted, skipped
+
+
+def import_diary(db, ndjson_path, photos_tar=None, photos_dir="plant_photos", mode=None):
+    """
+    導入日記（先恢復照片文件，再導入數據庫記錄）
+
+    參數:
+        mode: 目標數據庫已有記錄時的處理方式，'merge' 或 'replace'，見 PlantDatabase.import_ndjson
+
+    返回:
+        dict: 導入統計
+    """
+    result = {}
+    if photos_tar:
+        result['photo_files'], result['skipped_files'] = extract_photos(photos_tar, photos_dir)
+
+    with open(ndjson_path, 'rb') as fp:
+        result.update(db.import_ndjson(fp, photos_dir=str(Path(photos_dir).absolute()), mode=mode))
+    return result
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="植物日記備份與遷移工具")
+    parser.add_argument('--db', default="plant_diary.db", help="數據庫文件路徑")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="導出日記")
+    export_parser.add_argument('ndjson', help="NDJSON 輸出文件")
+    export_parser.add_argument('--photos-tar', help="同時將照片打包到此 tar 文件")
+    export_parser.add_argument('--photos-dir', default="plant_photos", help="照片目錄（讀取已打包的舊照片）")
+
+    import_parser = subparsers.add_parser('import', help="導入日記（可續傳）")
+    import_parser.add_argument('ndjson', help="NDJSON 導出文件")
+    import_parser.add_argument('--photos-tar', help="照片 tar 文件")
+    import_parser.add_argument('--photos-dir', default="plant_photos", help="照片恢復目錄")
+    mode_group = import_parser.add_mutually_exclusive_group()
+    mode_group.add_argument('--merge', dest='mode', action='store_const', const='merge',
+                            help="目標數據庫已有記錄時按 id 合併（id 相同的記錄以導入文件為準）")
+    mode_group.add_argument('--replace', dest='mode', action='store_const', const='replace',
+                            help="目標數據庫已有記錄時先清空再導入")
+
+    args = parser.parse_args(argv)
+    db = PlantDatabase(args.db)
+    try:
+        if args.command == 'export':
+            pack_store = PackStore(Path(args.photos_dir) / PACK_DIR_NAME)
+            try:
+                result = export_diary(db, args.ndjson, args.photos_tar, pack_store)
+            finally:
+                pack_store.close()
+            print(f"導出完成：{result.get('user', 0)} 個用戶，{result.get('plant', 0)} 株植物，"
+                  f"{result.get('photo', 0)} 條照片記錄，{result['photo_files']} 個照片文件")
+            if result['missing_files']:
+                print(f"警告：{result['missing_files']} 張照片文件不存在，未打包")
+        else:
+            try:
+                result = import_diary(db, args.ndjson, args.photos_tar, args.photos_dir, args.mode)
+            except ValueError as e:
+                parser.exit(1, f"導入失敗：{e}\n")
+            if 'photo_files' in result:
+                print(f"照片文件：恢復 {result['photo_files']} 個，跳過已存在的 {result['skipped_files']} 個")
+            prefix = "續傳" if result['resumed'] else "導入"
+            print(f"{prefix}完成：{result['user']} 個用戶，{result['plant']} 株植物，"
+                  f"{result['photo']} 條照片記錄")
+            if result['skipped_users']:
+                print(f"警告：用戶名已被現有帳號使用，跳過 {len(result['skipped_users'])} 個用戶："
+                      f"{', '.join(result['skipped_users'])}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+植物日記 - 分塊上傳模組
+支持斷點續傳的照片上傳：初始化 -> 按偏移量上傳分塊 -> 完成
+
+上傳中的數據直接追加寫入磁盤上的 .part 文件，同一進程連續收到的分塊同時計算 SHA-256
+（分塊換到其他 worker 後改為在完成時讀取一次整個文件計算），服務器內存佔用與文件大小無關。上傳狀態保存在磁盤上，連接中斷或服務重啟後，
+客戶端查詢已接收的偏移量即可從斷點繼續。
+
+同一上傳的分塊可能由不同的 gunicorn worker 處理，寫入和完成時對 .part 文件加
+fcntl.flock 排他鎖，並在鎖內以文件的實際大小核對偏移量（Windows 上沒有 fcntl，
+只在進程內加鎖，開發服務器為單進程）。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# 建議客戶端使用的分塊大小（字節）
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# 單個文件的最大大小（字節）
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024
+# 超過此時間（秒）未更新的上傳會被清理
+UPLOAD_EXPIRE_SECONDS = 24 * 3600
+# 從請求流讀取數據時每次讀取的字節數
+_READ_SIZE = 64 * 1024
+
+
+class OffsetMismatch(ValueError):
+    """分塊的偏移量與已接收的數據量不一致，offset 為服務器端已接收的字節數"""
+    
+    def __init__(self, offset):
+        super().__init__(f"偏移量不一致，已接收 {offset} 字節")
+        self.offset = offset
+
+
+class ChunkedUploads:
+    """管理進行中的分塊上傳"""
+    
+    def __init__(self, upload_dir):
+        """
+        參數:
+            upload_dir: 保存 .part 數據和上傳狀態的目錄
+        """
+        self.upload_dir = Path(upload_dir)
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._upload_locks = {}  # upload_id -> 鎖，同一上傳的分塊依次寫入
+        self._hashers = {}  # upload_id -> (已計算到的偏移量, sha256 對象)
+    
+    def _after_fork(self):
+        """在 fork 出的子進程中重建鎖並丟棄父進程的哈希狀態"""
+        self._lock = threading.Lock()
+        self._upload_locks = {}
+        self._hashers = {}
+    
+    def _paths(self, upload_id):
+        """返回上傳的 (數據文件, 狀態文件) 路徑；upload_id 不合法時拋出 KeyError"""
+        if len(upload_id) != 32 or not all(c in '0123456789abcdef' for c in upload_id):
+            raise KeyError(upload_id)
+        return self.upload_dir / f"{upload_id}.part", self.upload_dir / f"{upload_id}.json"
+    
+    def _upload_lock(self, upload_id):
+        with self._lock:
+            return self._upload_locks.setdefault(upload_id, threading.Lock())
+    
+    @contextmanager
+    def _locked_part(self, upload_id):
+        """
+        打開上傳的 .part 文件並加排他鎖（進程內的線程鎖和跨進程的 flock）
+        
+        返回（yield）:
+            以 r+b 模式打開的 .part 文件；上傳不存在時拋出 KeyError
+        """
+        part_path, _ = self._paths(upload_id)
+        with self._upload_lock(upload_id):
+            try:
+                f = open(part_path, 'r+b')
+            except FileNotFoundError:
+                raise KeyError(upload_id)
+            with f:
+                if fcntl is not None:
+                    # 關閉文件時自動釋放；關閉前已寫入的緩衝會先刷新
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                yield f
+    
+    def create(self, owner, plant_id, filename, size, notes=""):
+        """
+        初始化一個上傳
+        
+        參數:
+            owner: 上傳者（用戶 ID），之後的請求必須來自同一用戶
+            plant_id: 植物 ID
+            filename: 原文件名
+            size: 文件總大小（字節）
+            notes: 照片備註
+        
+        返回:
+            dict: 上傳狀態，包含 upload_id、offset、size 和 chunk_size
+        """
+        if size <= 0 or size > MAX_UPLOAD_SIZE:
+            raise ValueError(f"文件大小必須在 1 字節到 {MAX_UPLOAD_SIZE // (1024 * 1024)} MB 之間")
+        self.cleanup()
+        
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        meta = {
+            'upload_id': upload_id,
+            'owner': owner,
+            'plant_id': plant_id,
+            'filename': filename,
+            'size': size,
+            'notes': notes
+        }
+        part_path.touch()
+        meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+        return self._status(meta, 0)
+    
+    def _status(self, meta, offset):
+        return {
+            'upload_id': meta['upload_id'],
+            'offset': offset,
+            'size': meta['size'],
+            'chunk_size': DEFAULT_CHUNK_SIZE
+        }
+    
+    def get(self, upload_id):
+        """
+        讀取上傳信息
+        
+        返回:
+            tuple: (上傳元數據, 已接收的字節數)；上傳不存在時拋出 KeyError
+        """
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            return meta, part_path.stat().st_size
+        except FileNotFoundError:
+            raise KeyError(upload_id)
+    
+    def status(self, upload_id):
+        """返回上傳的當前狀態（用於斷點續傳時查詢偏移量）"""
+        meta, offset = self.get(upload_id)
+        return self._status(meta, offset)
+    
+    def _take_hasher(self, upload_id, offset):
+        """
+        取出本進程已計算到 offset 的 SHA-256
+        
+        返回:
+            sha256 對象；沒有（其他 worker 寫入過分塊、服務重啟後）時返回 None，
+            之後的分塊不再計算，完成時讀取一次整個文件
+        """
+        with self._lock:
+            cached = self._hashers.pop(upload_id, None)
+        if cached is not None and cached[0] == offset:
+            return cached[1]
+        return None
+    
+    def write_chunk(self, upload_id, offset, stream):
+        """
+        從請求流寫入一個分塊
+        
+        參數:
+            upload_id: 上傳 ID
+            offset: 分塊在文件中的起始位置，必須等於已接收的字節數
+            stream: 可讀的二進制流（分塊讀取，不會整塊讀入內存）
+        
+        返回:
+            int: 寫入後已接收的字節數；連接中斷時已寫入的部分同樣保留
+        """
+        with self._locked_part(upload_id) as out:
+            meta, _ = self.get(upload_id)
+            # 其他 worker 可能剛寫入過，以鎖內文件的實際大小為準
+            current = os.fstat(out.fileno()).st_size
+            if offset != current:
+                raise OffsetMismatch(current)
+            
+            # 從頭開始的上傳總是計算哈希；中途換 worker 時不重新讀取已接收的數據
+            hasher = hashlib.sha256() if current == 0 else self._take_hasher(upload_id, current)
+            received = current
+            out.seek(current)
+            try:
+                while True:
+                    chunk = stream.read(_READ_SIZE)
+                    if not chunk:
+                        break
+                    if received + len(chunk) > meta['size']:
+                        raise ValueError("上傳的數據超過了聲明的文件大小")
+                    out.write(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    received += len(chunk)
+            finally:
+                # 即使連接中途斷開，已寫入的數據和對應的哈希狀態也保留，客戶端可從 received 續傳
+                if hasher is not None:
+                    with self._lock:
+                        self._hashers[upload_id] = (received, hasher)
+            return received
+    
+    def finalize(self, upload_id):
+        """
+        完成上傳
+        
+        返回:
+            tuple: (上傳元數據, 內容哈希, 數據文件路徑)；調用者保存文件後應調用 discard
+        """
+        with self._locked_part(upload_id) as part:
+            meta, _ = self.get(upload_id)
+            received = os.fstat(part.fileno()).st_size
+            if received != meta['size']:
+                raise OffsetMismatch(received)
+            part_path, _ = self._paths(upload_id)
+            hasher = self._take_hasher(upload_id, received)
+            if hasher is None:
+                hasher = hashlib.sha256()
+                while True:
+                    chunk = part.read(_READ_SIZE * 16)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+            return meta, hasher.hexdigest(), part_path
+    
+    def discard(self, upload_id):
+        """刪除上傳的數據和狀態"""
+        part_path, meta_path = self._paths(upload_id)
+        for path in (part_path, meta_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+            self._upload_locks.pop(upload_id, None)
+    
+    def cleanup(self, max_age=UPLOAD_EXPIRE_SECONDS):
+        """清理長時間沒有更新的上傳"""
+        deadline = time.time() - max_age
+        for meta_path in self.upload_dir.glob('*.json'):
+            part_path = meta_path.with_suffix('.part')
+            try:
+                last_update = max(meta_path.stat().st_mtime,
+                                  part_path.stat().st_mtime if part_path.exists() else 0)
+            except FileNotFoundError:
+                continue
+            if last_update < deadline:
+                self.discard(meta_path.stem)
@@ -8,25 +8,482 @@
 import sqlite3
 import os
 import hashlib
+import threading
+import base64
+import json
+import time
+import warnings
+import weakref
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime
 from pathlib import Path
 
 
+# 等待寫鎖的最長時間（毫秒），避免併發寫入時立即拋出 "database is locked"
+BUSY_TIMEOUT_MS = 5000
+
+# 分頁查詢的默認和最大每頁數量
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# 搜索最多翻到的結果數；排序需要取出 offset + limit 行，不限制時深翻頁的代價無上限
+MAX_SEARCH_OFFSET = 1000
+
+
+def encode_page_cursor(sort_value, row_id):
+    """將 (排序值, id) 編碼為不透明的分頁游標"""
+    raw = json.dumps([sort_value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_page_cursor(cursor):
+    """解碼分頁游標，格式錯誤時拋出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError("無效的分頁游標")
+    if not isinstance(sort_value, str) or not isinstance(row_id, int):
+        raise ValueError("無效的分頁游標")
+    return sort_value, row_id
+
+
+def _clamp_page_size(limit):
+    """將每頁數量限制在合理範圍內"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+# 導出文件格式版本
+EXPORT_FORMAT_VERSION = 1
+# 導入時每個事務寫入的記錄數
+IMPORT_BATCH_SIZE = 1000
+# 導出 / 導入的表，按導入順序排列：(記錄類型, 表名)
+EXPORT_TABLES = (('user', 'users'), ('plant', 'plants'), ('photo', 'photos'))
+# 導入到已有植物或照片的數據庫時可選的模式：merge 按 id 合併，replace 先清空再導入
+IMPORT_MODES = ('merge', 'replace')
+
+
+# iter_plants / iter_photos 可選擇的欄位
+PLANT_COLUMNS = ('id', 'chinese_name', 'scientific_name', 'created_at', 'updated_at', 'notes')
+PHOTO_COLUMNS = ('id', 'plant_id', 'photo_path', 'taken_at', 'notes',
+                 'ai_analysis', 'care_suggestions', 'analyzed_at', 'content_hash', 'original_hash')
+# 迭代讀取時每次從數據庫取出的行數
+ITER_BATCH_SIZE = 500
+
+
+@lru_cache(maxsize=64)
+def _record_type(name, columns):
+    """按欄位組合創建（並緩存）記錄類型；namedtuple 沒有實例 __dict__，比字典小得多"""
+    return namedtuple(name, columns)
+
+
+def _select_columns(columns, allowed):
+    """檢查要讀取的欄位，返回欄位元組；未知欄位拋出 ValueError"""
+    if columns is None:
+        return allowed
+    columns = tuple(columns)
+    unknown = [col for col in columns if col not in allowed]
+    if unknown or not columns:
+        raise ValueError(f"無效的欄位：{', '.join(unknown) or '（空）'}")
+    return columns
+
+
+# 搜索結果摘要中標記匹配文字的符號
+SNIPPET_MARK_OPEN = '【'
+SNIPPET_MARK_CLOSE = '】'
+# trigram 分詞只能匹配至少 3 個字符的詞
+FTS_MIN_TERM_LENGTH = 3
+# 匹配行數超過此值時不再按 bm25 排序
+FTS_RANK_MAX_MATCHES = 2000
+
+# ai_analyzer 分析失敗或未設置 API 密鑰時返回的文字開頭，這些結果不沿用到相同內容的照片
+ANALYSIS_FAILURE_PREFIXES = ('無法找到圖片文件', 'AI 分析出錯', '由於未設置 OpenAI API 密鑰')
+
+
+def _fts_phrase(term):
+    """將用戶輸入的詞轉為 FTS5 短語，避免特殊字符被當作查詢語法"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_pattern(term):
+    """將用戶輸入的詞轉為 LIKE 模式（轉義通配符）"""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _make_snippet(text, terms, width=16):
+    """
+    截取各個詞第一次出現位置附近的片段作為摘要，片段中所有匹配的詞都加上標記
+    
+    相距較遠的片段之間以 … 連接。
+    """
+    if not text:
+        return ""
+    lower = text.lower()
+    terms = [term.lower() for term in terms if term]
+    firsts = sorted((pos, pos + len(term)) for term in terms
+                    for pos in [lower.find(term)] if pos >= 0)
+    if not firsts:
+        return text[:width * 2]
+    
+    windows = []
+    for pos, end in firsts:
+        start, stop = max(0, pos - width), min(len(text), end + width)
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], stop)
+        else:
+            windows.append([start, stop])
+    
+    # 所有詞的所有出現位置，重疊的合併為一段
+    spans = []
+    for term in terms:
+        pos = lower.find(term)
+        while pos >= 0:
+            spans.append((pos, pos + len(term)))
+            pos = lower.find(term, pos + 1)
+    merged = []
+    for pos, end in sorted(spans):
+        if merged and pos < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([pos, end])
+    
+    pieces = []
+    for start, stop in windows:
+        piece, cursor = [], start
+        for pos, end in merged:
+            if pos >= cursor and end <= stop:
+                piece += [text[cursor:pos], SNIPPET_MARK_OPEN, text[pos:end], SNIPPET_MARK_CLOSE]
+                cursor = end
+        piece.append(text[cursor:stop])
+        pieces.append(''.join(piece))
+    return (
+        ('…' if windows[0][0] > 0 else '')
+        + '…'.join(pieces)
+        + ('…' if windows[-1][1] < len(text) else '')
+    )
+
+
+class ReadCache:
+    """線程安全的 LRU 讀取緩存，條目超過 TTL 後失效"""
+    
+    _MISSING = object()
+    
+    def __init__(self, max_size=1024, ttl=30.0):
+        """
+        參數:
+            max_size: 最多緩存的條目數
+            ttl: 條目存活時間（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (過期時間, 值)
+        self._lock = threading.Lock()
+        # 每次 clear 加 1；讀取前記下，寫入時不一致說明讀取期間數據已被修改
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def get(self, key):
+        """查詢緩存，未命中或已過期時返回 ReadCache._MISSING"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return self._MISSING
+    
+    def set(self, key, value, generation=None):
+        """
+        寫入緩存，超出容量時淘汰最久未使用的條目
+        
+        參數:
+            generation: 讀取數據前的 generation；之後緩存被清空過時不寫入（值可能已過時）
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] =  (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        """清空緩存"""
+        with self._lock:
+            if self._data:
+                self._data.clear()
+            self.generation += 1
+            self.invalidations += 1
+    
+    def stats(self):
+        """獲取命中統計"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'invalidations': self.invalidations
+            }
+
+
+class QueryStats:
+    """
+    SQL 語句耗時統計和慢查詢日誌
+    
+    按語句文本（合併空白後）分組，記錄次數、總耗時和最近樣本的分位數。
+    耗時只包含 execute 階段，不包含之後 fetch 結果的時間。
+    """
+    
+    # 這些語句可以用 EXPLAIN QUERY PLAN 取得查詢計劃
+    _EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+    
+    def __init__(self, slow_threshold_ms=100.0, max_samples=1024, max_slow_queries=100):
+        """
+        參數:
+            slow_threshold_ms: 超過此耗時（毫秒）的語句記入慢查詢日誌
+            max_samples: 每條語句保留用於計算分位數的最近樣本數
+            max_slow_queries: 慢查詢日誌保留的條數
+        """
+        self.slow_threshold_ms = slow_threshold_ms
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._statements = {}  # sql -> {'count', 'total', 'max', 'samples'}
+        self._slow_queries = deque(maxlen=max_slow_queries)
+    
+    def record(self, sql, seconds, conn=None, parameters=None):
+        """記錄一次語句執行；超過閾值時附上查詢計劃寫入慢查詢日誌"""
+        key = ' '.join(sql.split())
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                entry = {'count': 0, 'total': 0.0, 'max': 0.0,
+                         'samples': deque(maxlen=self.max_samples)}
+                self._statements[key] = entry
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['samples'].append(seconds)
+        
+        duration_ms = seconds * 1000
+        if duration_ms < self.slow_threshold_ms:
+            return
+        
+        plan = None
+        if conn is not None and key.upper().startswith(self._EXPLAINABLE):
+            try:
+                # 使用基類的 execute，避免查詢計劃本身被統計
+                rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters or ())
+                plan = [row[3] for row in rows.fetchall()]
+            except sqlite3.Error:
+                pass
+        print(f"慢查詢 ({duration_ms:.1f} ms): {key}")
+        with self._lock:
+            self._slow_queries.append({
+                'sql': key,
+                'duration_ms': round(duration_ms, 3),
+                'at': datetime.now().isoformat(),
+                'plan': plan
+            })
+    
+    def snapshot(self):
+        """
+        獲取統計數據
+        
+        返回:
+            dict: statements 按總耗時倒序排列，slow_queries 按時間倒序排列
+        """
+        with self._lock:
+            statements = [(sql, dict(entry, samples=sorted(entry['samples'])))
+                          for sql, entry in self._statements.items()]
+            slow_queries = list(reversed(self._slow_queries))
+        
+        def percentile(samples, fraction):
+            index = min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))
+            return round(samples[index] * 1000, 3)
+        
+        result = []
+        for sql, entry in statements:
+            samples = entry['samples']
+            result.append({
+                'sql': sql,
+                'count': entry['count'],
+                'total_ms': round(entry['total'] * 1000, 3),
+                'avg_ms': round(entry['total'] * 1000 / entry['count'], 3),
+                'p50_ms': percentile(samples, 0.50),
+                'p95_ms': percentile(samples, 0.95),
+                'p99_ms': percentile(samples, 0.99),
+                'max_ms': round(entry['max'] * 1000, 3)
+            })
+        result.sort(key=lambda item: item['total_ms'], reverse=True)
+        return {
+            'slow_threshold_ms': self.slow_threshold_ms,
+            'statements': result,
+            'slow_queries': slow_queries
+        }
+    
+    def reset(self):
+        """清空統計數據"""
+        with self._lock:
+            self._statements.clear()
+            self._slow_queries.clear()
+
+
+class _TimedCursor(sqlite3.Cursor):
+    """記錄每次 execute 耗時的游標"""
+    
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.query_stats.record(
+                sql, time.perf_counter() - start, self.connection, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.query_stats.record(sql, time.perf_counter() - start)
+
+
+class _TimedConnection(sqlite3.Connection):
+    """所有游標都使用 _TimedCursor 的連接（僅在啟用統計時使用）"""
+    
+    query_stats = None
+    
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _copy_cached(value):
+    """返回緩存值的副本，避免調用者修改緩存內容"""
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [dict(item) for item in value]
+    return value
+
+
 class PlantDatabase:
     """植物數據庫管理類"""
     
-    def __init__(self, db_path="plant_diary.db"):
-        """初始化數據庫連接"""
+    def __init__(self, db_path="plant_diary.db", pooled=False, cache_size=1024, cache_ttl=30.0,
+                 query_stats=None):
+        """
+        初始化數據庫連接
+        
+        參數:
+            db_path: 數據庫文件路徑
+            pooled: 是否啟用連接池模式（每個線程使用獨立連接）。
+                    開啟後讀取不會排在後台分析線程的寫入之後。
+            cache_size: get_plant / get_user / get_all_plants 讀取緩存的條目數，0 表示不緩存
+            cache_ttl: 緩存條目存活時間（秒）
+            query_stats: QueryStats 實例，提供時記錄每條 SQL 的耗時；
+                         為 None 時使用原生連接，沒有額外開銷
+        """
         self.db_path = db_path
         self.conn = None
+        # 內存數據庫無法在多個連接之間共享，只能使用單一連接
+        self.pooled = pooled and db_path != ":memory:"
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        self._pool = {}  # 線程 -> 連接
+        self._cache = ReadCache(cache_size, cache_ttl) if cache_size > 0 else None
+        self.query_stats = query_stats
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._inherited_connections = []
+        if hasattr(os, 'register_at_fork'):
+            # 弱引用，註冊後數據庫對象仍可被回收
+            after_fork = weakref.WeakMethod(self._after_fork)
+            
+            def reset_in_child():
+                method = after_fork()
+                if method is not None:
+                    method()
+            
+            os.register_at_fork(after_in_child=reset_in_child)
         self.init_database()
     
+    def _connect(self):
+        """創建並配置一個新的數據庫連接"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            factory=_TimedConnection if self.query_stats is not None else sqlite3.Connection
+        )
+        if self.query_stats is not None:
+            conn.query_stats = self.query_stats
+        conn.row_factory = sqlite3.Row  # 使用 Row 工廠以便按列名訪問
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        if self.db_path != ":memory:":
+            # WAL 模式下讀取不會被寫入阻塞，寫入也不會被讀取阻塞
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+    
     def get_connection(self):
-        """獲取數據庫連接"""
-        if self.conn is None:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row  # 使用 Row 工廠以便按列名訪問
-        return self.conn
+        """獲取數據庫連接（連接池模式下返回當前線程專用的連接）"""
+        if not self.pooled:
+            if self.conn is None:
+                self.conn = self._connect()
+            return self.conn
+        
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._pool_lock:
+                self._prune_pool()
+                self._pool[threading.current_thread()] = conn
+        return conn
+    
+    def _after_fork(self):
+        """
+        在 fork 出的子進程中（例如 gunicorn --preload 的 worker）放棄父進程的連接和鎖
+        
+        SQLite 連接不能跨 fork 使用，子進程之後會建立自己的連接。父進程的連接只保留引用，
+        不在子進程中關閉，以免影響父進程仍在使用的同一個數據庫文件。
+        """
+        if self.conn is not None:
+            self._inherited_connections.append(self.conn)
+        self._inherited_connections.extend(self._pool.values())
+        self.conn = None
+        self._pool = {}
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
+        self._subscribers_lock = threading.Lock()
+        if self._cache is not None:
+            self._cache = ReadCache(self._cache.max_size, self._cache.ttl)
+    
+    def _prune_pool(self):
+        """關閉已結束線程遺留的連接（調用者需持有 _pool_lock）"""
+        for thread in [t for t in self._pool if not t.is_alive()]:
+            try:
+                self._pool.pop(thread).close()
+            except sqlite3.Error:
+                pass
     
     def init_database(self):
         """初始化數據庫表結構"""
@@ -72,9 +529,217 @@ class PlantDatabase:
         
         conn.commit()
         
+        # 將舊數據庫升級到最新結構
+        self.migrate()
+        self.ensure_full_text_search()
+        
         # 初始化管理員帳號（如果不存在）
         self._init_admin_user()
     
+    @contextmanager
+    def transaction(self):
+        """
+        將多個寫操作合併為一個事務（一次提交）
+        
+        用法:
+            with db.transaction():
+                db.add_plant(...)
+                db.add_photo(...)
+        
+        事務內的寫方法不會各自提交，離開 with 區塊時統一提交，出錯則整體回滾。
+        可以嵌套使用，只有最外層會提交。注意：非連接池模式下所有線程共用一個連接，
+        其他線程的寫入也會被併入本事務。
+        """
+        conn = self.get_connection()
+        depth = getattr(self._local, 'tx_depth', 0)
+        if depth == 0 and not conn.in_transaction:
+            # 立即取得寫鎖，避免事務中途由讀鎖升級為寫鎖時發生 "database is locked"
+            conn.execute('BEGIN IMMEDIATE')
+        self._local.tx_depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.tx_depth = depth
+            if depth == 0:
+                conn.rollback()
+                self._invalidate_cache()
+                # 回滾的修改不通知訂閱者
+                self._local.pending_events = []
+            raise
+        self._local.tx_depth = depth
+        if depth == 0:
+            conn.commit()
+            self._invalidate_cache()
+            events, self._local.pending_events = getattr(self._local, 'pending_events', []), []
+            for event, data in events:
+                self._dispatch(event, data)
+    
+    def _commit(self, conn):
+        """提交寫操作（在 transaction() 內時延遲到事務結束），並使讀取緩存失效"""
+        if not getattr(self._local, 'tx_depth', 0):
+            conn.commit()
+        self._invalidate_cache()
+    
+    def subscribe(self, callback):
+        """
+        訂閱數據變更通知
+        
+        寫方法提交後以 callback(event, data) 通知訂閱者，例如
+        ('photo_analysis_updated', {'photo_id': 3})。事務內的通知延遲到最外層提交後
+        才發出，回滾時丟棄。回調在執行寫操作的線程上調用（可能是後台分析線程），
+        界面需要自行轉交到主線程處理，回調中也不應做耗時的工作。
+        
+        事件:
+            plant_added / plant_updated / plant_deleted: plant_id
+            photo_added: photo_id, plant_id
+            photos_added: count
+            photo_analysis_updated: photo_id（批量更新時每張照片一個事件）
+            photo_deleted: photo_id（批量刪除時每張照片一個事件）
+        """
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+    
+    def unsubscribe(self, callback):
+        """取消訂閱數據變更通知"""
+        with self._subscribers_lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+    
+    def _notify(self, event, **data):
+        """發出數據變更通知（在 transaction() 內時延遲到事務提交後）"""
+        if not self._subscribers:
+            return
+        if getattr(self._local, 'tx_depth', 0):
+            pending = getattr(self._local, 'pending_events', None)
+            if pending is None:
+                pending = self._local.pending_events = []
+            pending.append((event, data))
+        else:
+            self._dispatch(event, data)
+    
+    def _dispatch(self, event, data):
+        """調用所有訂閱者；單個回調出錯不影響寫操作和其他訂閱者"""
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event, data)
+            except Exception as e:
+                print(f"數據變更通知處理失敗 ({event}): {e}")
+    
+    def _invalidate_cache(self):
+        """清空讀取緩存"""
+        if self._cache is not None:
+            self._cache.clear()
+    
+    def _check_external_changes(self):
+        """
+        檢查其他連接（其他線程或 gunicorn worker）是否修改過數據庫
+        
+        PRAGMA data_version 在其他連接提交後會變化，代價只是一次輕量查詢。
+        每個連接的版本號互不可比，因此按線程記錄；新連接第一次檢查時無法判斷，
+        直接清空緩存。
+        """
+        conn = self.get_connection()
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if getattr(self._local, 'data_version', None) != version:
+            self._local.data_version = version
+            self._invalidate_cache()
+    
+    def _cached(self, key, loader):
+        """讀取緩存，未命中時調用 loader 並寫入緩存"""
+        if self._cache is None:
+            return loader()
+        self._check_external_changes()
+        # 讀取期間其他線程提交的修改會清空緩存，這時讀到的值不寫入緩存
+        generation = self._cache.generation
+        value = self._cache.get(key)
+        if value is ReadCache._MISSING:
+            value = loader()
+            self._cache.set(key, value, generation)
+        return _copy_cached(value)
+    
+    def cache_stats(self):
+        """獲取讀取緩存的命中統計，未啟用緩存時返回 None"""
+        return self._cache.stats() if self._cache is not None else None
+    
+    def get_schema_version(self):
+        """獲取當前數據庫結構版本（未遷移過的數據庫為 0）"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TEXT NOT NULL
+            )
+        ''')
+        conn.commit()
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+        return cursor.fetchone()[0] or 0
+    
+    def migrate(self):
+        """
+        按版本號依次執行尚未應用的結構遷移
+        
+        每個遷移在獨立的寫事務中執行，並在事務內再次確認版本號，
+        因此多個進程同時啟動時同一遷移只會執行一次。
+        
+        返回:
+            list: 本次應用的遷移版本號
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        applied = []
+        
+        for version, description, migration in MIGRATIONS:
+            if version <= self.get_schema_version():
+                continue
+            
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,))
+                if cursor.fetchone():
+                    conn.rollback()
+                    continue
+                migration(cursor)
+                cursor.execute('''
+                    INSERT INTO schema_version (version, description, applied_at)
+                    VALUES (?, ?, ?)
+                ''', (version, description, datetime.now().isoformat()))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version)
+        
+        return applied
+    
+    def ensure_full_text_search(self):
+        """
+        全文檢索索引不存在時（遷移 2 執行時 SQLite 不支持 FTS5 / trigram）重新建立
+        
+        每次啟動時調用，升級 SQLite 後自動補建索引；仍不可用時發出 RuntimeWarning，
+        search() 退回 LIKE 查詢。
+        
+        返回:
+            bool: 全文檢索是否可用
+        """
+        if self.get_schema_version() < 2 or self._has_fts():
+            return True
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            _create_full_text_search(cursor)
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            warnings.warn(f"全文檢索不可用（需要支持 FTS5 trigram 的 SQLite 3.34+），搜索將使用 LIKE 查詢: {e}",
+                          RuntimeWarning, stacklevel=2)
+            return False
+        return True
+    
     def add_plant(self, chinese_name, scientific_name="", notes=""):
         """添加新植物"""
         conn = self.get_connection()
@@ -86,7 +751,8 @@ class PlantDatabase:
             VALUES (?, ?, ?, ?, ?)
         ''', (chinese_name, scientific_name, now, now, notes))
         
-        conn.commit()
+        self._commit(conn)
+        self._notify('plant_added', plant_id=cursor.lastrowid)
         return cursor.lastrowid
     
     def update_plant(self, plant_id, chinese_name=None, scientific_name=None, notes=None):
@@ -118,49 +784,208 @@ class PlantDatabase:
             WHERE id = ?
         ''', values)
         
-        conn.commit()
+        self._commit(conn)
+        self._notify('plant_updated', plant_id=plant_id)
     
     def delete_plant(self, plant_id):
-        """刪除植物及其所有照片記錄"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """
+        刪除植物及其所有照片記錄
         
-        # 先刪除相關照片
-        cursor.execute('DELETE FROM photos WHERE plant_id = ?', (plant_id,))
-        # 刪除植物
-        cursor.execute('DELETE FROM plants WHERE id = ?', (plant_id,))
-        
-        conn.commit()
+        照片文件可能被其他記錄共用，這裡只把路徑放入待刪除隊列（file_deletions），
+        由孤兒文件清理（orphan_gc）確認沒有引用後再刪除。
+        """
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # 先把照片文件加入待刪除隊列，再刪除相關照片
+            cursor.execute('''
+                INSERT OR IGNORE INTO file_deletions (path, queued_at)
+                SELECT DISTINCT photo_path, ? FROM photos WHERE plant_id = ?
+            ''', (datetime.now().isoformat(), plant_id))
+            cursor.execute('DELETE FROM photos WHERE plant_id = ?', (plant_id,))
+            # 刪除植物
+            cursor.execute('DELETE FROM plants WHERE id = ?', (plant_id,))
+            self._notify('plant_deleted', plant_id=plant_id)
     
     def get_all_plants(self):
         """獲取所有植物列表"""
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM plants ORDER BY created_at DESC')
+            return [dict(row) for row in cursor.fetchall()]
+        return self._cached(('all_plants',), load)
+    
+    def iter_plants(self, columns=None, batch_size=ITER_BATCH_SIZE):
+        """
+        按創建時間倒序逐條迭代植物（順序與 get_all_plants 相同）
+        
+        記錄是 namedtuple（如 plant.chinese_name），只包含所選欄位，並按批從數據庫讀取，
+        不會一次建立整個列表。適合只遍歷一次的場合，例如刷新列表。
+        
+        參數:
+            columns: 要讀取的欄位（PLANT_COLUMNS 的子集），None 表示全部欄位
+            batch_size: 每次從數據庫讀取的行數
+        
+        返回:
+            generator: PlantRecord 記錄
+        """
+        columns = _select_columns(columns, PLANT_COLUMNS)
+        yield from self._iter_records(
+            'PlantRecord', columns,
+            f'SELECT {", ".join(columns)} FROM plants ORDER BY created_at DESC',
+            (), batch_size
+        )
+    
+    def get_plants_with_stats(self):
+        """
+        獲取所有植物列表及其照片統計（單次聚合查詢）
+        
+        返回:
+            list: 植物字典列表，每項額外包含
+                - photo_count: 照片數量
+                - latest_photo_path: 最新照片路徑
+                - latest_photo_at: 最新照片拍攝時間
+                - last_analyzed_at: 最近一次 AI 分析時間
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM plants ORDER BY created_at DESC')
+        # 一次掃描 photos 表，同時得到數量、最新照片和最近分析時間
+        cursor.execute('''
+            WITH ranked AS MATERIALIZED (
+                SELECT plant_id, photo_path, taken_at,
+                       ROW_NUMBER() OVER w AS rn,
+                       COUNT(*) OVER (PARTITION BY plant_id) AS photo_count,
+                       MAX(analyzed_at) OVER (PARTITION BY plant_id) AS last_analyzed_at
+                FROM photos
+                WINDOW w AS (PARTITION BY plant_id ORDER BY taken_at DESC, id DESC)
+            )
+            SELECT p.*,
+                   COALESCE(r.photo_count, 0) AS photo_count,
+                   r.photo_path AS latest_photo_path,
+                   r.taken_at AS latest_photo_at,
+                   r.last_analyzed_at
+            FROM plants p
+            LEFT JOIN ranked r ON r.plant_id = p.id AND r.rn = 1
+            ORDER BY p.created_at DESC
+        ''')
         return [dict(row) for row in cursor.fetchall()]
     
+    def get_plants_page(self, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        按建立時間倒序分頁獲取植物列表及其照片統計（keyset 分頁）
+        
+        參數:
+            limit: 每頁數量
+            cursor: 上一頁返回的游標，None 表示第一頁
+            
+        返回:
+            tuple: (植物字典列表, 下一頁游標或 None)
+        """
+        limit = _clamp_page_size(limit)
+        conn = self.get_connection()
+        db_cursor = conn.cursor()
+        
+        where = ''
+        params = []
+        if cursor:
+            created_at, plant_id = decode_page_cursor(cursor)
+            where = 'WHERE (p.created_at, p.id) < (?, ?)'
+            params = [created_at, plant_id]
+        
+        # 每頁只有少量植物，子查詢都能走 idx_photos_plant_taken 索引
+        db_cursor.execute(f'''
+            SELECT p.*,
+                   (SELECT COUNT(*) FROM photos WHERE plant_id = p.id) AS photo_count,
+                   (SELECT photo_path FROM photos WHERE plant_id = p.id
+                    ORDER BY taken_at DESC, id DESC LIMIT 1) AS latest_photo_path,
+                   (SELECT MAX(taken_at) FROM photos WHERE plant_id = p.id) AS latest_photo_at,
+                   (SELECT MAX(analyzed_at) FROM photos WHERE plant_id = p.id) AS last_analyzed_at
+            FROM plants p
+            {where}
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT ?
+        ''', params + [limit + 1])
+        plants = [dict(row) for row in db_cursor.fetchall()]
+        
+        next_cursor = None
+        if len(plants) > limit:
+            plants = plants[:limit]
+            next_cursor = encode_page_cursor(plants[-1]['created_at'], plants[-1]['id'])
+        return plants, next_cursor
+    
     def get_plant(self, plant_id):
         """獲取單個植物信息"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM plants WHERE id = ?', (plant_id,))
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM plants WHERE id = ?', (plant_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        return self._cached(('plant', plant_id), load)
     
-    def add_photo(self, plant_id, photo_path, notes="", ai_analysis="", care_suggestions=""):
-        """添加照片記錄"""
+    def add_photo(self, plant_id, photo_path, notes="", ai_analysis="", care_suggestions="",
+                  content_hash=None, original_hash=None):
+        """
+        添加照片記錄
+        
+        content_hash 為照片內容的 SHA-256，用於去重和引用計數；
+        original_hash 為上傳時被標準化的照片保存在冷存儲中的原始文件哈希。
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         now = datetime.now().isoformat()
+        analyzed_at = now if ai_analysis else None
         
         cursor.execute('''
-            INSERT INTO photos (plant_id, photo_path, taken_at, notes, ai_analysis, care_suggestions)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (plant_id, photo_path, now, notes, ai_analysis, care_suggestions))
+            INSERT INTO photos (plant_id, photo_path, taken_at, notes, ai_analysis, care_suggestions,
+                                analyzed_at, content_hash, original_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (plant_id, photo_path, now, notes, ai_analysis, care_suggestions, analyzed_at,
+              content_hash, original_hash))
         
-        conn.commit()
+        self._commit(conn)
+        self._notify('photo_added', photo_id=cursor.lastrowid, plant_id=plant_id)
         return cursor.lastrowid
     
+    def add_photos_many(self, photos):
+        """
+        在單個事務中批量添加照片記錄
+        
+        參數:
+            photos: 可迭代的字典，鍵與 add_photo 的參數相同
+                    （plant_id、photo_path 必填，可另帶 taken_at）
+            
+        返回:
+            int: 添加的記錄數
+        """
+        now = datetime.now().isoformat()
+        
+        def rows():
+            for photo in photos:
+                ai_analysis = photo.get('ai_analysis', "")
+                yield (
+                    photo['plant_id'],
+                    photo['photo_path'],
+                    photo.get('taken_at') or now,
+                    photo.get('notes', ""),
+                    ai_analysis,
+                    photo.get('care_suggestions', ""),
+                    photo.get('analyzed_at') or (now if ai_analysis else None),
+                    photo.get('content_hash'),
+                    photo.get('original_hash')
+                )
+        
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO photos (plant_id, photo_path, taken_at, notes, ai_analysis, care_suggestions,
+                                    analyzed_at, content_hash, original_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows())
+            self._notify('photos_added', count=cursor.rowcount)
+            return cursor.rowcount
+    
     def get_plant_photos(self, plant_id):
         """獲取植物的所有照片記錄"""
         conn = self.get_connection()
@@ -172,18 +997,121 @@ class PlantDatabase:
         ''', (plant_id,))
         return [dict(row) for row in cursor.fetchall()]
     
+    def iter_photos(self, plant_id=None, columns=None, batch_size=ITER_BATCH_SIZE):
+        """
+        按拍攝時間倒序逐條迭代照片記錄（順序與 get_plant_photos 相同）
+        
+        列表頁通常不需要 ai_analysis 這類長文本，指定 columns 後只讀取需要的欄位。
+        
+        參數:
+            plant_id: 植物 ID，None 表示所有植物的照片
+            columns: 要讀取的欄位（PHOTO_COLUMNS 的子集），None 表示全部欄位
+            batch_size: 每次從數據庫讀取的行數
+        
+        返回:
+            generator: PhotoRecord 記錄
+        """
+        columns = _select_columns(columns, PHOTO_COLUMNS)
+        sql = f'SELECT {", ".join(columns)} FROM photos'
+        params = ()
+        if plant_id is not None:
+            sql += ' WHERE plant_id = ?'
+            params = (plant_id,)
+        sql += ' ORDER BY taken_at DESC'
+        yield from self._iter_records('PhotoRecord', columns, sql, params, batch_size)
+    
+    def _iter_records(self, name, columns, sql, params, batch_size):
+        """執行查詢並按批產生 namedtuple 記錄（不經過 sqlite3.Row 和字典）"""
+        make = _record_type(name, columns)._make
+        cursor = self.get_connection().cursor()
+        cursor.row_factory = None
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from map(make, rows)
+        finally:
+            cursor.close()
+    
+    def get_plant_photos_page(self, plant_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        按拍攝時間倒序分頁獲取植物的照片記錄（keyset 分頁）
+        
+        參數:
+            plant_id: 植物 ID
+            limit: 每頁數量
+            cursor: 上一頁返回的游標，None 表示第一頁
+            
+        返回:
+            tuple: (照片字典列表, 下一頁游標或 None)
+        """
+        limit = _clamp_page_size(limit)
+        conn = self.get_connection()
+        db_cursor = conn.cursor()
+        
+        where = 'WHERE plant_id = ?'
+        params = [plant_id]
+        if cursor:
+            taken_at, photo_id = decode_page_cursor(cursor)
+            where += ' AND (taken_at, id) < (?, ?)'
+            params += [taken_at, photo_id]
+        
+        db_cursor.execute(f'''
+            SELECT * FROM photos
+            {where}
+            ORDER BY taken_at DESC, id DESC
+            LIMIT ?
+        ''', params + [limit + 1])
+        photos = [dict(row) for row in db_cursor.fetchall()]
+        
+        next_cursor = None
+        if len(photos) > limit:
+            photos = photos[:limit]
+            next_cursor = encode_page_cursor(photos[-1]['taken_at'], photos[-1]['id'])
+        return photos, next_cursor
+    
     def update_photo_analysis(self, photo_id, ai_analysis, care_suggestions):
         """更新照片的AI分析結果"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        now = datetime.now().isoformat()
+        
         cursor.execute('''
             UPDATE photos 
-            SET ai_analysis = ?, care_suggestions = ?
+            SET ai_analysis = ?, care_suggestions = ?, analyzed_at = ?
             WHERE id = ?
-        ''', (ai_analysis, care_suggestions, photo_id))
+        ''', (ai_analysis, care_suggestions, now, photo_id))
         
-        conn.commit()
+        self._commit(conn)
+        self._notify('photo_analysis_updated', photo_id=photo_id)
+    
+    def update_photo_analysis_many(self, results):
+        """
+        在單個事務中批量更新照片的AI分析結果
+        
+        參數:
+            results: 可迭代的 (photo_id, ai_analysis, care_suggestions) 元組
+            
+        返回:
+            int: 更新的記錄數
+        """
+        now = datetime.now().isoformat()
+        rows = [(ai_analysis, care_suggestions, now, photo_id)
+                for photo_id, ai_analysis, care_suggestions in results]
+        
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                UPDATE photos 
+                SET ai_analysis = ?, care_suggestions = ?, analyzed_at = ?
+                WHERE id = ?
+            ''', rows)
+            for row in rows:
+                self._notify('photo_analysis_updated', photo_id=row[3])
+            return cursor.rowcount
     
     def get_photo(self, photo_id):
         """獲取單張照片信息"""
@@ -194,12 +1122,341 @@ class PlantDatabase:
         return dict(row) if row else None
     
     def delete_photo(self, photo_id):
-        """刪除照片記錄"""
+        """
+        刪除照片記錄
+        
+        與 delete_plant 相同，照片文件只放入待刪除隊列，由孤兒文件清理確認沒有引用後再刪除。
+        """
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR IGNORE INTO file_deletions (path, queued_at)
+                SELECT photo_path, ? FROM photos WHERE id = ?
+            ''', (datetime.now().isoformat(), photo_id))
+            cursor.execute('DELETE FROM photos WHERE id = ?', (photo_id,))
+            if cursor.rowcount > 0:
+                self._notify('photo_deleted', photo_id=photo_id)
+            return cursor.rowcount > 0
+    
+    def delete_photos_many(self, photo_ids):
+        """
+        在單個事務中批量刪除照片記錄（照片文件放入待刪除隊列）
+        
+        返回:
+            int: 刪除的記錄數
+        """
+        photo_ids = list(photo_ids)
+        now = datetime.now().isoformat()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT OR IGNORE INTO file_deletions (path, queued_at)
+                SELECT photo_path, ? FROM photos WHERE id = ?
+            ''', ((now, photo_id) for photo_id in photo_ids))
+            cursor.executemany('DELETE FROM photos WHERE id = ?',
+                               ((photo_id,) for photo_id in photo_ids))
+            for photo_id in photo_ids:
+                self._notify('photo_deleted', photo_id=photo_id)
+            return cursor.rowcount
+    
+    def count_photo_refs(self, content_hash):
+        """返回引用某個照片內容的照片記錄數（引用計數）"""
+        conn = self.get_connection()
+        row = conn.execute('SELECT COUNT(*) FROM photos WHERE content_hash = ?',
+                           (content_hash,)).fetchone()
+        return row[0]
+    
+    def filter_referenced_paths(self, photo_paths):
+        """返回給定文件路徑中仍被照片記錄引用的那些（一次查詢）"""
+        photo_paths = list(photo_paths)
+        if not photo_paths:
+            return set()
+        conn = self.get_connection()
+        placeholders = ', '.join('?' * len(photo_paths))
+        cursor = conn.execute(f'SELECT DISTINCT photo_path FROM photos WHERE photo_path IN ({placeholders})',
+                              photo_paths)
+        return {row[0] for row in cursor.fetchall()}
+    
+    def filter_referenced_hashes(self, content_hashes, column='content_hash'):
+        """
+        返回給定哈希中仍被照片記錄引用的那些（一次查詢）
+        
+        參數:
+            content_hashes: 要檢查的哈希
+            column: content_hash（照片內容）或 original_hash（冷存儲中的原始文件）
+        """
+        if column not in ('content_hash', 'original_hash'):
+            raise ValueError(f"不支持的欄位：{column}")
+        content_hashes = list(content_hashes)
+        if not content_hashes:
+            return set()
+        conn = self.get_connection()
+        placeholders = ', '.join('?' * len(content_hashes))
+        cursor = conn.execute(f'SELECT DISTINCT {column} FROM photos WHERE {column} IN ({placeholders})',
+                              content_hashes)
+        return {row[0] for row in cursor.fetchall()}
+    
+    def get_file_references(self):
+        """
+        一次讀出所有照片記錄引用的文件，供孤兒文件清理用集合比對
+        
+        返回:
+            tuple: (photo_path 集合, content_hash 集合, original_hash 集合)
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM photos WHERE id = ?', (photo_id,))
-        conn.commit()
-        return cursor.rowcount > 0
+        cursor.row_factory = None
+        cursor.execute('SELECT photo_path, content_hash, original_hash FROM photos')
+        paths, hashes, originals = set(), set(), set()
+        while True:
+            rows = cursor.fetchmany(ITER_BATCH_SIZE)
+            if not rows:
+                break
+            for photo_path, content_hash, original_hash in rows:
+                paths.add(photo_path)
+                hashes.add(content_hash)
+                originals.add(original_hash)
+        hashes.discard(None)
+        originals.discard(None)
+        return paths, hashes, originals
+    
+    def get_file_deletions(self, limit=500):
+        """獲取待刪除隊列中的文件路徑（按加入順序）"""
+        conn = self.get_connection()
+        cursor = conn.execute('SELECT path FROM file_deletions ORDER BY queued_at, path LIMIT ?',
+                              (limit,))
+        return [row[0] for row in cursor.fetchall()]
+    
+    def remove_file_deletions(self, paths):
+        """從待刪除隊列移除已處理的文件路徑"""
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM file_deletions WHERE path = ?',
+                             ((path,) for path in paths))
+    
+    def find_analysis_by_hash(self, content_hash, plant_id=None, exclude_photo_id=None):
+        """
+        查找內容相同且 AI 分析成功的其他照片，用於重複上傳時直接沿用分析結果
+        
+        分析失敗的結果（見 ANALYSIS_FAILURE_PREFIXES）不會被沿用。
+        
+        參數:
+            content_hash: 照片內容的 SHA-256
+            plant_id: 優先使用同一植物的分析結果
+            exclude_photo_id: 不使用這張照片自己的結果
+            
+        返回:
+            dict: 包含 ai_analysis 和 care_suggestions；沒有時返回 None
+        """
+        if not content_hash:
+            return None
+        failures = ' '.join('AND ai_analysis NOT LIKE ?' for _ in ANALYSIS_FAILURE_PREFIXES)
+        conn = self.get_connection()
+        row = conn.execute(f'''
+            SELECT ai_analysis, care_suggestions FROM photos
+            WHERE content_hash = ? AND ai_analysis IS NOT NULL AND ai_analysis != ''
+              AND (? IS NULL OR id != ?) {failures}
+            ORDER BY plant_id = ? DESC, analyzed_at DESC
+            LIMIT 1
+        ''', (content_hash, exclude_photo_id, exclude_photo_id,
+              *(prefix + '%' for prefix in ANALYSIS_FAILURE_PREFIXES), plant_id)).fetchone()
+        return dict(row) if row else None
+    
+    def get_photos_without_hash(self, limit=200):
+        """獲取尚未遷移到內容地址存儲的照片（content_hash 為空）"""
+        conn = self.get_connection()
+        cursor = conn.execute('''
+            SELECT id, photo_path FROM photos WHERE content_hash IS NULL ORDER BY id LIMIT ?
+        ''', (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def set_photo_contents(self, updates):
+        """
+        在單個事務中批量改寫照片的文件路徑和內容哈希
+        
+        參數:
+            updates: 可迭代的 (photo_id, photo_path, content_hash) 元組
+        """
+        with self.transaction() as conn:
+            conn.executemany(
+                'UPDATE photos SET photo_path = ?, content_hash = ? WHERE id = ?',
+                ((photo_path, content_hash, photo_id) for photo_id, photo_path, content_hash in updates)
+            )
+    
+    def search(self, query, limit=20, offset=0):
+        """
+        全文搜索植物名稱、備註和照片的 AI 分析結果
+        
+        參數:
+            query: 搜索文字，多個詞以空白分隔（需全部匹配）
+            limit: 每頁數量（最多 MAX_PAGE_SIZE）
+            offset: 跳過的結果數（超過 MAX_SEARCH_OFFSET 時返回空列表）
+            
+        返回:
+            list: 按相關度排序的結果字典，包含
+                - type: 'plant' 或 'photo'
+                - plant_id, photo_id（植物結果為 None）
+                - chinese_name, scientific_name
+                - snippet: 匹配片段，匹配文字以【】標記
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        limit = _clamp_page_size(limit)
+        offset = max(0, int(offset))
+        if offset > MAX_SEARCH_OFFSET:
+            return []
+        
+        if self._has_fts() and all(len(term) >= FTS_MIN_TERM_LENGTH for term in terms):
+            return self._search_fts(terms, limit, offset)
+        return self._search_like(terms, limit, offset)
+    
+    def _has_fts(self):
+        """檢查全文檢索索引是否存在"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*) FROM sqlite_master
+            WHERE type = 'table' AND name IN ('plants_fts', 'photos_fts')
+        ''')
+        return cursor.fetchone()[0] == 2
+    
+    def _search_fts(self, terms, limit, offset):
+        """
+        使用 FTS5 索引搜索，按 bm25 相關度排序
+        
+        先只取出 rowid 和分數完成排序分頁，再為當前頁生成摘要，
+        避免為所有匹配行計算 snippet。
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        match = ' '.join(_fts_phrase(term) for term in terms)
+        wanted = offset + limit
+        
+        # (表名, 結果類型, bm25 欄位權重)；名稱欄位權重較高
+        sources = (
+            ('plants_fts', 'plant', '10.0, 10.0, 1.0'),
+            ('photos_fts', 'photo', '2.0, 1.0, 1.0'),
+        )
+        ranked = []
+        for order, (table, kind, weights) in enumerate(sources):
+            cursor.execute(f'''
+                SELECT COUNT(*) FROM (
+                    SELECT rowid FROM {table} WHERE {table} MATCH ? LIMIT ?
+                )
+            ''', (match, FTS_RANK_MAX_MATCHES + 1))
+            if cursor.fetchone()[0] > FTS_RANK_MAX_MATCHES:
+                # 匹配行太多時 bm25 幾乎沒有區分度，改為按時間倒序以保持毫秒級響應
+                cursor.execute(f'''
+                    SELECT rowid, 0.0 FROM {table} WHERE {table} MATCH ?
+                    ORDER BY rowid DESC LIMIT ?
+                ''', (match, wanted))
+            else:
+                cursor.execute(f'''
+                    SELECT rowid, bm25({table}, {weights}) AS score
+                    FROM {table} WHERE {table} MATCH ?
+                    ORDER BY score LIMIT ?
+                ''', (match, wanted))
+            ranked.extend((score, order, kind, rowid) for rowid, score in cursor.fetchall())
+        
+        # bm25 分數越小越相關
+        ranked.sort(key=lambda item: (item[0], item[1]))
+        page = ranked[offset:wanted]
+        
+        details = {}
+        mark = (SNIPPET_MARK_OPEN, SNIPPET_MARK_CLOSE)
+        plant_ids = [rowid for _, _, kind, rowid in page if kind == 'plant']
+        photo_ids = [rowid for _, _, kind, rowid in page if kind == 'photo']
+        if plant_ids:
+            cursor.execute(f'''
+                SELECT p.id, p.id AS plant_id, NULL AS photo_id,
+                       p.chinese_name, p.scientific_name,
+                       snippet(plants_fts, -1, ?, ?, '…', 16) AS snippet
+                FROM plants_fts
+                JOIN plants p ON p.id = plants_fts.rowid
+                WHERE plants_fts MATCH ?
+                  AND plants_fts.rowid IN ({','.join('?' * len(plant_ids))})
+            ''', (*mark, match, *plant_ids))
+            details.update((('plant', row['id']), row) for row in cursor.fetchall())
+        if photo_ids:
+            cursor.execute(f'''
+                SELECT ph.id, ph.plant_id, ph.id AS photo_id,
+                       p.chinese_name, p.scientific_name,
+                       snippet(photos_fts, -1, ?, ?, '…', 16) AS snippet
+                FROM photos_fts
+                JOIN photos ph ON ph.id = photos_fts.rowid
+                JOIN plants p ON p.id = ph.plant_id
+                WHERE photos_fts MATCH ?
+                  AND photos_fts.rowid IN ({','.join('?' * len(photo_ids))})
+            ''', (*mark, match, *photo_ids))
+            details.update((('photo', row['id']), row) for row in cursor.fetchall())
+        
+        results = []
+        for score, _, kind, rowid in page:
+            row = details.get((kind, rowid))
+            if row is None:
+                continue  # 照片所屬植物已被刪除
+            results.append({
+                'type': kind,
+                'plant_id': row['plant_id'],
+                'photo_id': row['photo_id'],
+                'chinese_name': row['chinese_name'],
+                'scientific_name': row['scientific_name'],
+                'snippet': row['snippet'],
+                'score': score
+            })
+        return results
+    
+    def _search_like(self, terms, limit, offset):
+        """
+        使用 LIKE 搜索（詞太短無法使用 trigram 索引，或 FTS5 不可用時）
+        
+        植物結果排在照片結果之前；照片按 id 倒序掃描，湊滿一頁即停止。
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        wanted = offset + limit
+        
+        plant_cond = ' AND '.join(
+            "(p.chinese_name LIKE ? ESCAPE '\\' OR p.scientific_name LIKE ? ESCAPE '\\'"
+            " OR p.notes LIKE ? ESCAPE '\\')" for _ in terms)
+        photo_cond = ' AND '.join(
+            "(ph.notes LIKE ? ESCAPE '\\' OR ph.ai_analysis LIKE ? ESCAPE '\\'"
+            " OR ph.care_suggestions LIKE ? ESCAPE '\\')" for _ in terms)
+        patterns = [_like_pattern(term) for term in terms for _ in range(3)]
+        
+        cursor.execute(f'''
+            SELECT 'plant' AS type, p.id AS plant_id, NULL AS photo_id,
+                   p.chinese_name, p.scientific_name,
+                   p.chinese_name || ' ' || COALESCE(p.scientific_name, '')
+                       || ' ' || COALESCE(p.notes, '') AS text
+            FROM plants p
+            WHERE {plant_cond}
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT ?
+        ''', (*patterns, wanted))
+        rows = cursor.fetchall()
+        
+        if len(rows) < wanted:
+            cursor.execute(f'''
+                SELECT 'photo' AS type, ph.plant_id, ph.id AS photo_id,
+                       p.chinese_name, p.scientific_name,
+                       COALESCE(ph.notes, '') || ' ' || COALESCE(ph.ai_analysis, '')
+                           || ' ' || COALESCE(ph.care_suggestions, '') AS text
+                FROM photos ph
+                JOIN plants p ON p.id = ph.plant_id
+                WHERE {photo_cond}
+                ORDER BY ph.id DESC
+                LIMIT ?
+            ''', (*patterns, wanted - len(rows)))
+            rows += cursor.fetchall()
+        
+        results = []
+        for row in rows[offset:wanted]:
+            result = dict(row)
+            result['snippet'] = _make_snippet(result.pop('text').strip(), terms)
+            result['score'] = 0.0
+            results.append(result)
+        return results
     
     def _hash_password(self, password):
         """對密碼進行哈希處理"""
@@ -242,7 +1499,7 @@ class PlantDatabase:
                 INSERT INTO users (username, password_hash, is_admin, created_at)
                 VALUES (?, ?, ?, ?)
             ''', (username, password_hash, 0, now))
-            conn.commit()
+            self._commit(conn)
             return cursor.lastrowid, None
         except sqlite3.IntegrityError:
             return None, "用戶名已存在"
@@ -269,23 +1526,358 @@ class PlantDatabase:
     
     def get_user(self, user_id):
         """獲取用戶信息"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, username, is_admin FROM users WHERE id = ?', (user_id,))
-        row = cursor.fetchone()
-        if row:
-            return {
-                'id': row[0],
-                'username': row[1],
-                'is_admin': bool(row[2])
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, username, is_admin FROM users WHERE id = ?', (user_id,))
+            row = cursor.fetchone()
+            if row:
+                return {
+                    'id': row[0],
+                    'username': row[1],
+                    'is_admin': bool(row[2])
+                }
+            return None
+        return self._cached(('user', user_id), load)
+    
+    def export_ndjson(self, fp, on_photo=None, batch_size=IMPORT_BATCH_SIZE):
+        """
+        以 NDJSON 格式流式導出整個日記（每行一條記錄）
+        
+        第一行是 header 記錄，之後依次為 user、plant、photo 記錄。照片記錄額外帶有
+        file 欄位（照片文件名）。導出在獨立的讀事務中進行，得到一致的快照，
+        並逐批讀取，內存佔用與數據量無關。
+        
+        參數:
+            fp: 以二進制模式打開的可寫文件對象
+            on_photo: 可選回調，每導出一條照片記錄調用一次（用於打包照片文件）
+            batch_size: 每次從數據庫讀取的行數
+            
+        返回:
+            dict: 各類記錄的導出數量
+        """
+        conn = self._connect()
+        counts = {}
+        try:
+            conn.execute('BEGIN')
+            header = {
+                'type': 'header',
+                'format': 'plant_diary',
+                'version': EXPORT_FORMAT_VERSION,
+                'schema_version': self.get_schema_version(),
+                'exported_at': datetime.now().isoformat()
             }
-        return None
+            fp.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+            
+            for kind, table in EXPORT_TABLES:
+                counts[kind] = 0
+                cursor = conn.execute(f'SELECT * FROM {table} ORDER BY id')
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        record = {'type': kind, **dict(row)}
+                        if kind == 'photo':
+                            record['file'] = Path(record['photo_path']).name
+                            if on_photo is not None:
+                                on_photo(record)
+                        fp.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+                        counts[kind] += 1
+            conn.rollback()
+        finally:
+            conn.close()
+        return counts
+    
+    def import_ndjson(self, fp, photos_dir=None, batch_size=IMPORT_BATCH_SIZE, mode=None):
+        """
+        從 export_ndjson 產生的文件流式導入日記，可中斷後續傳
+        
+        記錄保留原來的 id，每 batch_size 條記錄在一個事務中寫入，
+        並在同一事務中記錄已處理到的文件偏移量。再次導入同一文件時從上次提交的
+        位置繼續；已完成的文件不會重複導入。
+        
+        目標數據庫已有植物或照片時必須指定 mode，以免靜默覆蓋現有記錄：
+        merge 按 id 合併（id 已存在時以導入文件為準就地更新，全文索引觸發器同步更新索引）；
+        replace 先刪除現有的用戶、植物和照片記錄再導入（不再被引用的照片文件由孤兒文件清理刪除）。
+        用戶名已被另一個 id 的帳號使用時保留現有帳號，跳過導入文件中的該用戶。
+        
+        參數:
+            fp: 以二進制模式打開、可 seek 的文件對象
+            photos_dir: 照片所在目錄；提供時照片路徑改寫為 photos_dir/file
+            batch_size: 每個事務寫入的記錄數
+            mode: None、'merge' 或 'replace'
+            
+        返回:
+            dict: 各類記錄本次導入的數量、resumed（是否為續傳）
+                  以及 skipped_users（因用戶名衝突而跳過的用戶名列表）
+            
+        異常:
+            ValueError: 文件格式不對、mode 無效，或目標數據庫非空且未指定 mode
+        """
+        if mode is not None and mode not in IMPORT_MODES:
+            raise ValueError(f"無效的導入模式：{mode}")
+        
+        header_line = fp.readline()
+        try:
+            header = json.loads(header_line)
+        except ValueError:
+            header = None
+        if not header or header.get('type') != 'header' or header.get('format') != 'plant_diary':
+            raise ValueError("不是植物日記導出文件")
+        if header.get('version', 0) > EXPORT_FORMAT_VERSION:
+            raise ValueError("導出文件版本過新，請升級植物日記")
+        
+        source_id = hashlib.sha256(header_line).hexdigest()
+        conn = self.get_connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS import_progress (
+                source_id TEXT PRIMARY KEY,
+                file_offset INTEGER NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL
+            )
+        ''')
+        conn.commit()
+        
+        counts = {kind: 0 for kind, _ in EXPORT_TABLES}
+        counts['skipped_users'] = []
+        row = conn.execute('SELECT file_offset, done FROM import_progress WHERE source_id = ?',
+                           (source_id,)).fetchone()
+        counts['resumed'] = row is not None
+        if row is not None:
+            if row['done']:
+                return counts
+            fp.seek(row['file_offset'])
+        elif mode == 'replace':
+            # 清空與記錄進度放在同一事務中，中斷後續傳不會再次清空已導入的記錄
+            with self.transaction():
+                for _, table in reversed(EXPORT_TABLES):
+                    conn.execute(f'DELETE FROM {table}')
+                conn.execute('''
+                    INSERT INTO import_progress (source_id, file_offset, done, updated_at)
+                    VALUES (?, ?, 0, ?)
+                ''', (source_id, fp.tell(), datetime.now().isoformat()))
+        elif mode is None:
+            # 新數據庫只有初始化時建立的管理員帳號，因此只檢查植物和照片
+            has_records = conn.execute(
+                'SELECT EXISTS (SELECT 1 FROM plants) OR EXISTS (SELECT 1 FROM photos)'
+            ).fetchone()[0]
+            if has_records:
+                raise ValueError("目標數據庫已有植物或照片記錄，請指定合併（merge）或替換（replace）")
+        
+        columns = {
+            kind: [r[1] for r in conn.execute(f'PRAGMA table_info({table})')]
+            for kind, table in EXPORT_TABLES
+        }
+        
+        def flush(batch, offset, done=False):
+            with self.transaction():
+                for kind, table in EXPORT_TABLES:
+                    records = batch[kind]
+                    if not records:
+                        continue
+                    cols = columns[kind]
+                    # 不用 INSERT OR REPLACE：REPLACE 刪除舊行時不觸發刪除觸發器，
+                    # 全文索引（外部內容 FTS5 表）會與數據表不一致
+                    updates = ", ".join(f"{col} = excluded.{col}" for col in cols if col != 'id')
+                    sql = (f'INSERT INTO {table} ({", ".join(cols)}) '
+                           f'VALUES ({", ".join("?" * len(cols))}) '
+                           f'ON CONFLICT (id) DO UPDATE SET {updates}')
+                    if kind == 'user':
+                        # 用戶名唯一：已屬於另一個 id 的帳號時保留現有帳號，
+                        # 否則寫入會因 UNIQUE 約束失敗。用戶很少，逐條檢查和寫入
+                        for record in records:
+                            existing = conn.execute('SELECT id FROM users WHERE username = ?',
+                                                    (record.get('username'),)).fetchone()
+                            if existing is not None and existing['id'] != record.get('id'):
+                                counts['skipped_users'].append(record.get('username'))
+                                continue
+                            conn.execute(sql, [record.get(col) for col in cols])
+                            counts[kind] += 1
+                    else:
+                        conn.executemany(sql, ([record.get(col) for col in cols] for record in records))
+                        counts[kind] += len(records)
+                    records.clear()
+                conn.execute('''
+                    INSERT OR REPLACE INTO import_progress (source_id, file_offset, done, updated_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (source_id, offset, int(done), datetime.now().isoformat()))
+        
+        batch = {kind: [] for kind, _ in EXPORT_TABLES}
+        pending = 0
+        while True:
+            line = fp.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.get('type')
+            if kind not in batch:
+                continue
+            if kind == 'photo' and photos_dir is not None and record.get('file'):
+                record['photo_path'] = str(Path(photos_dir) / record['file'])
+            batch[kind].append(record)
+            pending += 1
+            if pending >= batch_size:
+                flush(batch, fp.tell())
+                pending = 0
+        flush(batch, fp.tell(), done=True)
+        return counts
     
     def close(self):
         """關閉數據庫連接"""
+        self._invalidate_cache()
         if self.conn:
             self.conn.close()
             self.conn = None
+        with self._pool_lock:
+            for conn in self._pool.values():
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._pool.clear()
+        self._local = threading.local()
+
+
+def _add_column_if_missing(cursor, table, column, definition):
+    """如果表中不存在該欄位則添加"""
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _migration_1_hot_query_indexes(cursor):
+    """補充 AI 分析時間欄位，並為常用查詢建立索引"""
+    _add_column_if_missing(cursor, 'photos', 'analyzed_at', 'TEXT')
+    # get_plant_photos / delete_plant / 照片統計：按植物篩選並按拍攝時間排序
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_photos_plant_taken
+        ON photos (plant_id, taken_at)
+    ''')
+    # get_all_plants：按建立時間排序
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_plants_created
+        ON plants (created_at)
+    ''')
+
+
+def _migration_2_full_text_search(cursor):
+    """
+    建立植物和照片的全文檢索索引
+    
+    SQLite 未編譯 FTS5 或版本過舊（trigram 需要 3.34+）時撤銷已建立的部分，
+    版本號照常記錄以免阻擋之後的遷移；索引由 PlantDatabase.ensure_full_text_search
+    在啟動時補建，並在仍不可用時發出警告。
+    """
+    cursor.execute('SAVEPOINT full_text_search')
+    try:
+        _create_full_text_search(cursor)
+    except sqlite3.OperationalError:
+        cursor.execute('ROLLBACK TO full_text_search')
+    cursor.execute('RELEASE full_text_search')
+
+
+def _create_full_text_search(cursor):
+    """建立植物和照片的全文檢索索引（trigram 分詞以支持中文），並用觸發器保持同步"""
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS plants_fts USING fts5(
+            chinese_name, scientific_name, notes,
+            content='plants', content_rowid='id', tokenize='trigram'
+        )
+    ''')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS photos_fts USING fts5(
+            notes, ai_analysis, care_suggestions,
+            content='photos', content_rowid='id', tokenize='trigram'
+        )
+    ''')
+    
+    for statement in (
+        '''
+        CREATE TRIGGER IF NOT EXISTS plants_fts_insert AFTER INSERT ON plants BEGIN
+            INSERT INTO plants_fts (rowid, chinese_name, scientific_name, notes)
+            VALUES (new.id, new.chinese_name, new.scientific_name, new.notes);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS plants_fts_delete AFTER DELETE ON plants BEGIN
+            INSERT INTO plants_fts (plants_fts, rowid, chinese_name, scientific_name, notes)
+            VALUES ('delete', old.id, old.chinese_name, old.scientific_name, old.notes);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS plants_fts_update
+        AFTER UPDATE OF chinese_name, scientific_name, notes ON plants BEGIN
+            INSERT INTO plants_fts (plants_fts, rowid, chinese_name, scientific_name, notes)
+            VALUES ('delete', old.id, old.chinese_name, old.scientific_name, old.notes);
+            INSERT INTO plants_fts (rowid, chinese_name, scientific_name, notes)
+            VALUES (new.id, new.chinese_name, new.scientific_name, new.notes);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS photos_fts_insert AFTER INSERT ON photos BEGIN
+            INSERT INTO photos_fts (rowid, notes, ai_analysis, care_suggestions)
+            VALUES (new.id, new.notes, new.ai_analysis, new.care_suggestions);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS photos_fts_delete AFTER DELETE ON photos BEGIN
+            INSERT INTO photos_fts (photos_fts, rowid, notes, ai_analysis, care_suggestions)
+            VALUES ('delete', old.id, old.notes, old.ai_analysis, old.care_suggestions);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS photos_fts_update
+        AFTER UPDATE OF notes, ai_analysis, care_suggestions ON photos BEGIN
+            INSERT INTO photos_fts (photos_fts, rowid, notes, ai_analysis, care_suggestions)
+            VALUES ('delete', old.id, old.notes, old.ai_analysis, old.care_suggestions);
+            INSERT INTO photos_fts (rowid, notes, ai_analysis, care_suggestions)
+            VALUES (new.id, new.notes, new.ai_analysis, new.care_suggestions);
+        END
+        ''',
+    ):
+        cursor.execute(statement)
+    
+    # 為已有數據建立索引
+    cursor.execute("INSERT INTO plants_fts (plants_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO photos_fts (photos_fts) VALUES ('rebuild')")
+
+
+def _migration_3_content_hash(cursor):
+    """照片內容哈希欄位，用於內容地址存儲的去重和引用計數"""
+    _add_column_if_missing(cursor, 'photos', 'content_hash', 'TEXT')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_photos_content_hash
+        ON photos (content_hash)
+    ''')
+
+
+def _migration_4_original_hash(cursor):
+    """上傳時被標準化的照片，記錄冷存儲中原始文件的哈希"""
+    _add_column_if_missing(cursor, 'photos', 'original_hash', 'TEXT')
+
+
+def _migration_5_file_deletions(cursor):
+    """刪除植物後等待清理的照片文件隊列"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_deletions (
+            path TEXT PRIMARY KEY,
+            queued_at TIMESTAMP NOT NULL
+        )
+    ''')
+
+
+# 數據庫結構遷移：(版本號, 說明, 遷移函數)，版本號必須遞增
+MIGRATIONS = [
+    (1, '常用查詢索引與 AI 分析時間欄位', _migration_1_hot_query_indexes),
+    (2, '植物和照片全文檢索', _migration_2_full_text_search),
+    (3, '照片內容哈希', _migration_3_content_hash),
+    (4, '照片原始文件哈希', _migration_4_original_hash),
+    (5, '待刪除照片文件隊列', _migration_5_file_deletions),
+]
 
 
 # 全局數據庫實例
@@ -296,6 +1888,14 @@ def get_db():
     """獲取全局數據庫實例"""
     global _db_instance
     if _db_instance is None:
-        _db_instance = PlantDatabase()
+        # 默認啟用連接池模式，可通過 PLANT_DIARY_DB_POOL=0 關閉
+        pooled = os.getenv('PLANT_DIARY_DB_POOL', '1') != '0'
+        # 設置 PLANT_DIARY_QUERY_STATS=1 啟用 SQL 耗時統計
+        query_stats = None
+        if os.getenv('PLANT_DIARY_QUERY_STATS', '0') == '1':
+            query_stats = QueryStats(
+                slow_threshold_ms=float(os.getenv('PLANT_DIARY_SLOW_QUERY_MS', '100'))
+            )
+        _db_instance = PlantDatabase(pooled=pooled, query_stats=query_stats)
     return _db_instance
 
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+植物日記 - 照片標準化模組
+上傳時按 EXIF 方向旋轉照片、限制最大解析度並重新編碼為較省空間的格式
+
+可通過環境變數配置:
+    PLANT_DIARY_NORMALIZE=0          關閉標準化，照片按原樣保存
+    PLANT_DIARY_MAX_DIMENSION=2560   照片最長邊（像素）
+    PLANT_DIARY_IMAGE_FORMAT=webp    重新編碼的格式（webp 或 jpg）
+    PLANT_DIARY_IMAGE_QUALITY=82     編碼質量（1-95）
+    PLANT_DIARY_KEEP_ORIGINALS=1     另外保留原始文件（冷存儲）
+"""
+
+import os
+import uuid
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+
+DEFAULT_MAX_DIMENSION = 2560
+DEFAULT_QUALITY = 82
+
+# 擴展名 -> (Pillow 格式, 額外的保存參數)
+OUTPUT_FORMATS = {
+    'webp': ('WEBP', {'method': 4}),
+    'jpg': ('JPEG', {'optimize': True, 'progressive': True}),
+}
+
+# EXIF 中的方向標籤
+_ORIENTATION_TAG = 0x0112
+
+
+class ImageNormalizer:
+    """上傳照片的標準化處理"""
+    
+    def __init__(self, max_dimension=DEFAULT_MAX_DIMENSION, output_format='webp', quality=DEFAULT_QUALITY):
+        """
+        參數:
+            max_dimension: 照片最長邊（像素），超過時等比縮小
+            output_format: 重新編碼的格式（OUTPUT_FORMATS 的鍵）
+            quality: 編碼質量
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"不支持的圖片格式：{output_format}")
+        self.max_dimension = max_dimension
+        self.output_format = output_format
+        self.quality = quality
+    
+    def normalize(self, source_path, target_dir):
+        """
+        標準化一張照片
+        
+        參數:
+            source_path: 原始文件路徑
+            target_dir: 輸出臨時文件的目錄
+        
+        返回:
+            tuple: (標準化後的臨時文件路徑, 擴展名)；不是可處理的圖片，
+                   或重新編碼既不需要也不能節省空間時返回 (None, None)，應保存原始文件
+        """
+        target = None
+        try:
+            with Image.open(source_path) as img:
+                # 動圖重新編碼會丟失幀，保留原樣
+                if getattr(img, 'n_frames', 1) > 1:
+                    return None, None
+                
+                orientation = img.getexif().get(_ORIENTATION_TAG, 1)
+                resize = max(img.size) > self.max_dimension
+                if resize:
+                    # JPEG 以縮小比例直接解碼，比解碼全圖再縮放快很多
+                    img.draft('RGB', (self.max_dimension, self.max_dimension))
+                icc_profile = img.info.get('icc_profile')
+                
+                out = ImageOps.exif_transpose(img)
+                if out.mode not in ('RGB', 'RGBA'):
+                    has_alpha = out.mode in ('LA', 'PA') or 'transparency' in out.info
+                    out = out.convert('RGBA' if has_alpha else 'RGB')
+                if self.output_format == 'jpg' and out.mode == 'RGBA':
+                    background = Image.new('RGB', out.size, (255, 255, 255))
+                    background.paste(out, mask=out.getchannel('A'))
+                    out = background
+                if max(out.size) > self.max_dimension:
+                    out.thumbnail((self.max_dimension, self.max_dimension), Image.Resampling.LANCZOS)
+                
+                pil_format, options = OUTPUT_FORMATS[self.output_format]
+                if icc_profile:
+                    options = {**options, 'icc_profile': icc_profile}
+                Path(target_dir).mkdir(parents=True, exist_ok=True)
+                target = Path(target_dir) / f"{uuid.uuid4().hex}.{self.output_format}"
+                out.save(target, pil_format, quality=self.quality, **options)
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+            # 截斷或損壞的圖片可能到解碼、旋轉或保存時才出錯，改為保存原始文件
+            if target is not None:
+                target.unlink(missing_ok=True)
+            return None, None
+        
+        # 方向或尺寸需要修正時總是使用新文件；否則只有更小時才使用
+        if orientation == 1 and not resize and target.stat().st_size >= Path(source_path).stat().st_size:
+            target.unlink()
+            return None, None
+        return target, self.output_format
+
+
+def store_photo(photo_store, source_path, filename, normalizer=None, originals_store=None,
+                source_hash=None):
+    """
+    標準化並保存一張上傳的照片
+    
+    參數:
+        photo_store: 保存照片的 PhotoStore
+        source_path: 上傳的臨時文件（處理完成後會被移走或刪除）
+        filename: 原文件名（用於取擴展名）
+        normalizer: ImageNormalizer，None 表示不做標準化
+        originals_store: 可選，保存原始文件的 PhotoStore（冷存儲）
+        source_hash: 已知的原始文件 SHA-256（上傳時邊寫邊算），避免再讀一遍文件
+    
+    返回:
+        dict: content_hash、path、is_new、original_hash（未保留原始文件時為 None），
+              以及 original_bytes、stored_bytes、saved_bytes
+    """
+    source_path = Path(source_path)
+    original_bytes = source_path.stat().st_size
+    normalized_path = None
+    if normalizer is not None:
+        normalized_path, _ = normalizer.normalize(source_path, photo_store.tmp_dir)
+    
+    original_hash = None
+    if normalized_path is None:
+        content_hash, path, is_new = photo_store.put_file(
+            source_path, move=True, filename=filename, content_hash=source_hash)
+    else:
+        content_hash, path, is_new = photo_store.put_file(normalized_path, move=True)
+        if originals_store is not None:
+            original_hash, _, _ = originals_store.put_file(
+                source_path, move=True, filename=filename, content_hash=source_hash)
+        else:
+            source_path.unlink()
+    
+    stored_bytes = path.stat().st_size
+    return {
+        'content_hash': content_hash,
+        'path': path,
+        'is_new': is_new,
+        'original_hash': original_hash,
+        'original_bytes': original_bytes,
+        'stored_bytes': stored_bytes,
+        'saved_bytes': original_bytes - stored_bytes
+    }
+
+
+def get_normalizer():
+    """按環境變數創建 ImageNormalizer；PLANT_DIARY_NORMALIZE=0 時返回 None"""
+    if os.getenv('PLANT_DIARY_NORMALIZE', '1') == '0':
+        return None
+    return ImageNormalizer(
+        max_dimension=int(os.getenv('PLANT_DIARY_MAX_DIMENSION', DEFAULT_MAX_DIMENSION)),
+        output_format=os.getenv('PLANT_DIARY_IMAGE_FORMAT', 'webp').lower().replace('jpeg', 'jpg'),
+        quality=int(os.getenv('PLANT_DIARY_IMAGE_QUALITY', DEFAULT_QUALITY))
+    )
+
+
+def keep_originals():
+    """是否另外保留原始文件（PLANT_DIARY_KEEP_ORIGINALS=1）"""
+    return os.getenv('PLANT_DIARY_KEEP_ORIGINALS', '0') == '1'
@@ -7,10 +7,13 @@
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-from PIL import Image, ImageTk
+from PIL import Image, ImageOps, ImageTk
 import os
-import shutil
-from datetime import datetime
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # 處理導入路徑問題
@@ -22,12 +25,24 @@ try:
     from plant_diary.database import get_db
     from plant_diary.ai_analyzer import get_analyzer
     from plant_diary.ocr_reader import get_ocr_reader
+    from plant_diary.photo_store import PhotoStore
+    from plant_diary.image_normalizer import get_normalizer, keep_originals, store_photo
+    from plant_diary.orphan_gc import OrphanCollector
+    from plant_diary.pack_store import PackStore, PACK_DIR_NAME, open_photo
+    from plant_diary.plant_index import PlantIndex, diff_rows
+    from plant_diary.thumbnails import ThumbnailStore
 except ImportError:
     try:
         # 如果從 plant_diary 目錄內運行，使用直接導入
         from database import get_db
         from ai_analyzer import get_analyzer
         from ocr_reader import get_ocr_reader
+        from photo_store import PhotoStore
+        from image_normalizer import get_normalizer, keep_originals, store_photo
+        from orphan_gc import OrphanCollector
+        from pack_store import PackStore, PACK_DIR_NAME, open_photo
+        from plant_index import PlantIndex, diff_rows
+        from thumbnails import ThumbnailStore
     except ImportError:
         # 最後嘗試：將當前目錄添加到路徑
         current_dir = Path(__file__).parent
@@ -36,6 +51,321 @@ except ImportError:
         from database import get_db
         from ai_analyzer import get_analyzer
         from ocr_reader import get_ocr_reader
+        from photo_store import PhotoStore
+        from image_normalizer import get_normalizer, keep_originals, store_photo
+        from orphan_gc import OrphanCollector
+        from pack_store import PackStore, PACK_DIR_NAME, open_photo
+        from plant_index import PlantIndex, diff_rows
+        from thumbnails import ThumbnailStore
+
+
+# 同時進行的 AI 分析數量，可通過環境變數 PLANT_DIARY_ANALYSIS_WORKERS 配置
+ANALYSIS_WORKERS = max(1, int(os.getenv('PLANT_DIARY_ANALYSIS_WORKERS', 2)))
+# 界面檢查分析結果的間隔（毫秒）
+ANALYSIS_POLL_MS = 200
+# 從照片識別植物信息的超時時間（秒），包括第一次識別時載入 OCR 模型
+OCR_TIMEOUT_SECONDS = int(os.getenv('PLANT_DIARY_OCR_TIMEOUT', 120))
+
+
+class BackgroundCall:
+    """
+    在後台線程執行一次耗時調用，完成後在界面線程中回調 on_done(結果, 異常)
+    
+    結果通過線程安全的隊列交回，由界面線程定時檢查，後台線程不會直接操作 Tk 控件。
+    取消或超時後不再等待結果（正在執行的調用無法中斷，完成後結果被丟棄）；
+    widget 被關閉時自動取消。
+    """
+    
+    def __init__(self, widget, func, on_done, timeout=None, poll_ms=100):
+        """
+        參數:
+            widget: 用於定時檢查的 Tk 控件（通常是對話框）
+            func: 在後台執行的無參數函數
+            on_done: 完成、出錯或超時時在界面線程中調用，參數為 (結果, 異常)；取消時不調用
+            timeout: 超時秒數，None 表示不限時；超時時異常為 TimeoutError
+            poll_ms: 檢查結果的間隔（毫秒）
+        """
+        self.widget = widget
+        self.on_done = on_done
+        self.timeout = timeout
+        self.poll_ms = poll_ms
+        self.cancelled = False
+        self.started = time.monotonic()
+        self._result = queue.Queue(maxsize=1)
+        threading.Thread(target=self._run, args=(func,), daemon=True).start()
+        widget.after(poll_ms, self._poll)
+    
+    def _run(self, func):
+        try:
+            self._result.put((func(), None))
+        except Exception as e:
+            self._result.put((None, e))
+    
+    @property
+    def elapsed(self):
+        """已經過的秒數"""
+        return time.monotonic() - self.started
+    
+    def _poll(self):
+        if self.cancelled:
+            return
+        try:
+            if not self.widget.winfo_exists():
+                self.cancelled = True
+                return
+        except tk.TclError:
+            self.cancelled = True
+            return
+        try:
+            value, error = self._result.get_nowait()
+        except queue.Empty:
+            if self.timeout is not None and self.elapsed > self.timeout:
+                self.cancelled = True
+                self.on_done(None, TimeoutError(f"超過 {self.timeout} 秒未完成"))
+            else:
+                self.widget.after(self.poll_ms, self._poll)
+            return
+        self.cancelled = True
+        self.on_done(value, error)
+    
+    def cancel(self):
+        """取消等待（不會調用 on_done）"""
+        self.cancelled = True
+
+
+class AnalysisQueue:
+    """
+    在後台線程中執行 AI 分析
+    
+    分析請求放入任務隊列，由固定數量的工作線程依次處理；完成的結果放入線程安全的
+    結果隊列，由界面線程通過 poll() 定時取出。Tk 控件只能在界面線程中操作，
+    工作線程不會直接更新界面。
+    """
+    
+    def __init__(self, analyzer, db, max_workers=ANALYSIS_WORKERS, pack_store=None):
+        """
+        參數:
+            analyzer: PlantAnalyzer 實例
+            db: PlantDatabase 實例（分析結果由工作線程直接寫入）
+            max_workers: 同時進行的分析數量
+            pack_store: 可選，照片的 PackStore（已打包的照片從 pack 中讀取）
+        """
+        self.analyzer = analyzer
+        self.db = db
+        self.pack_store = pack_store
+        self.max_workers = max_workers
+        self._tasks = queue.Queue()
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._running = 0
+        self._pending = set()  # 已提交、尚未取回結果的照片 ID
+        # 本輪（從空閒到全部完成）的統計，用於顯示進度
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+    
+    def submit(self, photo_id, image_path, chinese_name=None, scientific_name=None):
+        """提交一張照片的分析（在界面線程中調用）"""
+        if not self._pending:
+            self.submitted = self.completed = self.failed = 0
+        self._pending.add(photo_id)
+        self.submitted += 1
+        self._tasks.put((photo_id, image_path, chinese_name, scientific_name))
+        # 按需啟動工作線程，不超過並發上限
+        if len(self._workers) < min(self.max_workers, len(self._pending)):
+            worker = threading.Thread(target=self._work, name=f"analysis-{len(self._workers) + 1}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+    
+    def _work(self):
+        """工作線程：取出任務、分析並保存結果"""
+        while True:
+            photo_id, image_path, chinese_name, scientific_name = self._tasks.get()
+            with self._lock:
+                self._running += 1
+            try:
+                # 照片文件不存在時拋出 FileNotFoundError，計為分析失敗，不寫入結果
+                with open_photo(image_path, self.pack_store) as image:
+                    result = self.analyzer.analyze_plant_photo(
+                        image,
+                        chinese_name=chinese_name,
+                        scientific_name=scientific_name,
+                        filename=image_path
+                    )
+                self.db.update_photo_analysis(
+                    photo_id=photo_id,
+                    ai_analysis=result['ai_analysis'],
+                    care_suggestions=result['care_suggestions']
+                )
+                self._results.put((photo_id, None))
+            except Exception as e:
+                self._results.put((photo_id, str(e)))
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._tasks.task_done()
+    
+    def poll(self):
+        """
+        取出已完成的分析（在界面線程中調用，不會阻塞）
+        
+        返回:
+            list: [(照片 ID, 錯誤信息或 None), ...]
+        """
+        finished = []
+        while True:
+            try:
+                photo_id, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending.discard(photo_id)
+            if error:
+                self.failed += 1
+            else:
+                self.completed += 1
+            finished.append((photo_id, error))
+        return finished
+    
+    def is_pending(self, photo_id):
+        """照片是否正在分析或排隊中"""
+        return photo_id in self._pending
+    
+    def status(self):
+        """返回 (正在分析數, 排隊數)"""
+        with self._lock:
+            running = self._running
+        return running, self._tasks.qsize()
+    
+    @property
+    def busy(self):
+        return bool(self._pending)
+
+
+# 照片時間線每行的高度（像素）和縮略圖尺寸（ThumbnailStore 的尺寸之一）
+TIMELINE_ROW_HEIGHT = 240
+TIMELINE_THUMB_SIZE = 200
+# 可見範圍上下多建立的行數，滾動時不會先看到空白
+TIMELINE_OVERSCAN = 2
+# 內存中保留的已解碼縮略圖數量
+THUMB_CACHE_SIZE = 256
+# 解碼縮略圖的後台線程數
+THUMB_WORKERS = 2
+# 界面取回已解碼縮略圖的間隔（毫秒）
+THUMB_POLL_MS = 50
+
+
+class ThumbnailLoader:
+    """
+    在後台線程解碼照片時間線的縮略圖
+    
+    縮略圖先從磁盤緩存（plant_thumbs，與 Web 版共用）讀取，沒有時以 JPEG draft 模式
+    從原照片縮小生成並寫入緩存；解碼結果經隊列交回界面線程轉為 PhotoImage，
+    保存在有界的 LRU 中。Tk 的 PhotoImage 只能在界面線程中創建。
+    """
+    
+    def __init__(self, thumbnails, pack_store=None, max_workers=THUMB_WORKERS,
+                 cache_size=THUMB_CACHE_SIZE):
+        """
+        參數:
+            thumbnails: ThumbnailStore（磁盤縮略圖緩存）
+            pack_store: 可選，照片的 PackStore（讀取已打包且沒有縮略圖的舊照片）
+            max_workers: 後台解碼線程數
+            cache_size: 內存中保留的縮略圖數量
+        """
+        self.thumbnails = thumbnails
+        self.pack_store = pack_store
+        self.cache_size = cache_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='thumbs')
+        self._results = queue.Queue()
+        self._cache = OrderedDict()  # 照片路徑 -> PhotoImage（只在界面線程中訪問）
+        self._failed = set()
+        self._pending = set()
+        # 切換植物時遞增，尚未開始的舊請求直接跳過
+        self._generation = 0
+    
+    def get(self, photo_path):
+        """
+        返回已解碼的縮略圖
+        
+        返回:
+            PhotoImage；無法載入時返回 False；還沒有解碼時返回 None
+        """
+        image = self._cache.get(photo_path)
+        if image is not None:
+            self._cache.move_to_end(photo_path)
+            return image
+        return False if photo_path in self._failed else None
+    
+    def request(self, photo_path):
+        """請求在後台解碼（已在排隊時不重複提交）"""
+        if photo_path in self._pending:
+            return
+        self._pending.add(photo_path)
+        self._executor.submit(self._decode, photo_path, self._generation)
+    
+    def cancel_pending(self):
+        """放棄尚未開始的請求（例如切換到另一株植物時）"""
+        self._generation += 1
+        self._pending.clear()
+        # 失敗的照片在重新顯示時再試一次
+        self._failed.clear()
+    
+    @property
+    def busy(self):
+        return bool(self._pending)
+    
+    def _decode(self, photo_path, generation):
+        """後台線程：讀取或生成縮略圖"""
+        if generation != self._generation:
+            return
+        try:
+            self._results.put((photo_path, self._load(photo_path), generation))
+        except Exception as e:
+            print(f"載入縮略圖失敗 {photo_path}: {e}")
+            self._results.put((photo_path, None, generation))
+    
+    def _load(self, photo_path):
+        thumb_path = self.thumbnails.get(photo_path, TIMELINE_THUMB_SIZE, 'jpg')
+        if thumb_path is not None:
+            with Image.open(thumb_path) as img:
+                img.load()
+                return img
+        # 已打包且打包前沒有生成縮略圖的照片
+        with open_photo(photo_path, self.pack_store) as f:
+            img = Image.open(f)
+            img.draft('RGB', (TIMELINE_THUMB_SIZE, TIMELINE_THUMB_SIZE))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((TIMELINE_THUMB_SIZE, TIMELINE_THUMB_SIZE), Image.Resampling.LANCZOS)
+            return img
+    
+    def poll(self):
+        """
+        取回後台解碼完成的縮略圖（在界面線程中調用）
+        
+        返回:
+            set: 有新結果的照片路徑
+        """
+        done = set()
+        while True:
+            try:
+                photo_path, img, generation = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self._generation:
+                self._pending.discard(photo_path)
+            if img is None:
+                self._failed.add(photo_path)
+            else:
+                self._cache[photo_path] = ImageTk.PhotoImage(img)
+                self._cache.move_to_end(photo_path)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            done.add(photo_path)
+        return done
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 
 class PlantDiaryApp:
@@ -67,10 +397,35 @@ class PlantDiaryApp:
         self.db = get_db()
         self.analyzer = get_analyzer()
         self.ocr_reader = get_ocr_reader()
+        # 在後台預先載入 OCR 模型，第一次「從照片識別」時不必等待
+        self.ocr_reader.warm_up()
         
         # 創建照片存儲目錄
         self.photos_dir = Path("plant_photos")
         self.photos_dir.mkdir(exist_ok=True)
+        self.photo_store = PhotoStore(self.photos_dir)
+        self.pack_store = PackStore(self.photos_dir / PACK_DIR_NAME)
+        # 照片時間線的縮略圖（磁盤緩存與 Web 版共用）
+        self.thumbnail_loader = ThumbnailLoader(ThumbnailStore("plant_thumbs"), self.pack_store)
+        self.timeline_photos = []  # 當前植物的照片（只包含列表顯示用的欄位）
+        self.timeline_rows = {}  # 照片序號 -> 行組件（只有可見範圍內的行）
+        self.timeline_spare_rows = []  # 滾出可見範圍、可重用的行組件
+        self._thumb_polling = False
+        self.normalizer = get_normalizer()
+        self.originals_store = PhotoStore("plant_originals") if keep_originals() else None
+        self.orphan_collector = OrphanCollector(self.db, self.photo_store,
+                                                originals_store=self.originals_store,
+                                                pack_store=self.pack_store)
+        # AI 分析在後台線程中進行，界面定時取回結果
+        self.analysis_queue = AnalysisQueue(self.analyzer, self.db, pack_store=self.pack_store)
+        self._analysis_polling = False
+        # 數據庫的分析結果更新通知（由工作線程發出，轉交界面線程處理）
+        self.analysis_updates = queue.Queue()
+        self.db.subscribe(self._on_db_change)
+        
+        # 植物列表的內存索引和列表框當前顯示的植物 ID（篩選時只做增量修改）
+        self.plant_index = PlantIndex()
+        self.plant_list_ids = []
         
         # 當前選中的植物
         self.current_plant_id = None
@@ -92,18 +447,33 @@ class PlantDiaryApp:
         main_frame.columnconfigure(1, weight=1)
         main_frame.rowconfigure(1, weight=1)
         
+        # 底部狀態欄：AI 分析進度
+        status_frame = ttk.Frame(main_frame)
+        status_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(10, 0))
+        status_frame.columnconfigure(0, weight=1)
+        self.analysis_status = ttk.Label(status_frame, text="")
+        self.analysis_status.grid(row=0, column=0, sticky=tk.W)
+        self.analysis_progress = ttk.Progressbar(status_frame, length=200, mode='determinate')
+        
         # 左側：植物列表
         left_frame = ttk.LabelFrame(main_frame, text="我的植物", padding="10")
         left_frame.grid(row=0, column=0, rowspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(0, 10))
         left_frame.columnconfigure(0, weight=1)
-        left_frame.rowconfigure(1, weight=1)
+        left_frame.rowconfigure(2, weight=1)
         
         # 添加植物按鈕
         ttk.Button(left_frame, text="+ 添加新植物", command=self.add_plant_dialog).grid(row=0, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
         
+        # 篩選框（輸入時即時篩選，支持中文名稱、學名和拼音/注音首字母）
+        self.plant_filter = tk.StringVar()
+        self.plant_filter.trace_add('write', lambda *args: self.apply_plant_filter())
+        filter_entry = ttk.Entry(left_frame, textvariable=self.plant_filter)
+        filter_entry.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=(0, 5))
+        filter_entry.bind('<Escape>', lambda e: self.plant_filter.set(""))
+        
         # 植物列表
         list_frame = ttk.Frame(left_frame)
-        list_frame.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        list_frame.grid(row=2, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         list_frame.columnconfigure(0, weight=1)
         list_frame.rowconfigure(0, weight=1)
         
@@ -117,7 +487,7 @@ class PlantDiaryApp:
         
         # 植物操作按鈕
         btn_frame = ttk.Frame(left_frame)
-        btn_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
+        btn_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
         btn_frame.columnconfigure(0, weight=1)
         btn_frame.columnconfigure(1, weight=1)
         
@@ -165,12 +535,17 @@ class PlantDiaryApp:
         photo_scrollbar = ttk.Scrollbar(photo_canvas_frame)
         photo_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         
-        self.photo_canvas = tk.Canvas(photo_canvas_frame, yscrollcommand=photo_scrollbar.set)
+        # 虛擬列表：只為可見範圍內的照片建立行組件，滾動時重用滾出範圍的行
+        def on_scroll(first, last):
+            photo_scrollbar.set(first, last)
+            self.update_visible_photos()
+        
+        self.photo_canvas = tk.Canvas(photo_canvas_frame, yscrollcommand=on_scroll, highlightthickness=0)
         self.photo_canvas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         photo_scrollbar.config(command=self.photo_canvas.yview)
-        
-        self.photo_content_frame = ttk.Frame(self.photo_canvas)
-        self.photo_canvas_window = self.photo_canvas.create_window((0, 0), window=self.photo_content_frame, anchor="nw")
+        self.photo_canvas.bind('<MouseWheel>', self._on_timeline_wheel)
+        self.photo_canvas.bind('<Button-4>', self._on_timeline_wheel)
+        self.photo_canvas.bind('<Button-5>', self._on_timeline_wheel)
         
         # AI 分析標籤頁
         self.ai_frame = ttk.Frame(self.notebook, padding="10")
@@ -184,26 +559,57 @@ class PlantDiaryApp:
         self.ai_text.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         # 綁定 Canvas 更新事件
-        self.photo_content_frame.bind('<Configure>', lambda e: self.photo_canvas.configure(scrollregion=self.photo_canvas.bbox('all')))
         self.photo_canvas.bind('<Configure>', self._on_canvas_configure)
     
     def _on_canvas_configure(self, event):
-        """當 Canvas 大小改變時，調整內部框架寬度"""
-        canvas_width = event.width
-        self.photo_canvas.itemconfig(self.photo_canvas_window, width=canvas_width)
+        """當 Canvas 大小改變時，調整各行寬度並補上新露出的行"""
+        for row in self.timeline_rows.values():
+            self.photo_canvas.itemconfig(row.window, width=event.width)
+        self.update_visible_photos()
+    
+    def _on_timeline_wheel(self, event):
+        """滑鼠滾輪滾動照片時間線"""
+        if event.num == 4 or event.delta > 0:
+            self.photo_canvas.yview_scroll(-1, 'units')
+        else:
+            self.photo_canvas.yview_scroll(1, 'units')
     
     def refresh_plant_list(self):
-        """刷新植物列表"""
+        """從數據庫重新載入植物列表（添加、編輯、刪除後使用 apply_plant_filter 增量更新）"""
+        # 只讀取列表需要的欄位，不建立完整的植物字典列表
+        self.plant_index.load(self.db.iter_plants(columns=('id', 'chinese_name', 'scientific_name')))
         self.plant_listbox.delete(0, tk.END)
-        plants = self.db.get_all_plants()
-        for plant in plants:
-            display_name = f"{plant['chinese_name']}"
-            if plant['scientific_name']:
-                display_name += f" ({plant['scientific_name']})"
-            self.plant_listbox.insert(tk.END, display_name)
+        self.plant_list_ids = []
+        self.apply_plant_filter()
+        # 拼音搜索字串在後台補上，不延遲啟動
+        threading.Thread(target=self.plant_index.build_phonetic, name="plant-index-pinyin", daemon=True).start()
+    
+    def apply_plant_filter(self, changed=()):
+        """
+        按篩選框的文字更新植物列表
+        
+        只刪除和插入有變化的行，不重建整個列表框。
+        
+        參數:
+            changed: 名稱已修改、需要重新顯示的植物 ID
+        """
+        plant_ids = self.plant_index.search(self.plant_filter.get())
+        for op, index, value in diff_rows(self.plant_list_ids, plant_ids, changed):
+            if op == 'delete':
+                self.plant_listbox.delete(index, index + value - 1)
+            else:
+                self.plant_listbox.insert(index, *(self.plant_index.display_name(i) for i in value))
+        self.plant_list_ids = plant_ids
         
-        # 存儲植物 ID 映射
-        self.plant_id_map = {i: plant['id'] for i, plant in enumerate(plants)}
+        # 保持當前植物的選中狀態
+        self.plant_listbox.selection_clear(0, tk.END)
+        if self.current_plant_id in self.plant_index:
+            try:
+                index = plant_ids.index(self.current_plant_id)
+            except ValueError:
+                return
+            self.plant_listbox.selection_set(index)
+            self.plant_listbox.see(index)
     
     def on_plant_select(self, event):
         """當選擇植物時"""
@@ -212,7 +618,7 @@ class PlantDiaryApp:
             return
         
         idx = selection[0]
-        self.current_plant_id = self.plant_id_map[idx]
+        self.current_plant_id = self.plant_list_ids[idx]
         self.load_plant_info()
         self.load_plant_photos()
     
@@ -260,51 +666,104 @@ class PlantDiaryApp:
             if not file_path:
                 return
             
-            # 顯示識別中提示
-            recognize_btn.config(state="disabled")
-            status_label = ttk.Label(dialog, text="正在識別...", foreground="blue")
+            # 獲取 OpenAI API 密鑰（如果可用）
+            api_key = os.getenv("OPENAI_API_KEY")
+            use_openai = api_key is not None
+            
+            # 顯示識別中提示；識別在後台進行，期間對話框可以移動，按鈕改為取消
+            status_label = ttk.Label(dialog, foreground="blue")
             status_label.grid(row=1, column=0, columnspan=3, pady=5)
-            dialog.update()
             
-            try:
-                # 獲取 OpenAI API 密鑰（如果可用）
-                api_key = os.getenv("OPENAI_API_KEY")
-                use_openai = api_key is not None
+            progress_job = [None]
+            
+            def stop_progress():
+                """取消尚未執行的進度刷新"""
+                if progress_job[0] is not None:
+                    try:
+                        dialog.after_cancel(progress_job[0])
+                    except tk.TclError:
+                        pass
+                    progress_job[0] = None
+            
+            def finish(result, error):
+                stop_progress()
+                recognize_btn.config(text="📷 從照片識別", command=recognize_from_photo)
+                try:
+                    if error is not None:
+                        raise error
+                    
+                    if result["success"]:
+                        # 自動填充識別結果
+                        if result["chinese_name"]:
+                            chinese_entry.delete(0, tk.END)
+                            chinese_entry.insert(0, result["chinese_name"])
+                        
+                        if result["scientific_name"]:
+                            scientific_entry.delete(0, tk.END)
+                            scientific_entry.insert(0, result["scientific_name"])
+                        
+                        status_label.config(text="識別成功！", foreground="green")
+                        
+                        # 如果識別結果不完整，顯示提示
+                        if not result["chinese_name"] or not result["scientific_name"]:
+                            status_label.config(
+                                text="部分信息識別成功，請檢查並手動補充", 
+                                foreground="orange"
+                            )
+                    else:
+                        status_label.config(text=f"識別失敗：{result.get('error', '未知錯誤')}", foreground="red")
                 
-                # 進行 OCR 識別
-                result = self.ocr_reader.recognize_text(
+                except TimeoutError:
+                    status_label.config(text="識別超時，請重試或手動輸入", foreground="red")
+                except Exception as e:
+                    status_label.config(text=f"識別出錯：{str(e)}", foreground="red")
+                finally:
+                    # 3秒後移除狀態標籤
+                    dialog.after(3000, status_label.destroy)
+            
+            # 進行 OCR 識別
+            call = BackgroundCall(
+                dialog,
+                lambda: self.ocr_reader.recognize_text(
                     file_path, 
                     use_openai=use_openai,
                     openai_api_key=api_key
-                )
-                
-                if result["success"]:
-                    # 自動填充識別結果
-                    if result["chinese_name"]:
-                        chinese_entry.delete(0, tk.END)
-                        chinese_entry.insert(0, result["chinese_name"])
-                    
-                    if result["scientific_name"]:
-                        scientific_entry.delete(0, tk.END)
-                        scientific_entry.insert(0, result["scientific_name"])
-                    
-                    status_label.config(text="識別成功！", foreground="green")
-                    
-                    # 如果識別結果不完整，顯示提示
-                    if not result["chinese_name"] or not result["scientific_name"]:
-                        status_label.config(
-                            text="部分信息識別成功，請檢查並手動補充", 
-                            foreground="orange"
-                        )
+                ),
+                finish,
+                timeout=OCR_TIMEOUT_SECONDS
+            )
+            
+            def show_progress():
+                progress_job[0] = None
+                if call.cancelled:
+                    return
+                try:
+                    if not dialog.winfo_exists():
+                        return
+                except tk.TclError:
+                    return
+                if not use_openai and self.ocr_reader.model_loading:
+                    text = "正在載入 OCR 模型，首次識別需要較長時間..."
                 else:
-                    status_label.config(text=f"識別失敗：{result.get('error', '未知錯誤')}", foreground="red")
-                    
-            except Exception as e:
-                status_label.config(text=f"識別出錯：{str(e)}", foreground="red")
-            finally:
-                recognize_btn.config(state="normal")
-                # 3秒後移除狀態標籤
+                    text = "正在識別..."
+                status_label.config(text=f"{text}（{int(call.elapsed)} 秒）")
+                progress_job[0] = dialog.after(500, show_progress)
+            
+            def cancel():
+                call.cancel()
+                stop_progress()
+                recognize_btn.config(text="📷 從照片識別", command=recognize_from_photo)
+                status_label.config(text="已取消識別", foreground="gray")
                 dialog.after(3000, status_label.destroy)
+            
+            def on_destroy(event):
+                # 對話框關閉（或狀態標籤移除）時停止等待與進度刷新
+                call.cancel()
+                stop_progress()
+            
+            status_label.bind('<Destroy>', on_destroy)
+            recognize_btn.config(text="取消識別", command=cancel)
+            show_progress()
         
         recognize_btn = ttk.Button(
             dialog, 
@@ -339,12 +798,14 @@ class PlantDiaryApp:
                 messagebox.showerror("錯誤", "請輸入中文名稱")
                 return
             
-            self.db.add_plant(
+            scientific_name = scientific_entry.get().strip()
+            plant_id = self.db.add_plant(
                 chinese_name=chinese_name,
-                scientific_name=scientific_entry.get().strip(),
+                scientific_name=scientific_name,
                 notes=notes_text.get(1.0, tk.END).strip()
             )
-            self.refresh_plant_list()
+            self.plant_index.add(plant_id, chinese_name, scientific_name)
+            self.apply_plant_filter()
             dialog.destroy()
             messagebox.showinfo("成功", "植物已添加")
         
@@ -396,14 +857,16 @@ class PlantDiaryApp:
                 messagebox.showerror("錯誤", "請輸入中文名稱")
                 return
             
+            scientific_name = scientific_entry.get().strip()
             self.db.update_plant(
                 self.current_plant_id,
                 chinese_name=chinese_name,
-                scientific_name=scientific_entry.get().strip(),
+                scientific_name=scientific_name,
                 notes=notes_text.get(1.0, tk.END).strip()
             )
             self.load_plant_info()
-            self.refresh_plant_list()
+            self.plant_index.update(self.current_plant_id, chinese_name, scientific_name)
+            self.apply_plant_filter(changed={self.current_plant_id})
             dialog.destroy()
             messagebox.showinfo("成功", "植物信息已更新")
         
@@ -422,10 +885,13 @@ class PlantDiaryApp:
         
         if messagebox.askyesno("確認", f"確定要刪除「{plant['chinese_name']}」嗎？\n這將同時刪除所有相關的照片記錄。"):
             self.db.delete_plant(self.current_plant_id)
+            # 照片文件已加入待刪除隊列，在後台確認沒有其他記錄引用後刪除
+            self.orphan_collector.drain_queue_async()
+            self.plant_index.remove(self.current_plant_id)
             self.current_plant_id = None
             self.info_text.delete(1.0, tk.END)
             self.clear_photos()
-            self.refresh_plant_list()
+            self.apply_plant_filter()
             messagebox.showinfo("成功", "植物已刪除")
     
     def upload_photo(self):
@@ -434,69 +900,175 @@ class PlantDiaryApp:
             messagebox.showwarning("提示", "請先選擇一個植物")
             return
         
-        file_path = filedialog.askopenfilename(
-            title="選擇照片",
+        file_paths = filedialog.askopenfilenames(
+            title="選擇照片（可多選）",
             filetypes=[
                 ("圖片文件", "*.jpg *.jpeg *.png *.bmp *.gif"),
                 ("所有文件", "*.*")
             ]
         )
         
-        if not file_path:
+        if not file_paths:
             return
         
-        try:
-            # 複製照片到照片目錄
-            plant = self.db.get_plant(self.current_plant_id)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_ext = Path(file_path).suffix
-            new_filename = f"{plant['chinese_name']}_{timestamp}{file_ext}"
-            new_file_path = self.photos_dir / new_filename
-            shutil.copy2(file_path, new_file_path)
-            
-            # 保存到數據庫
-            photo_id = self.db.add_photo(
-                plant_id=self.current_plant_id,
-                photo_path=str(new_file_path),
-                notes=""
-            )
+        plant_id = self.current_plant_id
+        plant = self.db.get_plant(plant_id)
+        
+        def store_all():
+            # 複製和重新編碼照片（大照片需要數秒）在後台線程中進行，不阻塞界面
+            results = []
+            for file_path in file_paths:
+                try:
+                    results.append((file_path, self.store_photo_file(file_path), None))
+                except Exception as e:
+                    results.append((file_path, None, e))
+            return results
+        
+        def finish(results, error):
+            saved_bytes = 0
+            failed = [str(error)] if error else []
+            for file_path, stored, store_error in results or []:
+                if stored is not None:
+                    try:
+                        saved_bytes += self.save_photo(stored, plant_id, plant)
+                    except Exception as e:
+                        store_error = e
+                if store_error is not None:
+                    failed.append(f"{Path(file_path).name}：{str(store_error)}")
             
-            # 使用 AI 分析（異步進行，不阻塞界面）
-            self.root.after(100, lambda: self.analyze_photo(photo_id, str(new_file_path)))
-            
-            self.load_plant_photos()
-            messagebox.showinfo("成功", "照片已上傳")
-            
-        except Exception as e:
-            messagebox.showerror("錯誤", f"上傳照片時出錯：{str(e)}")
+            self.analysis_status.config(text="")
+            self.update_analysis_status()
+            # 保存期間可能已切換到其他植物
+            if self.current_plant_id == plant_id:
+                self.load_plant_photos()
+            if failed:
+                messagebox.showerror("錯誤", "上傳照片時出錯：\n" + "\n".join(failed))
+                return
+            message = f"已上傳 {len(file_paths)} 張照片" if len(file_paths) > 1 else "照片已上傳"
+            if saved_bytes > 0:
+                message += f"（壓縮後節省 {saved_bytes / 1024 / 1024:.1f} MB）"
+            messagebox.showinfo("成功", message)
+        
+        self.analysis_status.config(text=f"正在保存 {len(file_paths)} 張照片...")
+        BackgroundCall(self.root, store_all, finish)
     
-    def analyze_photo(self, photo_id, image_path):
-        """使用 AI 分析照片"""
+    def store_photo_file(self, file_path):
+        """
+        複製並標準化一張照片，按內容哈希保存（可在後台線程中執行）
+        
+        返回:
+            dict: store_photo 的結果
+        """
+        # 複製照片後標準化（旋轉、限制解析度、重新編碼），按內容哈希保存，同一張照片只保存一份
+        with open(file_path, 'rb') as source:
+            temp_path, source_hash = self.photo_store.receive_stream(source)
         try:
-            # 獲取植物信息以傳遞給 AI
-            if self.current_plant_id:
-                plant = self.db.get_plant(self.current_plant_id)
-                chinese_name = plant.get('chinese_name') if plant else None
-                scientific_name = plant.get('scientific_name') if plant else None
-            else:
-                chinese_name = None
-                scientific_name = None
-            
-            result = self.analyzer.analyze_plant_photo(
-                image_path,
-                chinese_name=chinese_name,
-                scientific_name=scientific_name
-            )
-            self.db.update_photo_analysis(
-                photo_id=photo_id,
-                ai_analysis=result['ai_analysis'],
-                care_suggestions=result['care_suggestions']
+            stored = store_photo(self.photo_store, temp_path, Path(file_path).name,
+                                 self.normalizer, self.originals_store, source_hash=source_hash)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        print(f"照片已保存：原始 {stored['original_bytes']} 字節，"
+              f"保存 {stored['stored_bytes']} 字節，節省 {stored['saved_bytes']} 字節")
+        return stored
+    
+    def save_photo(self, stored, plant_id, plant):
+        """
+        為已保存的照片添加記錄並提交 AI 分析
+        
+        參數:
+            stored: store_photo_file 的結果
+            plant_id: 植物 ID
+            plant: 植物記錄（用於 AI 分析的提示）
+        
+        返回:
+            int: 標準化節省的字節數
+        """
+        content_hash = stored['content_hash']
+        new_file_path = stored['path']
+        
+        # 相同照片已分析過時直接沿用結果
+        analysis = self.db.find_analysis_by_hash(content_hash, plant_id)
+        
+        # 保存到數據庫
+        photo_id = self.db.add_photo(
+            plant_id=plant_id,
+            photo_path=str(new_file_path),
+            notes="",
+            ai_analysis=analysis['ai_analysis'] if analysis else "",
+            care_suggestions=analysis['care_suggestions'] if analysis else "",
+            content_hash=content_hash,
+            original_hash=stored['original_hash']
+        )
+        
+        # 使用 AI 分析（在後台線程中進行，不阻塞界面）
+        if not analysis:
+            self.analysis_queue.submit(
+                photo_id, str(new_file_path),
+                chinese_name=plant.get('chinese_name') if plant else None,
+                scientific_name=plant.get('scientific_name') if plant else None
             )
-            # 如果當前顯示的是這張照片，刷新顯示
-            if self.current_photo_id == photo_id:
-                self.show_photo_details(photo_id)
-        except Exception as e:
-            print(f"AI 分析出錯：{e}")
+            self.start_analysis_polling()
+        return stored['saved_bytes']
+    
+    def start_analysis_polling(self):
+        """開始定時檢查後台分析的結果（已在檢查時不重複啟動）"""
+        if not self._analysis_polling:
+            self._analysis_polling = True
+            self.update_analysis_status()
+            self.root.after(ANALYSIS_POLL_MS, self.poll_analysis_results)
+    
+    def _on_db_change(self, event, data):
+        """
+        數據庫變更通知的回調
+        
+        在寫入數據庫的線程（通常是分析工作線程）上調用，不能操作 Tk 控件，
+        只把分析結果更新的照片 ID 放入隊列，由 poll_analysis_results 在界面線程中處理。
+        """
+        if event == 'photo_analysis_updated':
+            self.analysis_updates.put(data['photo_id'])
+    
+    def poll_analysis_results(self):
+        """取回後台完成的分析並刷新界面，還有未完成的分析時繼續定時檢查"""
+        refresh = set()
+        for photo_id, error in self.analysis_queue.poll():
+            if error:
+                print(f"AI 分析出錯（照片 {photo_id}）：{error}")
+                # 分析失敗沒有數據庫更新，需要把「正在分析中」改為無結果
+                refresh.add(photo_id)
+        # 結果寫入數據庫時已發出通知（早於放入結果隊列），這裡一併取出
+        while True:
+            try:
+                refresh.add(self.analysis_updates.get_nowait())
+            except queue.Empty:
+                break
+        # 如果當前顯示的是有更新的照片，只刷新一次
+        if self.current_photo_id in refresh:
+            self.show_photo_details(self.current_photo_id)
+        
+        self.update_analysis_status()
+        if self.analysis_queue.busy:
+            self.root.after(ANALYSIS_POLL_MS, self.poll_analysis_results)
+        else:
+            self._analysis_polling = False
+    
+    def update_analysis_status(self):
+        """在狀態欄顯示分析進度和隊列長度"""
+        analysis = self.analysis_queue
+        if not analysis.submitted:
+            return
+        finished = analysis.completed + analysis.failed
+        if analysis.busy:
+            running, waiting = analysis.status()
+            text = f"AI 分析中：{finished}/{analysis.submitted} 完成，進行中 {running}，排隊 {waiting}"
+            self.analysis_progress.grid(row=0, column=1, sticky=tk.E)
+            self.analysis_progress.configure(maximum=analysis.submitted, value=finished)
+        else:
+            text = f"AI 分析完成：{analysis.completed} 張"
+            if analysis.failed:
+                text += f"，失敗 {analysis.failed} 張"
+            self.analysis_progress.grid_remove()
+        self.analysis_status.config(text=text)
     
     def load_plant_photos(self):
         """載入植物的照片列表"""
@@ -504,62 +1076,123 @@ class PlantDiaryApp:
             self.clear_photos()
             return
         
-        # 清除現有內容
-        for widget in self.photo_content_frame.winfo_children():
-            widget.destroy()
-        
-        photos = self.db.get_plant_photos(self.current_plant_id)
+        # 列表不需要 AI 分析等長文本，只讀取顯示用的欄位
+        photos = list(self.db.iter_photos(self.current_plant_id,
+                                          columns=('id', 'photo_path', 'taken_at', 'notes')))
+        self.show_timeline(photos)
+    
+    def show_timeline(self, photos):
+        """顯示照片列表（只建立可見的行，縮略圖在後台載入）"""
+        canvas = self.photo_canvas
+        self.thumbnail_loader.cancel_pending()
+        for row in self.timeline_rows.values():
+            self._recycle_row(row)
+        self.timeline_rows = {}
+        canvas.delete('empty')
+        self.timeline_photos = photos
         
         if not photos:
-            ttk.Label(self.photo_content_frame, text="尚未添加照片，請點擊「上傳照片」按鈕添加。").pack(pady=20)
+            canvas.configure(scrollregion=(0, 0, 0, 0))
+            canvas.create_text(20, 20, anchor='nw', tags='empty',
+                               text="尚未添加照片，請點擊「上傳照片」按鈕添加。")
             return
         
-        # 顯示每張照片
-        for photo in photos:
-            self.create_photo_widget(photo)
-        
-        # 更新滾動區域
-        self.photo_content_frame.update_idletasks()
-        self.photo_canvas.configure(scrollregion=self.photo_canvas.bbox('all'))
+        # 滾動區域按行數計算，不需要先建立所有行再量尺寸
+        canvas.configure(scrollregion=(0, 0, 0, len(photos) * TIMELINE_ROW_HEIGHT),
+                         yscrollincrement=TIMELINE_ROW_HEIGHT // 4)
+        canvas.yview_moveto(0)
+        self.update_visible_photos()
     
-    def create_photo_widget(self, photo):
-        """創建照片顯示組件"""
-        photo_frame = ttk.LabelFrame(self.photo_content_frame, padding="10")
-        photo_frame.pack(fill=tk.X, padx=5, pady=5)
-        photo_frame.columnconfigure(1, weight=1)
-        
-        # 載入並顯示縮略圖
-        try:
-            img = Image.open(photo['photo_path'])
-            img.thumbnail((200, 200), Image.Resampling.LANCZOS)
-            photo_img = ImageTk.PhotoImage(img)
-            
-            img_label = ttk.Label(photo_frame, image=photo_img)
-            img_label.image = photo_img  # 保持引用
-            img_label.grid(row=0, column=0, rowspan=3, padx=(0, 10))
-            
-        except Exception as e:
-            ttk.Label(photo_frame, text="無法載入圖片").grid(row=0, column=0, rowspan=3, padx=(0, 10))
-        
+    def update_visible_photos(self):
+        """建立或重用可見範圍內的行，回收滾出範圍的行"""
+        canvas = self.photo_canvas
+        count = len(self.timeline_photos)
+        if not count:
+            return
+        top = canvas.canvasy(0)
+        height = max(canvas.winfo_height(), TIMELINE_ROW_HEIGHT)
+        first = max(0, int(top // TIMELINE_ROW_HEIGHT) - TIMELINE_OVERSCAN)
+        last = min(count - 1, int((top + height) // TIMELINE_ROW_HEIGHT) + TIMELINE_OVERSCAN)
+        
+        for index in [i for i in self.timeline_rows if i < first or i > last]:
+            self._recycle_row(self.timeline_rows.pop(index))
+        
+        width = canvas.winfo_width()
+        for index in range(first, last + 1):
+            if index in self.timeline_rows:
+                continue
+            row = self.timeline_spare_rows.pop() if self.timeline_spare_rows else self.create_photo_row()
+            canvas.coords(row.window, 0, index * TIMELINE_ROW_HEIGHT)
+            canvas.itemconfigure(row.window, width=width)
+            self.fill_photo_row(row, self.timeline_photos[index])
+            self.timeline_rows[index] = row
+    
+    def _recycle_row(self, row):
+        """把行移到滾動區域之外，留待重用"""
+        self.photo_canvas.coords(row.window, 0, -2 * TIMELINE_ROW_HEIGHT)
+        self.timeline_spare_rows.append(row)
+    
+    def create_photo_row(self):
+        """創建一個照片行組件（之後滾動時重複使用）"""
+        row = ttk.LabelFrame(self.photo_canvas, padding="10")
+        row.columnconfigure(1, weight=1)
+        
+        row.image_label = ttk.Label(row, width=28, anchor=tk.CENTER)
+        row.image_label.grid(row=0, column=0, rowspan=3, padx=(0, 10))
+        row.date_label = ttk.Label(row, font=("Arial", 10, "bold"))
+        row.date_label.grid(row=0, column=1, sticky=tk.W)
+        row.notes_label = ttk.Label(row, wraplength=400)
+        row.notes_label.grid(row=1, column=1, sticky=tk.W, pady=5)
+        row.details_button = ttk.Button(row, text="查看詳情和AI分析")
+        row.details_button.grid(row=2, column=1, sticky=tk.W, pady=5)
+        row.photo_path = None
+        
+        # 固定行高，滾動位置可以直接按序號計算
+        row.window = self.photo_canvas.create_window(
+            0, 0, window=row, anchor='nw', height=TIMELINE_ROW_HEIGHT - 10)
+        return row
+    
+    def fill_photo_row(self, row, photo):
+        """把照片信息填入行組件，縮略圖還沒解碼時提交後台解碼"""
         # 照片信息
-        date_str = photo['taken_at'][:10] if photo['taken_at'] else "未知日期"
-        ttk.Label(photo_frame, text=f"拍攝日期：{date_str}", font=("Arial", 10, "bold")).grid(row=0, column=1, sticky=tk.W)
-        
-        if photo['notes']:
-            ttk.Label(photo_frame, text=f"備註：{photo['notes']}", wraplength=400).grid(row=1, column=1, sticky=tk.W, pady=5)
-        
-        # 查看詳情按鈕
-        def show_details():
-            self.show_photo_details(photo['id'])
-        
-        ttk.Button(photo_frame, text="查看詳情和AI分析", command=show_details).grid(row=2, column=1, sticky=tk.W, pady=5)
+        date_str = photo.taken_at[:10] if photo.taken_at else "未知日期"
+        row.date_label.config(text=f"拍攝日期：{date_str}")
+        row.notes_label.config(text=f"備註：{photo.notes}" if photo.notes else "")
+        row.details_button.config(command=lambda: self.show_photo_details(photo.id))
+        row.photo_path = photo.photo_path
+        self.show_row_thumbnail(row)
+    
+    def show_row_thumbnail(self, row):
+        """顯示行的縮略圖；還沒解碼時顯示提示並在後台解碼"""
+        image = self.thumbnail_loader.get(row.photo_path)
+        if image:
+            row.image_label.config(image=image, text="")
+        elif image is False:
+            row.image_label.config(image="", text="無法載入圖片")
+        else:
+            row.image_label.config(image="", text="載入中...")
+            self.thumbnail_loader.request(row.photo_path)
+            if not self._thumb_polling:
+                self._thumb_polling = True
+                self.root.after(THUMB_POLL_MS, self.poll_thumbnails)
+    
+    def poll_thumbnails(self):
+        """取回後台解碼好的縮略圖，更新仍在可見範圍內的行"""
+        done = self.thumbnail_loader.poll()
+        if done:
+            for row in self.timeline_rows.values():
+                if row.photo_path in done:
+                    self.show_row_thumbnail(row)
+        if self.thumbnail_loader.busy:
+            self.root.after(THUMB_POLL_MS, self.poll_thumbnails)
+        else:
+            self._thumb_polling = False
     
     def show_photo_details(self, photo_id):
         """顯示照片詳情和AI分析"""
-        photos = self.db.get_plant_photos(self.current_plant_id)
-        photo = next((p for p in photos if p['id'] == photo_id), None)
+        photo = self.db.get_photo(photo_id)
         
-        if not photo:
+        if not photo or photo['plant_id'] != self.current_plant_id:
             return
         
         self.current_photo_id = photo_id
@@ -572,7 +1205,12 @@ class PlantDiaryApp:
         content += "=" * 50 + "\n"
         content += "AI 分析結果\n"
         content += "=" * 50 + "\n\n"
-        content += (photo['ai_analysis'] or "正在分析中...") + "\n\n"
+        if photo['ai_analysis']:
+            content += photo['ai_analysis'] + "\n\n"
+        elif self.analysis_queue.is_pending(photo_id):
+            content += "正在分析中...\n\n"
+        else:
+            content += "尚無 AI 分析結果\n\n"
         
         if photo['care_suggestions']:
             content += "=" * 50 + "\n"
@@ -582,20 +1220,18 @@ class PlantDiaryApp:
         
         self.ai_text.delete(1.0, tk.END)
         self.ai_text.insert(1.0, content)
-        
-        # 如果還在分析中，稍後再檢查
-        if not photo['ai_analysis']:
-            self.root.after(2000, lambda: self.show_photo_details(photo_id))
     
     def clear_photos(self):
         """清除照片顯示"""
-        for widget in self.photo_content_frame.winfo_children():
-            widget.destroy()
+        self.show_timeline([])
+        self.photo_canvas.delete('empty')
         self.ai_text.delete(1.0, tk.END)
         self.current_photo_id = None
     
     def on_closing(self):
         """應用程式關閉時"""
+        self.thumbnail_loader.shutdown()
+        self.db.unsubscribe(self._on_db_change)
         self.db.close()
         self.root.destroy()
 
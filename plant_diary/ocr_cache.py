@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+植物日記 - OCR 結果緩存模組
+把花牌照片的識別結果保存在 SQLite 中（默認為日記數據庫旁的 ocr_cache.db），
+重新上傳或重試同一張照片時不必再次執行 EasyOCR 或調用 OpenAI API
+
+結果以「解碼後像素的哈希 + 識別引擎 + 解析規則版本」為鍵，同一張照片換了文件格式或
+元數據也能命中；另外記錄原始文件內容哈希到像素哈希的對應，完全相同的文件不需要解碼。
+總大小超過上限時按最近使用時間淘汰。命中統計保存在數據庫中，多個進程共用。
+
+查看統計:
+    python -m plant_diary.ocr_cache --db ocr_cache.db
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 緩存的默認大小上限（MB）
+DEFAULT_MAX_MB = 64
+# 淘汰時刪到上限的這個比例以下，避免每次寫入都觸發淘汰
+EVICT_TARGET = 0.9
+
+_COUNTERS = ('hits', 'raw_hits', 'misses', 'stores', 'evictions')
+
+
+def raw_digest(data):
+    """原始文件內容的 SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_digest(image):
+    """
+    解碼後圖像像素的哈希（與文件格式、壓縮參數和元數據無關）
+    
+    參數:
+        image: PIL 圖像或 NumPy 數組
+    """
+    from PIL import Image
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    h = hashlib.sha256()
+    h.update(f"{image.width}x{image.height}:".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class OCRCache:
+    """OCR 識別結果的持久緩存"""
+    
+    def __init__(self, db_path="ocr_cache.db", max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        """
+        參數:
+            db_path: 緩存數據庫文件路徑
+            max_bytes: 緩存結果的總大小上限（字節）
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+    
+    def _connection(self):
+        """緩存數據庫連接（第一次使用時創建）"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS results (
+                    image_hash TEXT NOT NULL,
+                    engine TEXT NOT NULL,
+                    parser_version INTEGER NOT NULL,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (image_hash, engine, parser_version)
+                );
+                CREATE INDEX IF NOT EXISTS idx_results_last_used ON results (last_used);
+                CREATE TABLE IF NOT EXISTS aliases (
+                    raw_hash TEXT PRIMARY KEY,
+                    image_hash TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_aliases_image_hash ON aliases (image_hash);
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            ''')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+    
+    def _count(self, conn, name):
+        """統計計數加 1"""
+        conn.execute('''
+            INSERT INTO counters (name, value) VALUES (?, 1)
+            ON CONFLICT (name) DO UPDATE SET value = value + 1
+        ''', (name,))
+    
+    def _touch(self, conn, image_hash, engine, parser_version):
+        """記錄一次命中（更新最近使用時間，用於淘汰）"""
+        conn.execute('''
+            UPDATE results SET last_used = ?, hits = hits + 1
+            WHERE image_hash = ? AND engine = ? AND parser_version = ?
+        ''', (time.time(), image_hash, engine, parser_version))
+    
+    def get_raw(self, raw_hash, engine, parser_version):
+        """
+        按原始文件內容哈希查找（完全相同的文件，不需要解碼）
+        
+        未命中時不計入統計，調用者接著會解碼並用 get 查找。
+        
+        返回:
+            dict: 緩存的識別結果；未命中時返回 None
+        """
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute('''
+                SELECT r.image_hash, r.result FROM aliases a
+                JOIN results r ON r.image_hash = a.image_hash
+                WHERE a.raw_hash = ? AND r.engine = ? AND r.parser_version = ?
+            ''', (raw_hash, engine, parser_version)).fetchone()
+            if row is None:
+                return None
+            self._touch(conn, row[0], engine, parser_version)
+            self._count(conn, 'raw_hits')
+            conn.commit()
+        return json.loads(row[1])
+    
+    def get(self, image_hash, engine, parser_version, raw_hash=None):
+        """
+        按像素哈希查找
+        
+        參數:
+            raw_hash: 可選，原始文件內容哈希；命中時記錄對應關係，下次同一文件可直接命中
+        
+        返回:
+            dict: 緩存的識別結果；未命中時返回 None
+        """
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute('''
+                SELECT result FROM results
+                WHERE image_hash = ? AND engine = ? AND parser_version = ?
+            ''', (image_hash, engine, parser_version)).fetchone()
+            if row is None:
+                self._count(conn, 'misses')
+            else:
+                self._touch(conn, image_hash, engine, parser_version)
+                self._count(conn, 'hits')
+                if raw_hash is not None:
+                    conn.execute('INSERT OR REPLACE INTO aliases (raw_hash, image_hash) VALUES (?, ?)',
+                                 (raw_hash, image_hash))
+            conn.commit()
+        return json.loads(row[0]) if row is not None else None
+    
+    def put(self, image_hash, engine, parser_version, result, raw_hash=None):
+        """保存識別結果，總大小超過上限時淘汰最久未使用的結果"""
+        value = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute('''
+                INSERT OR REPLACE INTO results
+                    (image_hash, engine, parser_version, result, size, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (image_hash, engine, parser_version, value, len(value.encode('utf-8')), now, now))
+            if raw_hash is not None:
+                conn.execute('INSERT OR REPLACE INTO aliases (raw_hash, image_hash) VALUES (?, ?)',
+                             (raw_hash, image_hash))
+            self._count(conn, 'stores')
+            self._evict(conn)
+            conn.commit()
+    
+    def _evict(self, conn):
+        """總大小超過上限時，按最近使用時間刪除到上限的 EVICT_TARGET 以下（調用者需持有鎖）"""
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TARGET
+        evicted = []
+        for rowid, size in conn.execute('SELECT rowid, size FROM results ORDER BY last_used'):
+            if total <= target:
+                break
+            evicted.append((rowid,))
+            total -= size
+        conn.executemany('DELETE FROM results WHERE rowid = ?', evicted)
+        conn.execute('''
+            DELETE FROM aliases
+            WHERE image_hash NOT IN (SELECT image_hash FROM results)
+        ''')
+        conn.execute('''
+            INSERT INTO counters (name, value) VALUES ('evictions', ?)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+        ''', (len(evicted),))
+    
+    def stats(self):
+        """
+        返回緩存統計（所有使用同一緩存文件的進程合計）
+        
+        返回:
+            dict: 條目數、總字節數、上限、命中（像素哈希 / 原始文件哈希）、未命中、
+                  命中率、寫入數和淘汰數
+        """
+        with self._lock:
+            conn = self._connection()
+            entries, total = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+            counters = dict(conn.execute('SELECT name, value FROM counters'))
+        result = {'entries': entries, 'bytes': total, 'max_bytes': self.max_bytes}
+        for name in _COUNTERS:
+            result[name] = counters.get(name, 0)
+        lookups = result['hits'] + result['raw_hits'] + result['misses']
+        result['hit_rate'] = (result['hits'] + result['raw_hits']) / lookups if lookups else 0.0
+        return result
+    
+    def clear(self):
+        """清空緩存和統計"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute('DELETE FROM results')
+            conn.execute('DELETE FROM aliases')
+            conn.execute('DELETE FROM counters')
+            conn.commit()
+    
+    def _after_fork(self):
+        """在 fork 出的子進程中放棄父進程的連接（不關閉），之後重新連接"""
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def get_ocr_cache():
+    """
+    按環境變數創建 OCR 結果緩存
+    
+    PLANT_DIARY_OCR_CACHE: 緩存數據庫路徑（默認 ocr_cache.db）
+    PLANT_DIARY_OCR_CACHE_MB: 大小上限（MB，默認 64），設為 0 關閉緩存
+    
+    返回:
+        OCRCache；關閉緩存時返回 None
+    """
+    max_mb = float(os.getenv('PLANT_DIARY_OCR_CACHE_MB', DEFAULT_MAX_MB))
+    if max_mb <= 0:
+        return None
+    return OCRCache(os.getenv('PLANT_DIARY_OCR_CACHE', 'ocr_cache.db'), int(max_mb * 1024 * 1024))
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="OCR 結果緩存統計")
+    parser.add_argument('--db', default="ocr_cache.db", help="緩存數據庫文件路徑")
+    parser.add_argument('--clear', action='store_true', help="清空緩存和統計")
+    args = parser.parse_args(argv)
+    
+    cache = OCRCache(args.db)
+    try:
+        if args.clear:
+            cache.clear()
+            print("已清空 OCR 緩存")
+        stats = cache.stats()
+        print(f"條目 {stats['entries']} 個，共 {stats['bytes'] / 1024:.1f} KB；"
+              f"命中 {stats['hits'] + stats['raw_hits']} 次（其中相同文件 {stats['raw_hits']} 次），"
+              f"未命中 {stats['misses']} 次，命中率 {stats['hit_rate']:.1%}，淘汰 {stats['evictions']} 個")
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,32 +5,138 @@
 從植物花牌照片中識別中文名稱和學名
 """
 
+import io
 import os
-import tempfile
+import sys
+import importlib.util
+import threading
 from pathlib import Path
 import re
 
+try:
+    from plant_diary.ocr_cache import get_ocr_cache, image_digest, raw_digest
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).parent))
+    from ocr_cache import get_ocr_cache, image_digest, raw_digest
+
+
+# EasyOCR 模型的載入時機，可通過環境變數 PLANT_DIARY_OCR_LOAD 配置：
+#   lazy（默認）  第一次識別時載入，不做 OCR 的進程不佔用模型內存
+#   background    啟動後在後台線程載入（warm_up）
+#   sync          啟動時同步載入；配合 gunicorn --preload 只在主進程載入一次，
+#                 fork 出的 worker 以寫時複製共享模型權重
+OCR_LOAD_MODES = ('lazy', 'background', 'sync')
+
+# 識別結果解析規則（過濾詞、名稱和學名的判斷）的版本；修改規則後加 1，舊的緩存結果不再使用
+OCR_PARSER_VERSION = 1
+# 使用 OpenAI 識別時的模型
+OPENAI_OCR_MODEL = "gpt-4o"
+
+
+class InvalidImageError(ValueError):
+    """圖片無法解碼（文件損壞或格式不支持）"""
+
+
+def decode_image(source):
+    """
+    把圖片解碼為 RGB 的 PIL 圖像（完整解碼一次，損壞或截斷的圖片在這裡就會報錯）
+    
+    參數:
+        source: 圖片文件內容（bytes 等）、二進制文件對象或文件路徑
+    
+    返回:
+        PIL.Image.Image：RGB 模式、已載入像素的圖像；無法解碼時拋出 InvalidImageError
+    """
+    from PIL import Image
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    try:
+        img = Image.open(source)
+        img.load()
+        return img if img.mode == 'RGB' else img.convert('RGB')
+    except Exception as e:
+        raise InvalidImageError(str(e)) from e
+
 
 class OCRReader:
     """OCR 文字識別器"""
     
-    def __init__(self):
-        """初始化 OCR 識別器"""
-        self.easyocr_available = False
+    def __init__(self, cache=None):
+        """
+        初始化 OCR 識別器
+        
+        EasyOCR 模型載入需要數秒到數十秒，這裡只檢查是否已安裝，模型在第一次識別時
+        載入；調用 warm_up() 可提前在後台載入。
+        
+        參數:
+            cache: 可選，OCRCache；同一張圖片的識別結果直接從緩存返回
+        """
+        self.cache = cache
+        self.easyocr_available = importlib.util.find_spec('easyocr') is not None
+        self.easyocr_reader = None
         self.openai_available = False
-        self._init_easyocr()
+        self._easyocr_lock = threading.Lock()
     
     def _init_easyocr(self):
-        """初始化 EasyOCR"""
-        try:
-            import easyocr
-            self.easyocr_reader = easyocr.Reader(['ch_sim', 'en'], gpu=False)
-            self.easyocr_available = True
-        except ImportError:
-            self.easyocr_available = False
-        except Exception as e:
-            print(f"EasyOCR 初始化失敗: {e}")
-            self.easyocr_available = False
+        """
+        載入 EasyOCR 模型（只載入一次，同時調用時等待同一次載入完成）
+        
+        返回:
+            easyocr.Reader；未安裝或載入失敗時返回 None
+        """
+        with self._easyocr_lock:
+            if self.easyocr_reader is None and self.easyocr_available:
+                try:
+                    import easyocr
+                    self.easyocr_reader = easyocr.Reader(['ch_sim', 'en'], gpu=False)
+                except Exception as e:
+                    print(f"EasyOCR 初始化失敗: {e}")
+                    self.easyocr_available = False
+            return self.easyocr_reader
+    
+    def warm_up(self):
+        """
+        在後台線程載入 EasyOCR 模型，第一次識別時不必等待模型載入
+        
+        返回:
+            threading.Thread：載入線程；未安裝 EasyOCR 或模型已載入時返回 None
+        """
+        if not self.easyocr_available or self.easyocr_reader is not None:
+            return None
+        thread = threading.Thread(target=self._init_easyocr, name='easyocr-warm-up', daemon=True)
+        thread.start()
+        return thread
+    
+    def load_model(self, mode=None):
+        """
+        按載入模式準備 EasyOCR 模型
+        
+        參數:
+            mode: OCR_LOAD_MODES 之一，None 表示讀取環境變數 PLANT_DIARY_OCR_LOAD
+        """
+        mode = mode or os.getenv('PLANT_DIARY_OCR_LOAD', 'lazy')
+        if mode not in OCR_LOAD_MODES:
+            print(f"未知的 OCR 載入模式 {mode!r}，改為第一次識別時載入")
+        elif mode == 'sync':
+            self._init_easyocr()
+        elif mode == 'background':
+            self.warm_up()
+    
+    def _after_fork(self):
+        """
+        在 fork 出的子進程中重建鎖
+        
+        fork 時若父進程的後台線程正在載入模型，鎖會以已鎖定狀態被複製，而載入線程不會
+        出現在子進程中；子進程改為在需要時自行載入。已載入的模型則直接共用。
+        """
+        self._easyocr_lock = threading.Lock()
+        if self.cache is not None:
+            self.cache._after_fork()
+    
+    @property
+    def model_loading(self):
+        """EasyOCR 已安裝但模型尚未載入完成"""
+        return self.easyocr_available and self.easyocr_reader is None
     
     def recognize_text(self, image_path, use_openai=False, openai_api_key=None):
         """
@@ -58,10 +164,35 @@ class OCRReader:
                 "raw_text": ""
             }
         
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        try:
+            return self.recognize_image(data, use_openai, openai_api_key)
+        except InvalidImageError as e:
+            return {
+                "success": False,
+                "error": f"圖片文件損壞或格式不支持: {str(e)}",
+                "chinese_name": "",
+                "scientific_name": "",
+                "raw_text": ""
+            }
+    
+    def recognize_image(self, image, use_openai=False, openai_api_key=None):
+        """
+        識別內存中圖片的文字（不寫臨時文件，圖片最多解碼一次）
+        
+        參數:
+            image: 圖片文件內容（bytes 等）、已解碼的 PIL 圖像或 NumPy 數組（RGB 或灰度）
+            use_openai: 是否使用 OpenAI API（更準確）
+            openai_api_key: OpenAI API 密鑰
+            
+        返回:
+            dict: 與 recognize_text 相同；bytes 無法解碼時拋出 InvalidImageError
+        """
         if use_openai and openai_api_key:
-            return self._recognize_with_openai(image_path, openai_api_key)
+            engine = f"openai-{OPENAI_OCR_MODEL}"
         elif self.easyocr_available:
-            return self._recognize_with_easyocr(image_path)
+            engine = "easyocr"
         else:
             return {
                 "success": False,
@@ -70,22 +201,58 @@ class OCRReader:
                 "scientific_name": "",
                 "raw_text": ""
             }
+        
+        raw = image if isinstance(image, (bytes, bytearray, memoryview)) else None
+        raw_hash = image_hash = None
+        if self.cache is not None:
+            # 完全相同的文件不需要解碼
+            if raw is not None:
+                raw_hash = raw_digest(raw)
+                result = self.cache.get_raw(raw_hash, engine, OCR_PARSER_VERSION)
+                if result is not None:
+                    return result
+                image = decode_image(raw)
+            image_hash = image_digest(image)
+            result = self.cache.get(image_hash, engine, OCR_PARSER_VERSION, raw_hash)
+            if result is not None:
+                return result
+        elif raw is not None and engine == "easyocr":
+            image = decode_image(raw)
+        
+        if engine == "easyocr":
+            result = self._recognize_with_easyocr(image)
+        else:
+            # 已編碼的文件直接發送給 OpenAI，不必重新編碼
+            result = self._recognize_with_openai(raw if raw is not None else image, openai_api_key)
+        
+        # 只緩存成功的結果，失敗（如網絡錯誤）時重試會重新識別
+        if self.cache is not None and result.get('success'):
+            self.cache.put(image_hash, engine, OCR_PARSER_VERSION, result, raw_hash)
+        return result
     
-    def _recognize_with_openai(self, image_path, api_key):
-        """使用 OpenAI Vision API 識別文字"""
+    def _recognize_with_openai(self, image, api_key):
+        """使用 OpenAI Vision API 識別文字（image 同 recognize_image）"""
         try:
             from openai import OpenAI
             import base64
             
             client = OpenAI(api_key=api_key)
             
-            # 讀取圖片並轉換為 base64
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+            # 已編碼的圖片直接發送，已解碼的圖像才需要編碼為 JPEG
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                data = bytes(image)
+            else:
+                from PIL import Image
+                if not isinstance(image, Image.Image):
+                    image = Image.fromarray(image)
+                buffer = io.BytesIO()
+                image.convert('RGB').save(buffer, 'JPEG', quality=95)
+                data = buffer.getvalue()
+            base64_image = base64.b64encode(data).decode('utf-8')
             
             # 調用 GPT-4 Vision API
             response = client.chat.completions.create(
-                model="gpt-4o",
+                model=OPENAI_OCR_MODEL,
                 messages=[
                     {
                         "role": "system",
@@ -162,25 +329,19 @@ class OCRReader:
                 "raw_text": ""
             }
     
-    def _recognize_with_easyocr(self, image_path):
-        """使用 EasyOCR 識別文字"""
+    def _recognize_with_easyocr(self, image):
+        """使用 EasyOCR 識別文字（image 同 recognize_image）"""
         try:
-            # 首先驗證圖片文件是否存在且可讀
-            if not os.path.exists(image_path):
-                return {
-                    "success": False,
-                    "error": "圖片文件不存在",
-                    "chinese_name": "",
-                    "scientific_name": "",
-                    "raw_text": ""
-                }
-            
-            # 使用 PIL 驗證圖片是否可以正確打開
+            # 解碼圖片（已解碼的圖像和數組直接使用）
             try:
+                import numpy as np
                 from PIL import Image
-                with Image.open(image_path) as img:
-                    # 驗證圖片是否有效
-                    img.verify()
+                if isinstance(image, (bytes, bytearray, memoryview)):
+                    image = decode_image(image)
+                elif isinstance(image, Image.Image) and image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                # EasyOCR 直接接受 RGB（或灰度）數組，不必再編碼成文件
+                pixels = np.asarray(image)
             except Exception as img_error:
                 return {
                     "success": False,
@@ -190,81 +351,61 @@ class OCRReader:
                     "raw_text": ""
                 }
             
-            # 重新打開圖片（因為 verify 後需要重新打開）
-            temp_path = None
-            try:
-                from PIL import Image
-                img = Image.open(image_path)
-                # 轉換為 RGB 模式（處理 RGBA 等模式）
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                # 保存為臨時文件（確保格式正確）
-                with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
-                    img.save(tmp_file.name, 'JPEG', quality=95)
-                    temp_path = tmp_file.name
-            except Exception as img_error:
+            # 模型尚未載入時在這裡載入
+            reader = self._init_easyocr()
+            if reader is None:
                 return {
                     "success": False,
-                    "error": f"圖片處理錯誤: {str(img_error)}",
+                    "error": "EasyOCR 模型載入失敗",
                     "chinese_name": "",
                     "scientific_name": "",
                     "raw_text": ""
                 }
+            results = reader.readtext(pixels)
             
-            try:
-                # 使用臨時文件進行識別
-                results = self.easyocr_reader.readtext(temp_path)
-                
-                # 提取所有識別的文字
-                all_text = []
-                all_text_for_display = []  # 用於顯示的完整文本（包含過濾詞）
-                
-                for (bbox, text, confidence) in results:
-                    # 降低置信度閾值，以獲取更多文字（0.2 而不是 0.3）
-                    if confidence > 0.2 and text and text.strip():
-                        text_clean = text.strip()
-                        # 保存所有文本用於顯示
-                        all_text_for_display.append(text_clean)
-                        
-                        # 預先定義的過濾詞（這些詞來自LOGO，不應該作為植物名稱）
-                        # 包括 OCR 可能的誤識別變體（如「花圈」、「花圜」誤識別為「花園」）
-                        filter_words = [
-                            '童話', '花園', '花圈', '花圜',  # 花圈、花圜是花園的OCR誤識別
-                            'QR', 'qr', 'code', 'Code', 'CODE',
-                            '童話花園', '花園童話', '童話 花園', '花園 童話',
-                            '童話花圈', '花圈童話', '童話 花圈', '花圈 童話',  # 花圈的組合
-                            '童話花圜', '花圜童話', '童話 花圜', '花圜 童話'  # 花圜的組合
-                        ]
-                        # 預先過濾：如果只是過濾詞，不加入解析列表
-                        if text_clean not in filter_words:
-                            all_text.append(text_clean)
-                
-                # 原始文本包含所有識別到的文字（用於顯示給用戶看）
-                raw_text = "\n".join(all_text_for_display) if all_text_for_display else ""
-                
-                # 調試信息
-                print(f"OCR識別到的文本列表: {all_text}")
-                print(f"OCR原始文本: {raw_text}")
-                
-                # 解析文字，識別中文名稱和學名
-                chinese_name, scientific_name = self._parse_plant_info(all_text)
-                
-                print(f"解析結果 - 中文名稱: {chinese_name}, 學名: {scientific_name}")
-                
-                return {
-                    "success": True,
-                    "error": "",
-                    "chinese_name": chinese_name,
-                    "scientific_name": scientific_name,
-                    "raw_text": raw_text
-                }
-            finally:
-                # 清理臨時文件
-                try:
-                    if 'temp_path' in locals() and os.path.exists(temp_path):
-                        os.unlink(temp_path)
-                except Exception:
-                    pass
+            # 提取所有識別的文字
+            all_text = []
+            all_text_for_display = []  # 用於顯示的完整文本（包含過濾詞）
+            
+            for (bbox, text, confidence) in results:
+                # 降低置信度閾值，以獲取更多文字（0.2 而不是 0.3）
+                if confidence > 0.2 and text and text.strip():
+                    text_clean = text.strip()
+                    # 保存所有文本用於顯示
+                    all_text_for_display.append(text_clean)
+                    
+                    # 預先定義的過濾詞（這些詞來自LOGO，不應該作為植物名稱）
+                    # 包括 OCR 可能的誤識別變體（如「花圈」、「花圜」誤識別為「花園」）
+                    filter_words = [
+                        '童話', '花園', '花圈', '花圜',  # 花圈、花圜是花園的OCR誤識別
+                        'QR', 'qr', 'code', 'Code', 'CODE',
+                        '童話花園', '花園童話', '童話 花園', '花園 童話',
+                        '童話花圈', '花圈童話', '童話 花圈', '花圈 童話',  # 花圈的組合
+                        '童話花圜', '花圜童話', '童話 花圜', '花圜 童話'  # 花圜的組合
+                    ]
+                    # 預先過濾：如果只是過濾詞，不加入解析列表
+                    if text_clean not in filter_words:
+                        all_text.append(text_clean)
+            
+            # 原始文本包含所有識別到的文字（用於顯示給用戶看）
+            raw_text = "\n".join(all_text_for_display) if all_text_for_display else ""
+            
+            # 調試信息
+            print(f"OCR識別到的文本列表: {all_text}")
+            print(f"OCR原始文本: {raw_text}")
+            
+            # 解析文字，識別中文名稱和學名
+            chinese_name, scientific_name = self._parse_plant_info(all_text)
+            
+            print(f"解析結果 - 中文名稱: {chinese_name}, 學名: {scientific_name}")
+            
+            return {
+                "success": True,
+                "error": "",
+                "chinese_name": chinese_name,
+                "scientific_name": scientific_name,
+                "raw_text": raw_text
+            }
             
         except Exception as e:
             return {
@@ -403,7 +544,23 @@ class OCRReader:
         }
 
 
+_ocr_reader_instance = None
+_ocr_reader_lock = threading.Lock()
+
+
 def get_ocr_reader():
-    """獲取 OCR 識別器實例"""
-    return OCRReader()
+    """
+    獲取全局 OCR 識別器實例
+    
+    同一進程內只有一個實例，EasyOCR 模型只載入一次；模型在第一次識別時載入，
+    需要提前載入時調用 load_model() 或 warm_up()。識別結果緩存在 ocr_cache.db
+    （見 ocr_cache.get_ocr_cache）。
+    """
+    global _ocr_reader_instance
+    with _ocr_reader_lock:
+        if _ocr_reader_instance is None:
+            _ocr_reader_instance = OCRReader(cache=get_ocr_cache())
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=_ocr_reader_instance._after_fork)
+    return _ocr_reader_instance
 
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+植物日記 - 孤兒文件清理模組
+刪除照片目錄中已沒有照片記錄引用的文件（刪除植物後留下的照片、識別失敗留下的
+temp_*.jpg、中斷的上傳臨時文件等），以及對應的縮略圖和冷存儲中的原始文件。
+已打包的照片從 pack 索引中移除，pack 中的數據由 python -m plant_diary.pack_store compact 回收
+
+清理時一次讀出 photos 表引用的所有文件名和哈希放入集合，再與目錄逐個比對，
+不會對每個文件單獨查詢數據庫。刪除前按批再確認一次內容哈希，避免誤刪清理期間
+剛被重複上傳引用的文件；修改時間在寬限期內的文件（可能正在上傳）不會被刪除。
+
+多個 gunicorn worker 都可以調用 start：傳入 lock_path 時，只有取得該文件 flock 的
+worker 執行定期清理，它退出後由其他 worker 在下一個間隔接手。
+
+手動執行（--dry-run 只報告不刪除）:
+    python -m plant_diary.orphan_gc --db plant_diary.db --photos-dir plant_photos --dry-run
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from plant_diary.database import PlantDatabase
+    from plant_diary.photo_store import PhotoStore
+    from plant_diary.thumbnails import ThumbnailStore
+    from plant_diary.pack_store import PackStore, PACK_DIR_NAME
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).parent))
+    from database import PlantDatabase
+    from photo_store import PhotoStore
+    from thumbnails import ThumbnailStore
+    from pack_store import PackStore, PACK_DIR_NAME
+
+
+# 修改時間在此時間（秒）內的文件不會被當作孤兒文件
+GRACE_SECONDS = 3600
+# 每批處理的文件數，批與批之間可以暫停，避免長時間佔用磁盤
+GC_BATCH_SIZE = 500
+# 報告中最多列出的文件數
+REPORT_EXAMPLES = 20
+
+# 由分塊上傳模組自行清理的目錄，以及 pack 文件目錄（其中的照片不是獨立文件）
+_SKIP_DIRS = {'.uploads', '.packs'}
+
+
+def _iter_files(root, skip_dirs=()):
+    """遞歸列出目錄下的文件，返回 os.DirEntry（逐個生成，不會一次讀入整個目錄樹）"""
+    try:
+        entries = os.scandir(root)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in skip_dirs:
+                    yield from _iter_files(entry.path, skip_dirs)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def _basename(photo_path):
+    """取數據庫中照片路徑的文件名"""
+    return photo_path.replace('\\', '/').rsplit('/', 1)[-1]
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class OrphanCollector:
+    """照片目錄的孤兒文件清理"""
+    
+    def __init__(self, db, photo_store, thumbnails=None, originals_store=None,
+                 grace_seconds=GRACE_SECONDS, pack_store=None):
+        """
+        參數:
+            db: PlantDatabase 實例
+            photo_store: 照片的 PhotoStore
+            thumbnails: 可選，ThumbnailStore，同時清理孤兒縮略圖
+            originals_store: 可選，原始文件冷存儲的 PhotoStore
+            grace_seconds: 寬限期（秒），較新的文件不清理
+            pack_store: 可選，照片目錄的 PackStore，同時清理已打包的孤兒照片
+        """
+        self.db = db
+        self.photo_store = photo_store
+        self.thumbnails = thumbnails
+        self.originals_store = originals_store
+        self.grace_seconds = grace_seconds
+        self.pack_store = pack_store
+        # 同一時間只執行一次清理
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._dry_run_seen = set()
+        self._run_lock_file = None
+    
+    def _after_fork(self):
+        """
+        在 fork 出的子進程中重建鎖和後台線程狀態
+        
+        fork 時父進程的清理線程可能正持有鎖，而該線程不會出現在子進程中。
+        """
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._run_lock_file = None
+    
+    def _acquire_run_lock(self, lock_path):
+        """
+        取得定期清理的跨進程文件鎖（取得後一直持有到進程退出）
+        
+        返回:
+            bool: 本進程是否負責定期清理；沒有 fcntl（Windows）時總是 True
+        """
+        if self._run_lock_file is not None or fcntl is None:
+            return True
+        f = open(lock_path, 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._run_lock_file = f
+        return True
+    
+    def _new_report(self, dry_run):
+        return {
+            'dry_run': dry_run,
+            'scanned': 0,
+            'orphans': 0,
+            'deleted': 0,
+            'failed': 0,
+            'reclaimed_bytes': 0,
+            'queued': 0,
+            'packed': 0,
+            'pack_dead_bytes': 0,
+            'examples': []
+        }
+    
+    def _remove(self, entry_path, size, report, dry_run):
+        """刪除一個孤兒文件並記入報告（dry_run 時只記錄）"""
+        if dry_run:
+            # 不刪除時，隊列中的文件在掃描目錄時還會再遇到一次，不重複計算
+            key = os.path.abspath(entry_path)
+            if key in self._dry_run_seen:
+                return
+            self._dry_run_seen.add(key)
+        report['orphans'] += 1
+        if len(report['examples']) < REPORT_EXAMPLES:
+            report['examples'].append(str(entry_path))
+        if dry_run:
+            report['reclaimed_bytes'] += size
+            return
+        try:
+            os.unlink(entry_path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            report['failed'] += 1
+            print(f"刪除孤兒文件失敗 {entry_path}: {e}")
+            return
+        report['deleted'] += 1
+        report['reclaimed_bytes'] += size
+    
+    def _remove_stored(self, path, cutoff, report, dry_run):
+        """
+        刪除照片存儲中的一個孤兒文件：持有存儲的鎖確認修改時間仍早於 cutoff 後再刪除
+        
+        重複上傳沿用已有文件時會在同一把鎖內更新其修改時間（PhotoStore.reuse），
+        所以新的引用寫入數據庫之前文件不會被刪除。
+        
+        返回:
+            str: 'removed'、'recent'（在寬限期內，暫不刪除）或 'missing'
+        """
+        with self.photo_store.lock:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return 'missing'
+            if stat.st_mtime >= cutoff:
+                return 'recent'
+            self._remove(path, stat.st_size, report, dry_run)
+        return 'removed'
+    
+    def _remove_packed(self, name, report, dry_run):
+        """
+        從 pack 索引中移除一張孤兒照片並記入報告（dry_run 時只記錄）
+        
+        數據留在 pack 中成為死數據（計入 pack_dead_bytes），由 PackStore.compact 回收。
+        
+        返回:
+            bool: 照片是否在 pack 中
+        """
+        entry = self.pack_store.lookup(name)
+        if entry is None:
+            return False
+        if dry_run:
+            key = (PACK_DIR_NAME, name)
+            if key in self._dry_run_seen:
+                return True
+            self._dry_run_seen.add(key)
+        report['orphans'] += 1
+        report['packed'] += 1
+        report['pack_dead_bytes'] += entry[2]
+        if len(report['examples']) < REPORT_EXAMPLES:
+            report['examples'].append(f"{PACK_DIR_NAME}/{name}")
+        if not dry_run:
+            self.pack_store.remove([name])
+            report['deleted'] += 1
+        return True
+    
+    def drain_queue(self, dry_run=False, batch_size=GC_BATCH_SIZE, report=None):
+        """
+        處理刪除植物或照片時加入隊列的照片文件：沒有其他記錄引用時刪除文件和縮略圖
+        
+        修改時間在寬限期內的文件（剛被重複上傳沿用）留在隊列中，下次處理時再確認。
+        
+        返回:
+            dict: 清理報告
+        """
+        report = report or self._new_report(dry_run)
+        cutoff = time.time() - self.grace_seconds
+        seen = set()
+        while True:
+            paths = [p for p in self.db.get_file_deletions(batch_size + len(seen)) if p not in seen]
+            paths = paths[:batch_size]
+            if not paths:
+                break
+            seen.update(paths)
+            report['queued'] += len(paths)
+            
+            # 每批兩次查詢：路徑仍被引用，或內容被其他路徑的記錄引用
+            still_used = self.db.filter_referenced_paths(paths)
+            hashes = {p: self.photo_store.content_hash_of(_basename(p)) for p in paths}
+            used_hashes = self.db.filter_referenced_hashes(h for h in hashes.values() if h)
+            deferred = set()
+            for path in paths:
+                if path in still_used or hashes[path] in used_hashes:
+                    continue
+                status = self._remove_stored(path, cutoff, report, dry_run)
+                if status == 'recent':
+                    deferred.add(path)
+                    continue
+                # 已打包的照片沒有獨立文件，從 pack 索引中移除，之後不能再通過網址讀取
+                packed = self.pack_store is not None and self._remove_packed(_basename(path), report, dry_run)
+                if (status == 'removed' or packed) and self.thumbnails is not None and not dry_run:
+                    self.thumbnails.delete(path)
+            if not dry_run:
+                self.db.remove_file_deletions([p for p in paths if p not in deferred])
+        return report
+    
+    def run(self, dry_run=False, batch_size=GC_BATCH_SIZE, pause=0.0):
+        """
+        執行一次完整清理：先處理待刪除隊列，再掃描照片、縮略圖和原始文件目錄
+        
+        參數:
+            dry_run: 為 True 時只報告會被刪除的文件和可回收的空間，不刪除
+            batch_size: 每批處理的文件數
+            pause: 每批之間暫停的秒數（後台執行時讓出磁盤）
+        
+        返回:
+            dict: 清理報告，包含掃描數、孤兒文件數、刪除數和回收的字節數
+        """
+        with self._lock:
+            started = time.time()
+            self._dry_run_seen = set()
+            report = self.drain_queue(dry_run, batch_size)
+            
+            # 照片記錄引用的文件名和哈希（一次查詢），比對時用集合查找
+            paths, hashes, original_hashes = self.db.get_file_references()
+            # 直接切字符串取文件名，比逐個建立 Path 快得多（也兼容 Windows 上保存的反斜杠路徑）
+            names = {_basename(p) for p in paths}
+            del paths
+            cutoff = started - self.grace_seconds
+            
+            self._scan_photos(names, hashes, cutoff, report, dry_run, batch_size, pause)
+            if self.pack_store is not None:
+                self._scan_packed(names, hashes, cutoff, report, dry_run, batch_size, pause)
+            if self.thumbnails is not None:
+                self._scan_thumbnails(names, cutoff, report, dry_run, batch_size, pause)
+            if self.originals_store is not None:
+                self._scan_originals(original_hashes, cutoff, report, dry_run, batch_size, pause)
+            
+            self._dry_run_seen = set()
+            report['seconds'] = round(time.time() - started, 3)
+            action = "可回收" if dry_run else "已回收"
+            print(f"孤兒文件清理：掃描 {report['scanned']} 個文件，孤兒文件 {report['orphans']} 個，"
+                  f"{action} {report['reclaimed_bytes'] / (1024 * 1024):.1f} MB")
+            if report['packed']:
+                print(f"其中已打包的照片 {report['packed']} 張，"
+                      f"{report['pack_dead_bytes'] / (1024 * 1024):.1f} MB 需由 pack_store compact 回收")
+            return report
+    
+    def _candidates(self, root, is_referenced, cutoff, report, batch_size, skip_dirs=()):
+        """按批列出目錄中未被引用、且超過寬限期的文件 (路徑, 文件名, 大小)"""
+        def candidates():
+            for entry in _iter_files(root, skip_dirs):
+                report['scanned'] += 1
+                if is_referenced(entry.name):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime < cutoff:
+                    yield entry.path, entry.name, stat.st_size
+        return _batches(candidates(), batch_size)
+    
+    def _scan_photos(self, names, hashes, cutoff, report, dry_run, batch_size, pause):
+        """照片目錄：文件名和內容哈希都沒有被引用的文件"""
+        store = self.photo_store
+        
+        def is_referenced(name):
+            return name in names or store.content_hash_of(name) in hashes
+        
+        for batch in self._candidates(store.root, is_referenced, cutoff, report, batch_size, _SKIP_DIRS):
+            # 掃描期間可能有重複上傳引用了已有的內容，刪除前按批再確認一次
+            batch_hashes = {store.content_hash_of(name) for _, name, _ in batch} - {None}
+            used_hashes = self.db.filter_referenced_hashes(batch_hashes)
+            for path, name, _ in batch:
+                if store.content_hash_of(name) not in used_hashes:
+                    self._remove_stored(path, cutoff, report, dry_run)
+            if pause:
+                time.sleep(pause)
+    
+    def _scan_packed(self, names, hashes, cutoff, report, dry_run, batch_size, pause):
+        """pack 中的照片：文件名和內容哈希都沒有被引用、且打包前的修改時間超過寬限期時移除"""
+        store = self.photo_store
+        
+        def candidates():
+            for name, _, mtime in self.pack_store.entries():
+                report['scanned'] += 1
+                if name in names or store.content_hash_of(name) in hashes:
+                    continue
+                if mtime < cutoff:
+                    yield name
+        
+        for batch in _batches(candidates(), batch_size):
+            batch_hashes = {store.content_hash_of(name) for name in batch} - {None}
+            used_hashes = self.db.filter_referenced_hashes(batch_hashes)
+            for name in batch:
+                if store.content_hash_of(name) not in used_hashes:
+                    self._remove_packed(name, report, dry_run)
+            if pause:
+                time.sleep(pause)
+    
+    def _scan_thumbnails(self, names, cutoff, report, dry_run, batch_size, pause):
+        """縮略圖目錄：<照片文件名>.<格式>，照片文件名沒有被引用時刪除"""
+        def is_referenced(name):
+            return name.rsplit('.', 1)[0] in names
+        
+        for batch in self._candidates(self.thumbnails.thumbs_dir, is_referenced, cutoff, report, batch_size):
+            for path, _, size in batch:
+                self._remove(path, size, report, dry_run)
+            if pause:
+                time.sleep(pause)
+    
+    def _scan_originals(self, original_hashes, cutoff, report, dry_run, batch_size, pause):
+        """原始文件冷存儲：original_hash 沒有被引用的文件"""
+        store = self.originals_store
+        
+        def is_referenced(name):
+            return store.content_hash_of(name) in original_hashes
+        
+        for batch in self._candidates(store.root, is_referenced, cutoff, report, batch_size, _SKIP_DIRS):
+            batch_hashes = {store.content_hash_of(name) for _, name, _ in batch} - {None}
+            used_hashes = self.db.filter_referenced_hashes(batch_hashes, column='original_hash')
+            for path, name, size in batch:
+                if store.content_hash_of(name) not in used_hashes:
+                    self._remove(path, size, report, dry_run)
+            if pause:
+                time.sleep(pause)
+    
+    def drain_queue_async(self):
+        """在後台線程處理待刪除隊列（刪除植物或照片後調用，不阻塞請求）"""
+        def work():
+            with self._lock:
+                try:
+                    report = self.drain_queue()
+                    if report['deleted']:
+                        print(f"已刪除 {report['deleted']} 個照片文件，"
+                              f"回收 {report['reclaimed_bytes'] / (1024 * 1024):.1f} MB")
+                except Exception as e:
+                    print(f"處理待刪除照片失敗: {e}")
+        threading.Thread(target=work, daemon=True).start()
+    
+    def start(self, interval, dry_run=False, pause=0.05, lock_path=None):
+        """
+        啟動後台定期清理
+        
+        參數:
+            interval: 兩次清理之間的間隔（秒）
+            dry_run: 只報告不刪除
+            pause: 每批之間暫停的秒數
+            lock_path: 可選，多個進程共用的鎖文件，只有取得鎖的進程執行清理
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        
+        def loop():
+            while not self._stop.wait(interval):
+                if lock_path is not None and not self._acquire_run_lock(lock_path):
+                    continue
+                try:
+                    self.run(dry_run=dry_run, pause=pause)
+                except Exception as e:
+                    print(f"孤兒文件清理失敗: {e}")
+        
+        self._thread = threading.Thread(target=loop, name='orphan-gc', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """停止後台定期清理"""
+        self._stop.set()
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="清理沒有照片記錄引用的照片文件")
+    parser.add_argument('--db', default="plant_diary.db", help="數據庫文件路徑")
+    parser.add_argument('--photos-dir', default="plant_photos", help="照片目錄")
+    parser.add_argument('--thumbs-dir', default="plant_thumbs", help="縮略圖目錄")
+    parser.add_argument('--originals-dir', help="原始文件冷存儲目錄（可選）")
+    parser.add_argument('--grace', type=int, default=GRACE_SECONDS, help="寬限期（秒），較新的文件不清理")
+    parser.add_argument('--dry-run', action='store_true', help="只報告會被刪除的文件，不刪除")
+    args = parser.parse_args(argv)
+    
+    db = PlantDatabase(args.db)
+    photos_dir = Path(args.photos_dir).absolute()
+    pack_store = PackStore(photos_dir / PACK_DIR_NAME)
+    try:
+        collector = OrphanCollector(
+            db,
+            PhotoStore(photos_dir),
+            thumbnails=ThumbnailStore(args.thumbs_dir),
+            originals_store=PhotoStore(args.originals_dir) if args.originals_dir else None,
+            grace_seconds=args.grace,
+            pack_store=pack_store
+        )
+        report = collector.run(dry_run=args.dry_run)
+        for path in report['examples']:
+            print(f"  {path}")
+        if report['orphans'] > len(report['examples']):
+            print(f"  ……共 {report['orphans']} 個")
+    finally:
+        pack_store.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
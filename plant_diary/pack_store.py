@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+植物日記 - 照片打包存儲模組
+把較舊的照片文件合併進只追加的 pack 文件，減少照片目錄中的小文件（inode）數量
+
+新照片和縮略圖仍是獨立文件；超過一定天數的照片被追加到 <照片目錄>/.packs/pack-NNNNNN.pack，
+每張照片在 pack 中的位置（偏移量和長度）記錄在同目錄的 index.db 中。讀取時用 mmap
+映射 pack 文件，按偏移量直接切片，不需要 seek/read 複製數據。
+
+刪除已打包的照片（由孤兒文件清理執行）只移除索引條目，數據留在 pack 中成為死數據，
+由 compact 把仍有效的照片複製到新的 pack 後刪除舊 pack 回收空間。
+
+打包舊照片（先確保縮略圖已生成，可中斷後重新執行；只打包仍被照片記錄引用的文件，
+孤兒文件留給孤兒文件清理刪除）:
+    python -m plant_diary.pack_store pack --db plant_diary.db --photos-dir plant_photos --days 90
+
+回收已刪除照片佔用的空間:
+    python -m plant_diary.pack_store compact --photos-dir plant_photos
+"""
+
+import argparse
+import io
+import mmap
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+try:
+    from plant_diary.database import PlantDatabase
+    from plant_diary.photo_store import PhotoStore, CHUNK_SIZE
+    from plant_diary.thumbnails import ThumbnailStore, PHOTO_EXTENSIONS
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).parent))
+    from database import PlantDatabase
+    from photo_store import PhotoStore, CHUNK_SIZE
+    from thumbnails import ThumbnailStore, PHOTO_EXTENSIONS
+
+
+# 單個 pack 文件的最大大小（字節），超過後新建下一個
+PACK_MAX_SIZE = 256 * 1024 * 1024
+# 默認打包多少天以前的照片
+DEFAULT_PACK_DAYS = 90
+# 死數據超過 pack 大小的這個比例時 compact 才重寫該 pack
+DEFAULT_COMPACT_RATIO = 0.25
+# pack 目錄名（位於照片目錄下）
+PACK_DIR_NAME = '.packs'
+
+# 不打包的目錄：臨時文件、分塊上傳和 pack 本身
+_SKIP_DIRS = {'.tmp', '.uploads', PACK_DIR_NAME}
+
+
+class PackedFile(io.RawIOBase):
+    """pack 中一張照片的只讀文件對象（基於 mmap，可 seek，供 PIL、tarfile 等使用）"""
+    
+    def __init__(self, view):
+        """
+        參數:
+            view: 照片在 pack 的 mmap 上的 memoryview
+        """
+        super().__init__()
+        self._view = view
+        self._pos = 0
+    
+    def __len__(self):
+        return len(self._view)
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def readinto(self, buffer):
+        data = self._view[self._pos:self._pos + len(buffer)]
+        n = len(data)
+        buffer[:n] = data
+        self._pos += n
+        return n
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+    
+    def tell(self):
+        return self._pos
+    
+    def iter_range(self, start=0, stop=None, chunk_size=CHUNK_SIZE):
+        """
+        按塊生成 [start, stop) 範圍的數據
+        
+        切片直接取自 mmap（頁面緩存），沒有 read 系統調用和中間緩衝區；
+        WSGI 要求響應體為 bytes，每塊在交給服務器時生成一次。
+        """
+        stop = len(self._view) if stop is None else min(stop, len(self._view))
+        for pos in range(start, stop, chunk_size):
+            yield self._view[pos:min(pos + chunk_size, stop)].tobytes()
+
+
+class PackStore:
+    """只追加的照片 pack 文件和偏移量索引"""
+    
+    def __init__(self, pack_dir):
+        """
+        參數:
+            pack_dir: pack 文件和 index.db 所在目錄
+        """
+        self.pack_dir = Path(pack_dir)
+        self.index_path = self.pack_dir / 'index.db'
+        self._lock = threading.Lock()
+        self._conn = None
+        self._maps = {}  # pack 文件名 -> mmap
+    
+    def _after_fork(self):
+        """在 fork 出的子進程中重建鎖並放棄父進程的索引連接（不關閉），之後重新連接；mmap 可以共用"""
+        self._lock = threading.Lock()
+        self._conn = None
+    
+    def _connection(self):
+        """索引數據庫連接（第一次使用時創建，避免沒有打包過的目錄多出空的 pack 目錄）"""
+        if self._conn is None:
+            self.pack_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.index_path), check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    name TEXT PRIMARY KEY,
+                    pack TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    mtime REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+    
+    def lookup(self, name):
+        """
+        查找照片在 pack 中的位置
+        
+        返回:
+            tuple: (pack 文件名, 偏移量, 長度, 原修改時間)；沒有打包時返回 None
+        """
+        if self._conn is None and not self.index_path.exists():
+            return None
+        with self._lock:
+            return self._lookup(name)
+    
+    def _lookup(self, name):
+        """查找照片在 pack 中的位置（調用者需持有鎖）"""
+        return self._connection().execute(
+            'SELECT pack, offset, length, mtime FROM entries WHERE name = ?', (name,)
+        ).fetchone()
+    
+    def entries(self):
+        """
+        返回所有已打包的照片
+        
+        返回:
+            list: [(照片文件名, 長度, 原修改時間), ...]
+        """
+        if self._conn is None and not self.index_path.exists():
+            return []
+        with self._lock:
+            return self._connection().execute('SELECT name, length, mtime FROM entries').fetchall()
+    
+    def remove(self, names):
+        """
+        從索引中移除照片（數據留在 pack 中成為死數據，由 compact 回收）
+        
+        參數:
+            names: 照片文件名
+        
+        返回:
+            int: 移除的照片佔用的字節數
+        """
+        names = list(names)
+        if not names or (self._conn is None and not self.index_path.exists()):
+            return 0
+        conn = self._connection()
+        removed = 0
+        with self._lock:
+            for name in names:
+                row = conn.execute('SELECT length FROM entries WHERE name = ?', (name,)).fetchone()
+                if row is not None:
+                    conn.execute('DELETE FROM entries WHERE name = ?', (name,))
+                    removed += row[0]
+            conn.commit()
+        return removed
+    
+    def _map(self, pack, end):
+        """取得 pack 文件的 mmap；pack 在映射後又追加過數據時重新映射"""
+        mapped = self._maps.get(pack)
+        if mapped is None or len(mapped) < end:
+            with open(self.pack_dir / pack, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # 舊的映射可能仍被正在發送的響應使用，不主動關閉，無引用後自動釋放
+            self._maps[pack] = mapped
+        return mapped
+    
+    def open(self, name):
+        """
+        打開 pack 中的照片
+        
+        返回:
+            tuple: (PackedFile, 原修改時間)；沒有打包時返回 (None, None)
+        """
+        if self._conn is None and not self.index_path.exists():
+            return None, None
+        # 查找和映射在同一次加鎖中完成，compact 不會在兩者之間刪除舊 pack
+        with self._lock:
+            entry = self._lookup(name)
+            if entry is None:
+                return None, None
+            pack, offset, length, mtime = entry
+            mapped = self._map(pack, offset + length)
+        return PackedFile(memoryview(mapped)[offset:offset + length]), mtime
+    
+    def _current_pack(self, conn, incoming):
+        """返回要追加到的 pack 文件名（最後一個 pack 放不下時新建）"""
+        row = conn.execute('SELECT pack FROM entries ORDER BY pack DESC LIMIT 1').fetchone()
+        number = int(row[0][5:11]) if row else 1
+        pack = f"pack-{number:06d}.pack"
+        path = self.pack_dir / pack
+        if path.exists() and path.stat().st_size > 0 and path.stat().st_size + incoming > PACK_MAX_SIZE:
+            pack = f"pack-{number + 1:06d}.pack"
+        return pack
+    
+    def append(self, files):
+        """
+        把一批文件追加到 pack 並寫入索引
+        
+        數據先寫入並 fsync，索引提交後調用者才刪除原文件；中途中斷時 pack 末尾
+        可能留下沒有索引的數據，不影響已有的照片。
+        
+        參數:
+            files: [(照片文件名, 文件路徑), ...]
+        
+        返回:
+            int: 追加的字節數
+        """
+        conn = self._connection()
+        files = [(name, Path(path)) for name, path in files]
+        sizes = [path.stat() for _, path in files]
+        with self._lock:
+            pack = self._current_pack(conn, sum(st.st_size for st in sizes))
+            rows = []
+            with open(self.pack_dir / pack, 'ab') as out:
+                offset = out.tell()
+                for (name, path), st in zip(files, sizes):
+                    with open(path, 'rb') as f:
+                        length = 0
+                        while True:
+                            chunk = f.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            out.write(chunk)
+                            length += len(chunk)
+                    rows.append((name, pack, offset, length, st.st_mtime))
+                    offset += length
+                out.flush()
+                os.fsync(out.fileno())
+            conn.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)', rows)
+            conn.commit()
+        return sum(row[3] for row in rows)
+    
+    def _pack_usage(self, conn):
+        """返回 {pack 文件名: (文件大小, 有效數據字節數)}（調用者需持有鎖）"""
+        live = dict(conn.execute('SELECT pack, SUM(length) FROM entries GROUP BY pack'))
+        return {path.name: (path.stat().st_size, live.get(path.name, 0))
+                for path in sorted(self.pack_dir.glob('pack-*.pack'))}
+    
+    def stats(self):
+        """返回 pack 文件數、照片數、有效數據字節數和死數據字節數（可由 compact 回收）"""
+        if self._conn is None and not self.index_path.exists():
+            return {'packs': 0, 'photos': 0, 'bytes': 0, 'dead_bytes': 0}
+        with self._lock:
+            conn = self._connection()
+            photos, total = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(length), 0) FROM entries').fetchone()
+            usage = self._pack_usage(conn)
+        dead = sum(size - live for size, live in usage.values())
+        return {'packs': len(usage), 'photos': photos, 'bytes': total, 'dead_bytes': dead}
+    
+    def compact(self, min_dead_ratio=DEFAULT_COMPACT_RATIO):
+        """
+        重寫死數據比例達到 min_dead_ratio 的 pack，回收已刪除照片佔用的空間
+        
+        仍有效的照片複製到新的 pack 並 fsync，索引在一個事務中改為指向新位置後才刪除
+        舊 pack；中途中斷時舊 pack 和索引保持不變，新 pack 末尾只多出沒有索引的數據。
+        執行期間持有鎖，讀取和打包會等待。
+        
+        參數:
+            min_dead_ratio: 死數據佔 pack 大小的比例下限
+        
+        返回:
+            dict: 重寫的 pack 數和回收的字節數
+        """
+        result = {'packs': 0, 'reclaimed_bytes': 0}
+        if self._conn is None and not self.index_path.exists():
+            return result
+        conn = self._connection()
+        with self._lock:
+            usage = self._pack_usage(conn)
+            last = max((int(pack[5:11]) for pack in usage), default=0)
+            for pack, (size, live) in usage.items():
+                if size == 0 or (size - live) / size < min_dead_ratio:
+                    continue
+                rows = conn.execute('SELECT name, offset, length FROM entries WHERE pack = ? ORDER BY offset',
+                                    (pack,)).fetchall()
+                updates = []
+                if rows:
+                    last += 1
+                    new_pack = f"pack-{last:06d}.pack"
+                    mapped = self._map(pack, size)
+                    with open(self.pack_dir / new_pack, 'ab') as out:
+                        new_offset = out.tell()
+                        for name, offset, length in rows:
+                            out.write(mapped[offset:offset + length])
+                            updates.append((new_pack, new_offset, name))
+                            new_offset += length
+                        out.flush()
+                        os.fsync(out.fileno())
+                conn.executemany('UPDATE entries SET pack = ?, offset = ? WHERE name = ?', updates)
+                conn.commit()
+                # 舊的映射可能仍被正在發送的響應使用，不主動關閉，無引用後自動釋放
+                self._maps.pop(pack, None)
+                (self.pack_dir / pack).unlink()
+                result['packs'] += 1
+                result['reclaimed_bytes'] += size - live
+        return result
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._maps.clear()
+
+
+def open_photo(photo_path, pack_store=None):
+    """
+    打開照片文件，獨立文件不存在時從 pack 中讀取
+    
+    參數:
+        photo_path: 數據庫中的照片路徑
+        pack_store: 可選，照片目錄的 PackStore
+    
+    返回:
+        二進制文件對象；兩處都沒有時拋出 FileNotFoundError
+    """
+    try:
+        return open(photo_path, 'rb')
+    except FileNotFoundError:
+        if pack_store is None:
+            raise
+        packed, _ = pack_store.open(Path(photo_path).name)
+        if packed is None:
+            raise
+        return packed
+
+
+def pack_cold_photos(photos_dir, pack_store, db, days=DEFAULT_PACK_DAYS, thumbnails=None,
+                     batch_size=200):
+    """
+    把修改時間早於 days 天、且仍被照片記錄引用的照片移入 pack 文件
+    
+    沒有被引用的文件（孤兒文件、剛刪除還在待刪除隊列中的照片）不打包，留給孤兒文件清理刪除。
+    
+    參數:
+        photos_dir: 照片目錄
+        pack_store: PackStore
+        db: PlantDatabase 實例
+        days: 打包多少天以前的照片
+        thumbnails: 可選，ThumbnailStore；打包前先補齊縮略圖，之後縮略圖無需再讀原照片
+        batch_size: 每批處理的文件數（每批一次 fsync 和一次索引提交）
+    
+    返回:
+        dict: 打包的照片數、字節數、跳過的未引用文件數和失敗數
+    """
+    cutoff = time.time() - days * 24 * 3600
+    result = {'packed': 0, 'bytes': 0, 'unreferenced': 0, 'failed': 0}
+    store = PhotoStore(photos_dir)
+    
+    # 照片記錄引用的文件名和哈希（一次查詢），與孤兒文件清理一樣用集合比對
+    paths, hashes, _ = db.get_file_references()
+    names = {p.replace('\\', '/').rsplit('/', 1)[-1] for p in paths}
+    del paths
+    
+    def cold_files():
+        for dirpath, dirnames, filenames in os.walk(photos_dir):
+            dirnames[:] = [d for d in dirnames if d not in _SKIP_DIRS]
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                if path.suffix.lower() in PHOTO_EXTENSIONS and path.stat().st_mtime < cutoff:
+                    yield filename, path
+    
+    def candidates():
+        for name, path in cold_files():
+            if name in names or store.content_hash_of(name) in hashes:
+                yield name, path
+            else:
+                result['unreferenced'] += 1
+    
+    batch = []
+    
+    def flush():
+        # 掃描期間照片可能已被刪除，打包前按批再確認一次
+        batch_hashes = {store.content_hash_of(name) for name, _ in batch} - {None}
+        used_hashes = db.filter_referenced_hashes(batch_hashes)
+        kept = [(name, path) for name, path in batch
+                if store.content_hash_of(name) in used_hashes or store.content_hash_of(name) is None]
+        result['unreferenced'] += len(batch) - len(kept)
+        batch[:] = kept
+        if not batch:
+            return
+        appended = pack_store.append(batch)
+        # 索引已提交，刪除原文件
+        for _, path in batch:
+            path.unlink()
+        result['packed'] += len(batch)
+        result['bytes'] += appended
+        print(f"已打包 {result['packed']} 張照片")
+        batch.clear()
+    
+    for name, path in candidates():
+        if pack_store.lookup(name) is not None:
+            # 上次打包後還沒來得及刪除的文件
+            path.unlink()
+            continue
+        if thumbnails is not None:
+            try:
+                thumbnails.generate(path)
+            except Exception as e:
+                result['failed'] += 1
+                print(f"生成縮略圖失敗，跳過 {path}: {e}")
+                continue
+        batch.append((name, path))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return result
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="照片 pack 存儲工具")
+    parser.add_argument('--db', default="plant_diary.db", help="數據庫文件路徑")
+    parser.add_argument('--photos-dir', default="plant_photos", help="照片目錄")
+    parser.add_argument('--thumbs-dir', default="plant_thumbs", help="縮略圖目錄")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    pack_parser = subparsers.add_parser('pack', help="把舊照片移入 pack 文件")
+    pack_parser.add_argument('--days', type=int, default=DEFAULT_PACK_DAYS,
+                             help=f"打包多少天以前的照片（默認 {DEFAULT_PACK_DAYS}）")
+    compact_parser = subparsers.add_parser('compact', help="重寫含有已刪除照片的 pack，回收空間")
+    compact_parser.add_argument('--min-dead-ratio', type=float, default=DEFAULT_COMPACT_RATIO,
+                                help=f"死數據佔 pack 大小的比例達到多少才重寫（默認 {DEFAULT_COMPACT_RATIO}）")
+    subparsers.add_parser('stats', help="顯示 pack 統計")
+    args = parser.parse_args(argv)
+    
+    photos_dir = Path(args.photos_dir).absolute()
+    pack_store = PackStore(photos_dir / PACK_DIR_NAME)
+    try:
+        if args.command == 'pack':
+            db = PlantDatabase(args.db)
+            try:
+                result = pack_cold_photos(photos_dir, pack_store, db, args.days,
+                                          ThumbnailStore(args.thumbs_dir))
+            finally:
+                db.close()
+            print(f"打包完成：{result['packed']} 張照片，{result['bytes'] / (1024 * 1024):.1f} MB，"
+                  f"跳過未引用的文件 {result['unreferenced']} 個，失敗 {result['failed']} 張")
+        elif args.command == 'compact':
+            result = pack_store.compact(args.min_dead_ratio)
+            print(f"整理完成：重寫 {result['packs']} 個 pack，"
+                  f"回收 {result['reclaimed_bytes'] / (1024 * 1024):.1f} MB")
+        stats = pack_store.stats()
+        print(f"pack 文件 {stats['packs']} 個，照片 {stats['photos']} 張，"
+              f"共 {stats['bytes'] / (1024 * 1024):.1f} MB，"
+              f"已刪除照片的死數據 {stats['dead_bytes'] / (1024 * 1024):.1f} MB")
+    finally:
+        pack_store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+植物日記 - 照片存儲模組
+按內容的 SHA-256 存儲照片文件，相同的照片只保存一份
+
+照片保存在 <照片目錄>/<哈希前 2 位>/<哈希第 3-4 位>/<哈希>.<擴展名>，
+例如 plant_photos/3f/a2/3fa2....jpg。photos 表的 content_hash 欄位記錄每條照片
+記錄引用的內容，同一內容的記錄數即為引用計數，降到 0 時才刪除文件。
+
+將舊的平鋪照片遷移到新目錄結構（可中斷後重新執行）:
+    python -m plant_diary.photo_store migrate --db plant_diary.db --photos-dir plant_photos
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import threading
+import uuid
+from pathlib import Path
+
+try:
+    from plant_diary.database import PlantDatabase
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).parent))
+    from database import PlantDatabase
+
+
+# 讀寫文件時每次處理的字節數
+CHUNK_SIZE = 1024 * 1024
+
+# 內容地址文件名：64 位十六進制哈希 + 擴展名
+_CONTENT_NAME = re.compile(r'^([0-9a-f]{64})\.([a-z0-9]{1,5})$')
+
+
+def _normalize_ext(filename):
+    """從原文件名取得小寫擴展名（jpeg 統一為 jpg），無擴展名時返回 bin"""
+    ext = Path(filename).suffix.lower().lstrip('.')
+    if ext == 'jpeg':
+        ext = 'jpg'
+    return ext if ext.isalnum() and len(ext) <= 5 else 'bin'
+
+
+class PhotoStore:
+    """按內容哈希分目錄存儲照片文件"""
+    
+    def __init__(self, root="plant_photos"):
+        """
+        參數:
+            root: 照片根目錄
+        """
+        self.root = Path(root)
+        self.tmp_dir = self.root / '.tmp'
+        # 同一內容可能被兩個請求同時寫入，放入目錄前加鎖檢查
+        self._lock = threading.Lock()
+    
+    def _after_fork(self):
+        """在 fork 出的子進程中重建鎖（fork 時其他線程可能正持有它）"""
+        self._lock = threading.Lock()
+    
+    @property
+    def lock(self):
+        """放入或沿用文件時持有的鎖；孤兒文件清理刪除文件前持有同一把鎖，與重複上傳互斥"""
+        return self._lock
+    
+    def path_for(self, content_hash, ext):
+        """返回內容哈希對應的文件路徑"""
+        return self.root / content_hash[:2] / content_hash[2:4] / f"{content_hash}.{ext}"
+    
+    def resolve(self, filename):
+        """
+        將 /uploads/<filename> 中的文件名解析為磁盤路徑
+        
+        內容地址文件名映射到分片目錄，其他文件名（或分片目錄中不存在時）按舊的平鋪結構處理。
+        
+        返回:
+            Path: 文件路徑；文件名不合法時返回 None
+        """
+        if '/' in filename or '\\' in filename or filename.startswith('.'):
+            return None
+        match = _CONTENT_NAME.match(filename)
+        if match:
+            path = self.path_for(match.group(1), match.group(2))
+            if path.exists():
+                return path
+        # 舊的平鋪文件，或從備份恢復到照片目錄下的文件
+        return self.root / filename
+    
+    def content_hash_of(self, filename):
+        """文件名是內容地址文件名時返回其中的哈希，否則返回 None"""
+        match = _CONTENT_NAME.match(filename)
+        return match.group(1) if match else None
+    
+    def find(self, content_hash):
+        """查找已存儲的內容（任意擴展名），不存在時返回 None"""
+        shard = self.root / content_hash[:2] / content_hash[2:4]
+        if shard.is_dir():
+            for path in shard.glob(f"{content_hash}.*"):
+                return path
+        return None
+    
+    def reuse(self, content_hash):
+        """
+        查找已存儲的內容並更新其修改時間，供重複上傳沿用
+        
+        孤兒文件清理只刪除修改時間超過寬限期的文件，新的引用寫入數據庫之前文件不會被刪除。
+        
+        返回:
+            Path: 文件路徑；不存在時返回 None
+        """
+        with self._lock:
+            return self._reuse(content_hash)
+    
+    def _reuse(self, content_hash):
+        """同 reuse（調用者需持有鎖）"""
+        existing = self.find(content_hash)
+        if existing is None:
+            return None
+        try:
+            os.utime(existing)
+        except FileNotFoundError:
+            return None
+        return existing
+    
+    def put_stream(self, stream, filename):
+        """
+        保存文件流，寫入臨時文件的同時計算 SHA-256
+        
+        參數:
+            stream: 可讀的二進制文件對象
+            filename: 原文件名（只用於取擴展名）
+        
+        返回:
+            tuple: (內容哈希, 文件路徑, 是否新寫入)；內容已存在時不佔用額外空間
+        """
+        temp_path, content_hash = self.receive_stream(stream)
+        try:
+            return self.put_hashed_file(temp_path, content_hash, filename)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+    
+    def receive_stream(self, stream):
+        """
+        把文件流寫入存儲目錄下的臨時文件，同時計算 SHA-256
+        
+        返回:
+            tuple: (臨時文件路徑, 內容哈希)；臨時文件由調用者移走或刪除
+        """
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = self.tmp_dir / uuid.uuid4().hex
+        digest = hashlib.sha256()
+        try:
+            with open(temp_path, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            temp_path.unlink()
+            raise
+        return temp_path, digest.hexdigest()
+    
+    def put_file(self, source_path, move=False, filename=None, content_hash=None):
+        """
+        保存磁盤上的文件
+        
+        參數:
+            source_path: 源文件路徑
+            move: 為 True 時把源文件移入存儲（同一文件系統上不需要複製）
+            filename: 用於取擴展名的文件名，默認為源文件名
+            content_hash: 已知的內容哈希，提供時不再重新計算
+        
+        返回:
+            tuple: (內容哈希, 文件路徑, 是否新寫入)
+        """
+        source_path = Path(source_path)
+        filename = filename or source_path.name
+        content_hash = content_hash or hash_file(source_path)
+        existing = self.reuse(content_hash)
+        if existing is not None:
+            if move:
+                source_path.unlink()
+            return content_hash, existing, False
+        
+        if move:
+            try:
+                result = self.put_hashed_file(source_path, content_hash, filename)
+                if not result[2]:
+                    # 期間已被其他請求寫入相同內容
+                    source_path.unlink()
+                return result
+            except OSError:
+                # 跨文件系統時改為複製
+                pass
+        with open(source_path, 'rb') as stream:
+            result = self.put_stream(stream, filename)
+        if move:
+            source_path.unlink()
+        return result
+    
+    def put_hashed_file(self, temp_path, content_hash, filename):
+        """
+        把已計算好哈希的臨時文件移入存儲（臨時文件需與存儲在同一文件系統上）
+        
+        內容已存在時臨時文件保持不動，由調用者刪除，並更新已有文件的修改時間（見 reuse）。
+        
+        返回:
+            tuple: (內容哈希, 文件路徑, 是否新寫入)
+        """
+        with self._lock:
+            existing = self._reuse(content_hash)
+            if existing is not None:
+                return content_hash, existing, False
+            target = self.path_for(content_hash, _normalize_ext(filename))
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_path, target)
+            return content_hash, target, True
+    
+    def delete(self, path):
+        """刪除存儲中的文件（調用者需先確認沒有照片記錄再引用它）"""
+        try:
+            Path(path).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+
+def hash_file(path):
+    """計算文件的 SHA-256（分塊讀取）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def migrate_photos(db, store, batch_size=200):
+    """
+    把尚未遷移的照片（content_hash 為空）移入內容地址存儲並改寫 photo_path
+    
+    每批照片在數據庫更新提交後才刪除舊文件，中斷後重新執行會從剩下的照片繼續。
+    
+    返回:
+        dict: 遷移的記錄數、去重節省的文件數和缺失的文件數
+    """
+    result = {'migrated': 0, 'deduplicated': 0, 'missing': 0}
+    failed_ids = set()
+    while True:
+        photos = [p for p in db.get_photos_without_hash(batch_size + len(failed_ids))
+                  if p['id'] not in failed_ids][:batch_size]
+        if not photos:
+            break
+        
+        updates = []
+        old_paths = {}  # 數據庫中的原路徑字符串 -> Path
+        for photo in photos:
+            source = Path(photo['photo_path'])
+            if not source.is_file():
+                result['missing'] += 1
+                failed_ids.add(photo['id'])
+                print(f"照片文件不存在，跳過：{source}")
+                continue
+            content_hash = hash_file(source)
+            existing = store.reuse(content_hash)
+            if existing is None:
+                # 先複製，舊文件等數據庫提交後再刪除，中斷時不會丟失照片
+                with open(source, 'rb') as stream:
+                    _, existing, _ = store.put_stream(stream, source.name)
+            else:
+                result['deduplicated'] += 1
+            updates.append((photo['id'], str(existing), content_hash))
+            if source.resolve() != existing.resolve():
+                old_paths[photo['photo_path']] = source
+        
+        db.set_photo_contents(updates)
+        result['migrated'] += len(updates)
+        still_used = db.filter_referenced_paths(old_paths)
+        for old_path, source in old_paths.items():
+            if old_path not in still_used:
+                source.unlink()
+        print(f"已遷移 {result['migrated']} 張照片")
+    return result
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="植物日記照片存儲工具")
+    parser.add_argument('--db', default="plant_diary.db", help="數據庫文件路徑")
+    parser.add_argument('--photos-dir', default="plant_photos", help="照片目錄")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('migrate', help="將舊照片遷移到內容地址存儲")
+    args = parser.parse_args(argv)
+    
+    db = PlantDatabase(args.db)
+    try:
+        store = PhotoStore(Path(args.photos_dir).absolute())
+        result = migrate_photos(db, store)
+        print(f"遷移完成：{result['migrated']} 條記錄，去重 {result['deduplicated']} 個文件，"
+              f"缺失 {result['missing']} 個文件")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+植物日記 - 植物列表索引模組
+在內存中保存植物列表，供桌面版即時篩選，並計算列表框需要的增量修改
+
+篩選不查詢數據庫：每株植物預先建立一個小寫的搜索字串（中文名稱、學名，以及安裝了
+pypinyin 時的拼音、拼音首字母和注音首字母），輸入時只做字串包含判斷。
+繼續輸入（新的篩選文字以上一次的為開頭）時只在上一次的結果中查找。
+"""
+
+import threading
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+
+# 搜索字串中各欄位的分隔符，篩選文字前加上它即為「欄位開頭」匹配
+_SEPARATOR = '\x00'
+
+
+def _phonetic_keys(name):
+    """
+    返回名稱的拼音、拼音首字母和注音首字母（未安裝 pypinyin 時返回空列表）
+    
+    例如「綠蘿」返回 ['luluo', 'll', 'ㄌㄌ']。
+    """
+    if lazy_pinyin is None or not name or name.isascii():
+        return []
+    return [
+        ''.join(lazy_pinyin(name)).casefold(),
+        ''.join(lazy_pinyin(name, style=Style.FIRST_LETTER)).casefold(),
+        ''.join(lazy_pinyin(name, style=Style.BOPOMOFO_FIRST)),
+    ]
+
+
+class PlantIndex:
+    """
+    植物列表的內存索引
+    
+    順序與 PlantDatabase.iter_plants 相同（最新的在前），篩選結果保持這個順序。
+    只應在界面線程中修改；build_phonetic 可以在後台線程中執行。
+    """
+    
+    def __init__(self):
+        self._order = []  # 植物 ID，按顯示順序
+        self._names = {}  # 植物 ID -> (中文名稱, 學名)
+        self._display = {}  # 植物 ID -> 列表中顯示的名稱
+        self._haystacks = {}  # 植物 ID -> 搜索字串
+        self._phonetic = set()  # 搜索字串已包含拼音的植物 ID
+        self._version = 0
+        self._last = None  # (版本, 篩選文字, 結果)
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._order)
+    
+    def __contains__(self, plant_id):
+        return plant_id in self._names
+    
+    def _haystack(self, chinese_name, scientific_name, phonetic=False):
+        """建立搜索字串，每個欄位以分隔符開頭"""
+        keys = [chinese_name.casefold(), (scientific_name or "").casefold()]
+        if phonetic:
+            keys.extend(_phonetic_keys(chinese_name))
+        return ''.join(_SEPARATOR + key for key in keys)
+    
+    def _set_names(self, plant_id, chinese_name, scientific_name):
+        """記錄名稱和列表中顯示的文字"""
+        self._names[plant_id] = (chinese_name, scientific_name)
+        if scientific_name:
+            self._display[plant_id] = f"{chinese_name} ({scientific_name})"
+        else:
+            self._display[plant_id] = chinese_name
+    
+    def _changed(self):
+        """索引有變化，使上一次的篩選結果失效"""
+        self._version += 1
+        self._last = None
+    
+    def load(self, plants):
+        """
+        重新載入全部植物
+        
+        參數:
+            plants: 按顯示順序的植物記錄，需有 id、chinese_name、scientific_name 屬性
+                    （iter_plants 返回的 namedtuple）
+        """
+        with self._lock:
+            self._order = []
+            self._names = {}
+            self._display = {}
+            self._haystacks = {}
+            self._phonetic = set()
+            for plant in plants:
+                self._order.append(plant.id)
+                self._set_names(plant.id, plant.chinese_name, plant.scientific_name)
+                self._haystacks[plant.id] = self._haystack(plant.chinese_name, plant.scientific_name)
+            self._changed()
+    
+    def build_phonetic(self):
+        """
+        為還沒有拼音的植物補上拼音搜索字串（可在後台線程中執行）
+        
+        返回:
+            int: 補上拼音的植物數；未安裝 pypinyin 時返回 0
+        """
+        if lazy_pinyin is None:
+            return 0
+        built = 0
+        for plant_id in list(self._order):
+            with self._lock:
+                names = self._names.get(plant_id)
+                if names is None or plant_id in self._phonetic:
+                    continue
+            haystack = self._haystack(*names, phonetic=True)
+            with self._lock:
+                # 計算期間可能已被修改或刪除
+                if self._names.get(plant_id) == names:
+                    self._haystacks[plant_id] = haystack
+                    self._phonetic.add(plant_id)
+                    built += 1
+        if built:
+            with self._lock:
+                self._changed()
+        return built
+    
+    def add(self, plant_id, chinese_name, scientific_name=""):
+        """添加新植物（排在最前面）"""
+        with self._lock:
+            self._order = [plant_id] + self._order
+            self._set_names(plant_id, chinese_name, scientific_name)
+            self._haystacks[plant_id] = self._haystack(chinese_name, scientific_name,
+                                                       phonetic=lazy_pinyin is not None)
+            self._phonetic.add(plant_id)
+            self._changed()
+    
+    def update(self, plant_id, chinese_name, scientific_name=""):
+        """修改植物名稱（位置不變）"""
+        with self._lock:
+            if plant_id not in self._names:
+                return
+            self._set_names(plant_id, chinese_name, scientific_name)
+            self._haystacks[plant_id] = self._haystack(chinese_name, scientific_name,
+                                                       phonetic=lazy_pinyin is not None)
+            self._phonetic.add(plant_id)
+            self._changed()
+    
+    def remove(self, plant_id):
+        """移除植物"""
+        with self._lock:
+            if self._names.pop(plant_id, None) is None:
+                return
+            self._display.pop(plant_id, None)
+            self._haystacks.pop(plant_id, None)
+            self._phonetic.discard(plant_id)
+            self._order = [i for i in self._order if i != plant_id]
+            self._changed()
+    
+    def display_name(self, plant_id):
+        """列表中顯示的名稱"""
+        return self._display[plant_id]
+    
+    def search(self, text):
+        """
+        篩選植物
+        
+        名稱、學名或拼音的開頭或其中任何位置包含篩選文字（不分大小寫）即匹配。
+        
+        參數:
+            text: 篩選文字，空白表示全部植物
+        
+        返回:
+            list: 匹配的植物 ID，按顯示順序
+        """
+        query = text.strip().casefold()
+        if not query:
+            return list(self._order)
+        last = self._last
+        if last is not None and last[0] == self._version and query.startswith(last[1]):
+            # 繼續輸入：結果只會變少
+            candidates = last[2]
+        else:
+            candidates = self._order
+        haystacks = self._haystacks
+        result = [plant_id for plant_id in candidates if query in haystacks[plant_id]]
+        self._last = (self._version, query, result)
+        return result
+
+
+# 增量修改超過這個數量時改為整個列表重建（一次刪除加一次插入比大量零散的 Tk 調用快）
+MAX_DIFF_OPS = 64
+
+
+def diff_rows(old, new, changed=(), max_ops=MAX_DIFF_OPS):
+    """
+    計算把列表框從 old 改為 new 的增量修改
+    
+    兩個列表都應按 PlantIndex 的順序排列。只在其中一邊的植物被刪除或插入，連續的
+    一段合併為一次操作；changed 中的植物（名稱已修改）即使兩邊都有也會重新插入。
+    
+    參數:
+        old: 列表框當前顯示的植物 ID
+        new: PlantIndex.search 返回的植物 ID
+        changed: 需要重新顯示的植物 ID
+        max_ops: 操作數上限，超過時返回整個列表重建的兩個操作
+    
+    返回:
+        list: 依次執行的操作，('delete', 位置, 數量) 或 ('insert', 位置, [植物 ID, ...])；
+              位置是執行該操作時列表框中的索引
+    """
+    if old == new and not changed:
+        return []
+    rebuild = [('delete', 0, len(old)), ('insert', 0, list(new))] if old else [('insert', 0, list(new))]
+    keep = set(old).intersection(new).difference(changed)
+    ops = []
+    i = j = pos = 0
+    while i < len(old) or j < len(new):
+        if len(ops) > max_ops:
+            return rebuild
+        start = i
+        while i < len(old) and old[i] not in keep:
+            i += 1
+        if i > start:
+            ops.append(('delete', pos, i - start))
+        start = j
+        while j < len(new) and new[j] not in keep:
+            j += 1
+        if j > start:
+            ops.append(('insert', pos, new[start:j]))
+            pos += j - start
+        start = j
+        while i < len(old) and j < len(new) and old[i] == new[j] and old[i] in keep:
+            i += 1
+            j += 1
+        pos += j - start
+        if i < len(old) and j < len(new) and old[i] in keep and new[j] in keep and old[i] != new[j]:
+            # 順序不一致（不應發生），整個列表重建
+            return rebuild
+    return ops
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+植物日記 - 縮略圖模組
+為照片生成多種尺寸的縮略圖（WebP 和 JPEG），並緩存在磁盤上
+
+縮略圖保存在 <縮略圖目錄>/<尺寸>/<照片文件名>.<格式>，例如 640/xxx.jpg.webp。
+上傳時可一次生成全部尺寸；沒有生成過的縮略圖會在第一次請求時生成。
+
+為現有照片補生成縮略圖（使用所有 CPU 核心）:
+    python -m plant_diary.thumbnails --photos-dir plant_photos --thumbs-dir plant_thumbs
+"""
+
+import argparse
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+
+# 縮略圖的最長邊（像素）
+THUMB_SIZES = (200, 640, 1280)
+
+# 擴展名 -> (Pillow 格式, MIME 類型, 保存參數)
+THUMB_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# 會被當作照片處理的文件擴展名
+PHOTO_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
+
+# 照片目錄中不屬於照片的子目錄（寫入中的臨時文件、分塊上傳、pack 文件）
+_SKIP_DIRS = {'.tmp', '.uploads', '.packs'}
+
+
+def _prepare_image(source_path, max_size):
+    """
+    打開照片並轉為適合縮放的模式
+    
+    JPEG 使用 draft 模式直接以較小的比例解碼，大照片可以快好幾倍；
+    同時按 EXIF 方向旋轉，保證縮略圖方向正確。
+    """
+    img = Image.open(source_path)
+    img.draft('RGB', (max_size, max_size))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'RGBA'):
+        has_alpha = img.mode in ('LA', 'PA') or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+    return img
+
+
+def _save_atomic(img, target, ext):
+    """寫入臨時文件後改名，並發生成同一張縮略圖時不會讀到寫了一半的文件"""
+    pil_format, _, options = THUMB_FORMATS[ext]
+    if pil_format == 'JPEG' and img.mode == 'RGBA':
+        # JPEG 不支持透明，鋪上白色背景
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        img = background
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        img.save(temp_path, pil_format, **options)
+        os.replace(temp_path, target)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+class ThumbnailStore:
+    """縮略圖的生成和磁盤緩存"""
+    
+    def __init__(self, thumbs_dir="plant_thumbs"):
+        """
+        參數:
+            thumbs_dir: 縮略圖根目錄
+        """
+        self.thumbs_dir = Path(thumbs_dir)
+        self._locks_lock = threading.Lock()
+        self._locks = {}  # 縮略圖路徑 -> 鎖，避免同一張縮略圖被多個請求同時生成
+    
+    def _after_fork(self):
+        """在 fork 出的子進程中重建鎖（fork 時其他線程可能正持有它們）"""
+        self._locks_lock = threading.Lock()
+        self._locks = {}
+    
+    def path_for(self, photo_path, size, ext):
+        """返回照片某個尺寸和格式的縮略圖路徑"""
+        return self.thumbs_dir / str(size) / f"{Path(photo_path).name}.{ext}"
+    
+    def _is_fresh(self, thumb_path, photo_path):
+        """縮略圖存在且不舊於原照片"""
+        try:
+            return thumb_path.stat().st_mtime >= Path(photo_path).stat().st_mtime
+        except OSError:
+            return False
+    
+    def generate(self, photo_path, sizes=THUMB_SIZES, formats=tuple(THUMB_FORMATS), force=False):
+        """
+        為一張照片生成縮略圖（照片只解碼一次，從大到小依次縮放）
+        
+        參數:
+            photo_path: 原照片路徑
+            sizes: 要生成的尺寸
+            formats: 要生成的格式（THUMB_FORMATS 的鍵）
+            force: 為 True 時即使縮略圖已是最新也重新生成
+        
+        返回:
+            int: 實際生成的縮略圖數量
+        """
+        pending = [
+            (size, ext)
+            for size in sorted(sizes, reverse=True)
+            for ext in formats
+            if force or not self._is_fresh(self.path_for(photo_path, size, ext), photo_path)
+        ]
+        if not pending:
+            return 0
+        
+        img = _prepare_image(photo_path, pending[0][0])
+        for size, ext in pending:
+            if max(img.size) > size:
+                # 在上一個（較大的）結果上繼續縮小，比每次從原圖縮放快
+                img.thumbnail((size, size), Image.Resampling.LANCZOS)
+            _save_atomic(img, self.path_for(photo_path, size, ext), ext)
+        return len(pending)
+    
+    def get(self, photo_path, size, ext):
+        """
+        獲取縮略圖路徑，不存在或已過期時先生成
+        
+        參數:
+            photo_path: 原照片路徑
+            size: THUMB_SIZES 中的尺寸
+            ext: THUMB_FORMATS 中的格式
+        
+        返回:
+            Path: 縮略圖路徑；原照片和縮略圖都不存在時返回 None
+        """
+        if size not in THUMB_SIZES or ext not in THUMB_FORMATS:
+            raise ValueError(f"不支持的縮略圖規格：{size} {ext}")
+        thumb_path = self.path_for(photo_path, size, ext)
+        if not Path(photo_path).is_file():
+            # 原照片已移入 pack 文件時沿用打包前生成的縮略圖
+            return thumb_path if thumb_path.exists() else None
+        
+        if self._is_fresh(thumb_path, photo_path):
+            return thumb_path
+        
+        with self._locks_lock:
+            lock = self._locks.setdefault(thumb_path, threading.Lock())
+        try:
+            with lock:
+                # 等鎖期間可能已被其他請求生成
+                if not self._is_fresh(thumb_path, photo_path):
+                    self.generate(photo_path, sizes=(size,), formats=(ext,))
+        finally:
+            with self._locks_lock:
+                self._locks.pop(thumb_path, None)
+        return thumb_path
+    
+    def delete(self, photo_path):
+        """刪除照片的所有縮略圖"""
+        for size in THUMB_SIZES:
+            for ext in THUMB_FORMATS:
+                thumb_path = self.path_for(photo_path, size, ext)
+                try:
+                    thumb_path.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"刪除縮略圖失敗 {thumb_path}: {e}")
+
+
+def _backfill_one(args):
+    """子進程中為一張照片生成縮略圖"""
+    thumbs_dir, photo_path, force = args
+    try:
+        return photo_path, ThumbnailStore(thumbs_dir).generate(photo_path, force=force), None
+    except Exception as e:
+        return photo_path, 0, str(e)
+
+
+def backfill(photos_dir, thumbs_dir, workers=None, force=False):
+    """
+    為目錄（包括子目錄）中的所有照片補生成縮略圖（多進程）
+    
+    參數:
+        photos_dir: 照片目錄
+        thumbs_dir: 縮略圖根目錄
+        workers: 進程數，默認為 CPU 核心數
+        force: 重新生成已存在的縮略圖
+    
+    返回:
+        dict: 處理的照片數、生成的縮略圖數和失敗數
+    """
+    photos = []
+    for dirpath, dirnames, filenames in os.walk(photos_dir):
+        # 按內容哈希分目錄保存的照片在子目錄中
+        dirnames[:] = sorted(d for d in dirnames if d not in _SKIP_DIRS)
+        photos.extend(
+            os.path.join(dirpath, name) for name in sorted(filenames)
+            if os.path.splitext(name)[1].lower() in PHOTO_EXTENSIONS
+        )
+    result = {'photos': len(photos), 'generated': 0, 'failed': 0}
+    if not photos:
+        return result
+    
+    tasks = [(str(thumbs_dir), photo, force) for photo in photos]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for done, (photo_path, generated, error) in enumerate(
+                executor.map(_backfill_one, tasks, chunksize=8), start=1):
+            result['generated'] += generated
+            if error:
+                result['failed'] += 1
+                print(f"生成縮略圖失敗 {photo_path}: {error}")
+            if done % 100 == 0 or done == len(photos):
+                print(f"已處理 {done}/{len(photos)} 張照片")
+    return result
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="為現有照片補生成縮略圖")
+    parser.add_argument('--photos-dir', default="plant_photos", help="照片目錄")
+    parser.add_argument('--thumbs-dir', default="plant_thumbs", help="縮略圖目錄")
+    parser.add_argument('--workers', type=int, help="進程數（默認為 CPU 核心數）")
+    parser.add_argument('--force', action='store_true', help="重新生成已存在的縮略圖")
+    args = parser.parse_args(argv)
+    
+    result = backfill(args.photos_dir, args.thumbs_dir, args.workers, args.force)
+    print(f"完成：{result['photos']} 張照片，生成 {result['generated']} 個縮略圖，"
+          f"失敗 {result['failed']} 張")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,13 @@
 基於 Flask 的 Web 應用程式，支持手機瀏覽器訪問
 """
 
+import io
 import os
 import sys
+import mimetypes
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, session
+from flask import Flask, Request, Response, render_template, request, jsonify, send_from_directory, redirect, url_for, session
+from werkzeug.datastructures import ContentRange
 from werkzeug.utils import secure_filename
 from functools import wraps
 import json
@@ -17,30 +20,108 @@ import json
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 try:
-    from plant_diary.database import get_db
+    from plant_diary.database import get_db, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_SEARCH_OFFSET
     from plant_diary.ai_analyzer import get_analyzer
-    from plant_diary.ocr_reader import get_ocr_reader
+    from plant_diary.ocr_reader import get_ocr_reader, InvalidImageError
+    from plant_diary.thumbnails import ThumbnailStore, THUMB_SIZES, THUMB_FORMATS
+    from plant_diary.photo_store import PhotoStore
+    from plant_diary.chunked_upload import ChunkedUploads, OffsetMismatch
+    from plant_diary.image_normalizer import get_normalizer, keep_originals, store_photo
+    from plant_diary.orphan_gc import OrphanCollector
+    from plant_diary.pack_store import PackStore, PACK_DIR_NAME, open_photo
 except ImportError:
     sys.path.insert(0, str(Path(__file__).parent.parent / "plant_diary"))
-    from database import get_db
+    from database import get_db, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_SEARCH_OFFSET
     from ai_analyzer import get_analyzer
-    from ocr_reader import get_ocr_reader
+    from ocr_reader import get_ocr_reader, InvalidImageError
+    from thumbnails import ThumbnailStore, THUMB_SIZES, THUMB_FORMATS
+    from photo_store import PhotoStore
+    from chunked_upload import ChunkedUploads, OffsetMismatch
+    from image_normalizer import get_normalizer, keep_originals, store_photo
+    from orphan_gc import OrphanCollector
+    from pack_store import PackStore, PACK_DIR_NAME, open_photo
+
+
+
+class InMemoryUploadRequest(Request):
+    """
+    指定端點上傳的文件只保存在內存中
+    
+    Werkzeug 默認把超過 500KB 的上傳文件寫入臨時文件。OCR 識別的圖片只在請求內使用一次，
+    直接讀入內存即可；上傳大小已由 MAX_CONTENT_LENGTH 限制。
+    """
+    
+    in_memory_endpoints = {'recognize_photo'}
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint in self.in_memory_endpoints:
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
 
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'plant-diary-secret-key-change-in-production')
 app.config['UPLOAD_FOLDER'] = Path('plant_photos').absolute()
+app.config['THUMB_FOLDER'] = Path('plant_thumbs').absolute()
+# 上傳時被標準化的照片，原始文件的冷存儲目錄（PLANT_DIARY_KEEP_ORIGINALS=1 時使用）
+app.config['ORIGINALS_FOLDER'] = Path('plant_originals').absolute()
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # 確保上傳目錄存在
 app.config['UPLOAD_FOLDER'].mkdir(exist_ok=True)
+app.config['THUMB_FOLDER'].mkdir(exist_ok=True)
 
 # 允許的文件擴展名
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 
+# 靜態文件的瀏覽器緩存時間（秒）
+# 內容地址的照片網址永遠對應同一內容，可以長期緩存且無需重新驗證
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# 舊文件名的照片和 LOGO 可能被替換，緩存較短時間，過期後用 ETag 重新驗證
+MUTABLE_MAX_AGE = 3600
+
 # 初始化數據庫和工具
 db = get_db()
 analyzer = get_analyzer()
 ocr_reader = get_ocr_reader()
+# OCR 模型默認在第一次識別時載入；gunicorn.conf.py 的 preload 模式下在主進程載入一次，
+# 由所有 worker 共享（PLANT_DIARY_OCR_LOAD，見 ocr_reader.OCR_LOAD_MODES）
+ocr_reader.load_model()
+thumbnails = ThumbnailStore(app.config['THUMB_FOLDER'])
+photo_store = PhotoStore(app.config['UPLOAD_FOLDER'])
+# 較舊的照片由 python -m plant_diary.pack_store pack 移入 pack 文件
+pack_store = PackStore(app.config['UPLOAD_FOLDER'] / PACK_DIR_NAME)
+# 與照片存儲在同一目錄下，完成時可直接改名移入存儲
+chunked_uploads = ChunkedUploads(app.config['UPLOAD_FOLDER'] / '.uploads')
+normalizer = get_normalizer()
+originals_store = PhotoStore(app.config['ORIGINALS_FOLDER']) if keep_originals() else None
+orphan_collector = OrphanCollector(db, photo_store, thumbnails, originals_store, pack_store=pack_store)
+# 後台定期清理孤兒文件的間隔（秒），設為 0 則只能由管理員手動觸發
+gc_interval = int(os.getenv('PLANT_DIARY_GC_INTERVAL', 24 * 3600))
+
+if hasattr(os, 'register_at_fork'):
+    # gunicorn preload 模式下 fork 時其他線程可能正持有這些對象的鎖，在 worker 中重建
+    for _component in (thumbnails, photo_store, pack_store, chunked_uploads, originals_store,
+                       orphan_collector):
+        if _component is not None:
+            os.register_at_fork(after_in_child=_component._after_fork)
+
+
+def start_orphan_collector():
+    """
+    啟動後台定期清理孤兒文件
+    
+    每個 worker 都會啟動清理線程，但只有取得鎖文件的一個 worker 執行清理。
+    gunicorn preload 模式下由 gunicorn.conf.py 的 post_fork 在 worker 中調用，
+    不在主進程中啟動線程。
+    """
+    if gc_interval > 0:
+        orphan_collector.start(gc_interval, lock_path=Path('orphan_gc.lock').absolute())
+
+
+if os.getenv('PLANT_DIARY_GC_START') != 'post_fork':
+    start_orphan_collector()
 
 
 def allowed_file(filename):
@@ -58,6 +139,18 @@ def login_required(f):
     return decorated_function
 
 
+def admin_required(f):
+    """管理員權限檢查裝飾器"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'error': '請先登入'}), 401
+        if not session.get('is_admin'):
+            return jsonify({'success': False, 'error': '需要管理員權限'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
 @app.route('/')
 def index():
     """主頁"""
@@ -179,16 +272,44 @@ def get_current_user():
 @app.route('/api/plants', methods=['GET'])
 @login_required
 def get_plants():
-    """獲取所有植物列表，包含照片數量"""
-    plants = db.get_all_plants()
-    result = []
-    for plant in plants:
-        plant_dict = dict(plant)
-        # 獲取照片數量
-        photos = db.get_plant_photos(plant_dict['id'])
-        plant_dict['photo_count'] = len(photos)
-        result.append(plant_dict)
-    return jsonify(result)
+    """
+    獲取植物列表，包含照片數量、最新照片和最近分析時間
+    
+    帶 limit 或 cursor 參數時按頁返回 {plants, next_cursor}，否則返回完整列表。
+    """
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return jsonify(db.get_plants_with_stats())
+    
+    try:
+        plants, next_cursor = db.get_plants_page(
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor') or None
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'plants': plants, 'next_cursor': next_cursor})
+
+
+@app.route('/api/search', methods=['GET'])
+@login_required
+def search():
+    """全文搜索植物和照片分析結果（按相關度排序，offset 分頁，最多翻到 MAX_SEARCH_OFFSET）"""
+    query = request.args.get('q', '').strip()
+    # 與其他分頁接口一樣限制每頁數量；多取的一條也不能超過 MAX_PAGE_SIZE
+    limit = max(1, min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE - 1))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    
+    if not query:
+        return jsonify({'success': False, 'error': '請輸入搜索關鍵詞'}), 400
+    
+    # 多取一條以判斷是否還有下一頁
+    results = db.search(query, limit=limit + 1, offset=offset)
+    next_offset = None
+    if len(results) > limit:
+        results = results[:limit]
+        if offset + limit <= MAX_SEARCH_OFFSET:
+            next_offset = offset + limit
+    return jsonify({'success': True, 'results': results, 'next_offset': next_offset})
 
 
 @app.route('/api/plants', methods=['POST'])
@@ -213,14 +334,30 @@ def add_plant():
 @app.route('/api/plants/<int:plant_id>', methods=['GET'])
 @login_required
 def get_plant(plant_id):
-    """獲取單個植物信息"""
+    """
+    獲取單個植物信息及其照片
+    
+    帶 limit 或 cursor 參數時只返回一頁照片，並附上 next_cursor。
+    """
     plant = db.get_plant(plant_id)
     if plant:
-        photos = db.get_plant_photos(plant_id)
+        next_cursor = None
+        if 'limit' in request.args or 'cursor' in request.args:
+            try:
+                photos, next_cursor = db.get_plant_photos_page(
+                    plant_id,
+                    limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+                    cursor=request.args.get('cursor') or None
+                )
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+        else:
+            photos = db.get_plant_photos(plant_id)
         return jsonify({
             'success': True,
             'plant': dict(plant),
-            'photos': [dict(photo) for photo in photos]
+            'photos': [dict(photo) for photo in photos],
+            'next_cursor': next_cursor
         })
     return jsonify({'success': False, 'error': '植物不存在'}), 404
 
@@ -248,6 +385,8 @@ def delete_plant(plant_id):
     """刪除植物"""
     try:
         db.delete_plant(plant_id)
+        # 照片文件已加入待刪除隊列，在後台確認沒有其他記錄引用後刪除
+        orphan_collector.drain_queue_async()
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -267,31 +406,166 @@ def upload_photo(plant_id):
         return jsonify({'success': False, 'error': '沒有選擇文件'}), 400
     
     if file and allowed_file(file.filename):
-        # 生成安全的文件名
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         plant = db.get_plant(plant_id)
         if not plant:
             return jsonify({'success': False, 'error': '植物不存在'}), 404
         
-        filename = secure_filename(f"{plant['chinese_name']}_{timestamp}_{file.filename}")
-        filepath = app.config['UPLOAD_FOLDER'] / filename
-        file.save(str(filepath))
-        
-        # 保存到數據庫（不進行自動AI分析）
-        photo_id = db.add_photo(
+        # 邊接收邊計算哈希，再標準化並按內容哈希保存，重複上傳同一張照片不佔用額外空間
+        temp_path, source_hash = photo_store.receive_stream(file.stream)
+        try:
+            stored = store_photo(photo_store, temp_path, file.filename, normalizer,
+                                 originals_store, source_hash=source_hash)
+        except Exception as e:
+            return jsonify({'success': False, 'error': f'保存照片失敗: {str(e)}'}), 400
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        return jsonify(save_uploaded_photo(plant_id, stored, notes))
+    
+    return jsonify({'success': False, 'error': '不支持的文件格式，請使用 JPG、PNG、WebP 等圖片格式'}), 400
+
+
+def save_uploaded_photo(plant_id, stored, notes):
+    """照片文件存好後（store_photo 的結果）添加照片記錄，返回上傳接口的響應內容"""
+    content_hash = stored['content_hash']
+    filepath = stored['path']
+    is_new = stored['is_new']
+    
+    # 相同照片已分析過時直接沿用結果（不進行自動AI分析）
+    analysis = db.find_analysis_by_hash(content_hash, plant_id) or {}
+    photo_id = db.add_photo(
+        plant_id=plant_id,
+        photo_path=str(filepath),
+        notes=notes,
+        ai_analysis=analysis.get('ai_analysis', ''),
+        care_suggestions=analysis.get('care_suggestions', ''),
+        content_hash=content_hash,
+        original_hash=stored['original_hash']
+    )
+    print(f"照片已保存 (ID: {photo_id})：原始 {stored['original_bytes']} 字節，"
+          f"保存 {stored['stored_bytes']} 字節，節省 {stored['saved_bytes']} 字節")
+    
+    if is_new:
+        # 在後台生成各尺寸縮略圖，不阻塞上傳響應；未生成完的尺寸會在請求時按需生成
+        import threading
+        threading.Thread(target=generate_thumbnails, args=(str(filepath),), daemon=True).start()
+    
+    return {
+        'success': True,
+        'photo_id': photo_id,
+        'filename': filepath.name,
+        'duplicate': not is_new,
+        'original_bytes': stored['original_bytes'],
+        'stored_bytes': stored['stored_bytes'],
+        'saved_bytes': stored['saved_bytes']
+    }
+
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def init_chunked_upload():
+    """
+    初始化分塊上傳（適合大文件和不穩定的網絡）
+    
+    請求 JSON：plant_id、filename、size，可選 notes。
+    之後用 PUT /api/uploads/<upload_id>?offset=N 依次上傳分塊（請求體為原始字節），
+    中斷後用 GET /api/uploads/<upload_id> 查詢已接收的偏移量繼續上傳，
+    最後 POST /api/uploads/<upload_id>/finalize 完成。
+    """
+    data = request.get_json() or {}
+    filename = data.get('filename', '')
+    plant_id = data.get('plant_id')
+    
+    if not filename or not allowed_file(filename):
+        return jsonify({'success': False, 'error': '不支持的文件格式，請使用 JPG、PNG、WebP 等圖片格式'}), 400
+    if not isinstance(plant_id, int) or not db.get_plant(plant_id):
+        return jsonify({'success': False, 'error': '植物不存在'}), 404
+    
+    try:
+        upload = chunked_uploads.create(
+            owner=session['user_id'],
             plant_id=plant_id,
-            photo_path=str(filepath),
-            notes=notes
+            filename=filename,
+            size=int(data.get('size', 0)),
+            notes=(data.get('notes') or '').strip()
         )
-        
-        return jsonify({
-            'success': True,
-            'photo_id': photo_id,
-            'filename': filename
-        })
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, **upload})
+
+
+def get_own_upload(upload_id):
+    """讀取屬於當前用戶的上傳，不存在或不屬於當前用戶時返回 None"""
+    try:
+        meta, offset = chunked_uploads.get(upload_id)
+    except KeyError:
+        return None
+    if meta['owner'] != session['user_id']:
+        return None
+    return meta, offset
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_chunked_upload(upload_id):
+    """查詢分塊上傳已接收的字節數（斷點續傳）"""
+    if get_own_upload(upload_id) is None:
+        return jsonify({'success': False, 'error': '上傳不存在或已過期'}), 404
+    return jsonify({'success': True, **chunked_uploads.status(upload_id)})
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def put_upload_chunk(upload_id):
+    """上傳一個分塊，offset 必須等於已接收的字節數，不一致時返回 409 和正確的偏移量"""
+    if get_own_upload(upload_id) is None:
+        return jsonify({'success': False, 'error': '上傳不存在或已過期'}), 404
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'error': '缺少 offset 參數'}), 400
     
-    return jsonify({'success': False, 'error': '不支持的文件格式，請使用 JPG、PNG、WebP 等圖片格式'}), 400
+    try:
+        received = chunked_uploads.write_chunk(upload_id, offset, request.stream)
+    except OffsetMismatch as e:
+        return jsonify({'success': False, 'error': str(e), 'offset': e.offset}), 409
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'offset': received})
+
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_chunked_upload(upload_id):
+    """完成分塊上傳：標準化後移入照片存儲並添加照片記錄"""
+    if get_own_upload(upload_id) is None:
+        return jsonify({'success': False, 'error': '上傳不存在或已過期'}), 404
+    
+    try:
+        meta, content_hash, part_path = chunked_uploads.finalize(upload_id)
+    except OffsetMismatch as e:
+        return jsonify({'success': False, 'error': '文件尚未上傳完整', 'offset': e.offset}), 409
+    
+    if not db.get_plant(meta['plant_id']):
+        chunked_uploads.discard(upload_id)
+        return jsonify({'success': False, 'error': '植物不存在'}), 404
+    
+    try:
+        stored = store_photo(photo_store, part_path, meta['filename'], normalizer,
+                             originals_store, source_hash=content_hash)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'保存照片失敗: {str(e)}'}), 400
+    finally:
+        # 成功或失敗都刪除上傳的數據和狀態，失敗後需重新上傳
+        chunked_uploads.discard(upload_id)
+    return jsonify(save_uploaded_photo(meta['plant_id'], stored, meta['notes']))
+
+
+def generate_thumbnails(photo_path):
+    """生成照片的全部縮略圖（在後台線程中執行）"""
+    try:
+        thumbnails.generate(photo_path)
+    except Exception as e:
+        print(f"生成縮略圖失敗 {photo_path}: {e}")
 
 
 @app.route('/api/ocr/recognize', methods=['POST'])
@@ -313,61 +587,28 @@ def recognize_photo():
     if not allowed_file(file.filename):
         return jsonify({'success': False, 'error': '不支持的文件格式，請使用 JPG、PNG、WebP 等圖片格式'}), 400
     
-    temp_filepath = None
     try:
-        # 保存臨時文件
-        from datetime import datetime
-        import tempfile
-        
-        # 確保文件擴展名正確
-        file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'jpg'
-        if file_ext not in ALLOWED_EXTENSIONS:
-            file_ext = 'jpg'
-        
-        temp_filename = secure_filename(f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{file_ext}")
-        temp_filepath = app.config['UPLOAD_FOLDER'] / temp_filename
-        
-        # 保存文件
-        file.save(str(temp_filepath))
+        # 上傳的圖片只在內存中（見 InMemoryUploadRequest），不寫臨時文件
+        data = file.read()
+        if not data:
+            return jsonify({'success': False, 'error': '文件讀取失敗'}), 400
         
-        # 驗證文件是否成功保存
-        if not temp_filepath.exists() or temp_filepath.stat().st_size == 0:
-            return jsonify({
-                'success': False,
-                'error': '文件保存失敗，請重試'
-            }), 500
+        # 進行 OCR 識別（圖片最多解碼一次；同一張圖片識別過時直接返回緩存結果）
+        api_key = os.getenv('OPENAI_API_KEY')
+        use_openai = api_key is not None
         
-        # 使用 PIL 驗證圖片
         try:
-            from PIL import Image
-            with Image.open(str(temp_filepath)) as img:
-                img.verify()
-            # 重新打開並轉換為標準格式
-            img = Image.open(str(temp_filepath))
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            # 保存為標準 JPEG 格式
-            temp_filepath_jpg = temp_filepath.with_suffix('.jpg')
-            img.save(str(temp_filepath_jpg), 'JPEG', quality=95)
-            if temp_filepath != temp_filepath_jpg:
-                temp_filepath.unlink()
-                temp_filepath = temp_filepath_jpg
-        except Exception as img_error:
+            result = ocr_reader.recognize_image(
+                data,
+                use_openai=use_openai,
+                openai_api_key=api_key
+            )
+        except InvalidImageError as img_error:
             return jsonify({
                 'success': False,
                 'error': f'圖片文件損壞或格式不支持: {str(img_error)}'
             }), 400
         
-        # 進行 OCR 識別
-        api_key = os.getenv('OPENAI_API_KEY')
-        use_openai = api_key is not None
-        
-        result = ocr_reader.recognize_text(
-            str(temp_filepath),
-            use_openai=use_openai,
-            openai_api_key=api_key
-        )
-        
         return jsonify(result)
         
     except Exception as e:
@@ -375,13 +616,6 @@ def recognize_photo():
             'success': False,
             'error': f'OCR 識別錯誤: {str(e)}'
         }), 500
-    finally:
-        # 刪除臨時文件
-        if temp_filepath and temp_filepath.exists():
-            try:
-                temp_filepath.unlink()
-            except Exception:
-                pass
 
 
 @app.route('/api/photos/<int:photo_id>', methods=['GET'])
@@ -428,12 +662,26 @@ def analyze_photos():
                     chinese_name = plant.get('chinese_name') if plant else None
                     scientific_name = plant.get('scientific_name') if plant else None
                     
-                    # 進行 AI 分析
-                    result = analyzer.analyze_plant_photo(
-                        photo['photo_path'],
-                        chinese_name=chinese_name,
-                        scientific_name=scientific_name
-                    )
+                    # 尚未分析的照片可沿用相同內容的其他照片的成功結果；
+                    # 已有結果的照片是用戶要求重新分析，總是調用分析器
+                    result = None
+                    if not photo.get('ai_analysis'):
+                        result = db.find_analysis_by_hash(photo.get('content_hash'), plant_id,
+                                                          exclude_photo_id=photo_id)
+                    if result is None:
+                        # 已打包的照片沒有獨立文件，從 pack 中讀取
+                        try:
+                            image = open_photo(photo['photo_path'], pack_store)
+                        except FileNotFoundError:
+                            print(f"照片文件不存在 (ID: {photo_id}): {photo['photo_path']}")
+                            continue
+                        with image:
+                            result = analyzer.analyze_plant_photo(
+                                image,
+                                chinese_name=chinese_name,
+                                scientific_name=scientific_name,
+                                filename=photo['photo_path']
+                            )
                     
                     # 更新數據庫
                     db.update_photo_analysis(
@@ -467,33 +715,105 @@ def analyze_photos():
 def delete_photo(photo_id):
     """刪除照片"""
     try:
-        # 先獲取照片信息，以便刪除文件
-        photo = db.get_photo(photo_id)
-        if not photo:
+        if not db.delete_photo(photo_id):
             return jsonify({'success': False, 'error': '照片不存在'}), 404
-        
-        # 刪除文件
-        photo_path = Path(photo['photo_path'])
-        if photo_path.exists():
-            try:
-                photo_path.unlink()
-            except Exception as e:
-                print(f"刪除照片文件失敗: {e}")
-                # 即使文件刪除失敗，也繼續刪除數據庫記錄
-        
-        # 刪除數據庫記錄
-        if db.delete_photo(photo_id):
-            return jsonify({'success': True})
-        else:
-            return jsonify({'success': False, 'error': '刪除失敗'}), 500
+        # 照片文件已加入待刪除隊列，在後台確認沒有其他記錄引用後刪除
+        orphan_collector.drain_queue_async()
+        return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/admin/cache', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    """獲取數據庫讀取緩存的命中統計（僅管理員）"""
+    return jsonify({'success': True, 'cache': db.cache_stats()})
+
+
+@app.route('/api/admin/ocr-cache', methods=['GET'])
+@admin_required
+def get_ocr_cache_stats():
+    """獲取 OCR 結果緩存的命中統計（僅管理員），未啟用緩存時 cache 為 null"""
+    cache = ocr_reader.cache
+    return jsonify({'success': True, 'cache': cache.stats() if cache is not None else None})
+
+
+@app.route('/api/admin/gc', methods=['POST'])
+@admin_required
+def run_orphan_gc():
+    """
+    立即清理沒有照片記錄引用的文件（僅管理員）
+    
+    請求體 {"dry_run": true} 時只報告會被刪除的文件和可回收的空間。
+    """
+    data = request.get_json(silent=True) or {}
+    report = orphan_collector.run(dry_run=bool(data.get('dry_run')))
+    return jsonify({'success': True, 'report': report})
+
+
+@app.route('/api/admin/db-stats', methods=['GET'])
+@admin_required
+def get_db_stats():
+    """
+    獲取 SQL 語句耗時統計和慢查詢日誌（僅管理員）
+    
+    需設置環境變數 PLANT_DIARY_QUERY_STATS=1 啟用統計。
+    """
+    if db.query_stats is None:
+        return jsonify({
+            'success': False,
+            'error': '未啟用 SQL 統計，請設置 PLANT_DIARY_QUERY_STATS=1'
+        }), 404
+    stats = db.query_stats.snapshot()
+    if request.args.get('reset') == '1':
+        db.query_stats.reset()
+    return jsonify({'success': True, 'stats': stats, 'cache': db.cache_stats()})
+
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    """提供上傳的文件"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """提供上傳的文件（內容地址文件名會映射到對應的分片目錄，已打包的照片從 pack 中讀取）"""
+    path = photo_store.resolve(filename)
+    if path is None:
+        return '', 404
+    if not path.is_file():
+        packed, mtime = pack_store.open(filename)
+        if packed is not None:
+            return send_packed_file(packed, filename, mtime, photo_store.content_hash_of(filename))
+    return send_cached_file(path, photo_store.content_hash_of(filename))
+
+
+@app.route('/thumbs/<int:size>/<filename>')
+def thumbnail_file(size, filename):
+    """
+    提供照片縮略圖，瀏覽器支持時返回 WebP，否則返回 JPEG
+    
+    縮略圖不存在時按需生成並緩存在磁盤上。
+    """
+    if size not in THUMB_SIZES or filename != secure_filename(filename):
+        return '', 404
+    
+    if 'image/webp' in request.headers.get('Accept', ''):
+        ext = 'webp'
+    else:
+        ext = 'jpg'
+    
+    try:
+        source = photo_store.resolve(filename)
+        thumb_path = thumbnails.get(source, size, ext) if source else None
+    except Exception as e:
+        print(f"生成縮略圖失敗 {filename}: {e}")
+        return '', 404
+    if thumb_path is None:
+        return '', 404
+    
+    content_hash = photo_store.content_hash_of(filename)
+    response = send_cached_file(thumb_path, content_hash and f"{content_hash}-{size}.{ext}",
+                                mimetype=THUMB_FORMATS[ext][1])
+    # 同一網址根據 Accept 返回不同格式，緩存時需區分
+    response.vary.add('Accept')
+    return response
 
 
 @app.route('/logo/<filename>')
@@ -501,10 +821,71 @@ def logo_file(filename):
     """提供LOGO文件"""
     logo_folder = Path(__file__).parent.parent / 'LOGO'
     if logo_folder.exists() and (logo_folder / filename).exists():
-        return send_from_directory(str(logo_folder), filename)
+        return send_cached_file(logo_folder / filename)
     return '', 404
 
 
+def send_cached_file(path, immutable_etag=None, mimetype=None):
+    """
+    發送文件並設置緩存頭，支持 If-None-Match（304）和 Range（206）請求
+    
+    參數:
+        path: 文件路徑
+        immutable_etag: 文件內容永不改變時傳入以內容哈希構成的 ETag，
+                        響應會帶長期的 Cache-Control: immutable；None 時使用短期緩存
+        mimetype: 可選，指定 Content-Type
+    """
+    if immutable_etag:
+        response = send_from_directory(path.parent, path.name, mimetype=mimetype,
+                                       etag=immutable_etag, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.immutable = True
+    else:
+        response = send_from_directory(path.parent, path.name, mimetype=mimetype,
+                                       max_age=MUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    return response
+
+
+def send_packed_file(packed, filename, mtime, immutable_etag=None):
+    """
+    發送 pack 中的照片，緩存頭與 send_cached_file 相同，支持 If-None-Match（304）和 Range（206）
+    
+    參數:
+        packed: pack_store.open 返回的 PackedFile（mmap 上的切片）
+        filename: 照片文件名（用於判斷 Content-Type）
+        mtime: 照片打包前的修改時間
+        immutable_etag: 同 send_cached_file
+    """
+    length = len(packed)
+    response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                        direct_passthrough=True)
+    response.accept_ranges = 'bytes'
+    response.last_modified = mtime
+    if immutable_etag:
+        response.set_etag(immutable_etag)
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.set_etag(f"{int(mtime)}-{length}")
+        response.cache_control.max_age = MUTABLE_MAX_AGE
+    response.cache_control.public = True
+    
+    start, stop = 0, length
+    if request.range is not None:
+        byte_range = request.range.range_for_length(length)
+        if byte_range is None:
+            response.status_code = 416
+            response.content_range = ContentRange('bytes', None, None, length)
+            return response
+        start, stop = byte_range
+        response.status_code = 206
+        response.content_range = ContentRange('bytes', start, stop, length)
+    # 直接從 mmap 按塊切片發送，不把整張照片讀入內存
+    response.response = packed.iter_range(start, stop)
+    response.content_length = stop - start
+    return response.make_conditional(request)
+
+
 if __name__ == '__main__':
     # 本地開發模式
     debug_mode = os.getenv('FLASK_ENV') != 'production'
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+植物日記 Web 版 - Gunicorn 配置
+在 plant_diary_web 目錄下運行 gunicorn 時自動載入
+
+默認使用 preload 模式：主進程導入應用並同步載入 EasyOCR 模型一次，之後 fork 出的
+worker 以寫時複製共享模型權重，不必各自花數秒載入、各佔數百 MB 內存。
+設置 PLANT_DIARY_PRELOAD=0 改回每個 worker 自行導入應用（模型在第一次識別時載入）。
+
+preload 模式下主進程不啟動孤兒文件清理線程，改為在每個 worker fork 後由 post_fork 啟動
+（只有取得鎖文件的一個 worker 實際執行清理）。
+"""
+
+import gc
+import os
+
+preload_app = os.getenv('PLANT_DIARY_PRELOAD', '1') != '0'
+if preload_app:
+    # 應用在主進程導入時同步載入 OCR 模型（已設置時以環境變數為準）
+    os.environ.setdefault('PLANT_DIARY_OCR_LOAD', 'sync')
+    # 後台線程不能跨 fork 存在，清理線程在 worker 中啟動
+    os.environ['PLANT_DIARY_GC_START'] = 'post_fork'
+
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+# 第一次 OCR 識別（非 preload 模式下包括載入模型）可能較慢
+timeout = 120
+
+
+def when_ready(server):
+    """主進程準備好、開始 fork worker 之前"""
+    if preload_app:
+        # 把主進程已有的對象移出垃圾回收追蹤，worker 中的垃圾回收不會寫入這些對象的
+        # 內存頁，共享的頁面不會因此被複製
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    """worker fork 出來之後（preload 模式下應用已在主進程導入）"""
+    if preload_app:
+        import app
+        app.start_orphan_collector()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""植物日記 - 測試共用的 Web 應用夾具"""
+
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+WEB_DIR = Path(__file__).resolve().parent.parent / 'plant_diary_web'
+
+
+@pytest.fixture(scope='session')
+def web(tmp_path_factory):
+    """在臨時目錄中導入 Web 應用（數據庫和照片目錄都建立在當前目錄；應用模組只能導入一次）"""
+    workdir = tmp_path_factory.mktemp('web')
+    env = {'PLANT_DIARY_DB_POOL': '0', 'PLANT_DIARY_GC_INTERVAL': '0'}
+    saved_env = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    sys.path.insert(0, str(WEB_DIR))
+    try:
+        module = importlib.import_module('app')
+    finally:
+        sys.path.remove(str(WEB_DIR))
+        os.chdir(cwd)
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    yield module
+    module.db.close()
+
+
+@pytest.fixture
+def client(web):
+    client = web.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['username'] = 'admin'
+        session['is_admin'] = True
+    return client
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""植物日記 - 數據庫測試"""
+
+import io
+import sqlite3
+
+import pytest
+
+from plant_diary import database
+from plant_diary.database import PlantDatabase, encode_page_cursor
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = PlantDatabase(str(tmp_path / "plant_diary.db"))
+    yield database
+    database.close()
+
+
+def query_plans(database, call):
+    """執行 call，返回其中每條查詢的 (SQL, EXPLAIN QUERY PLAN 各步驟合併的文字)"""
+    conn = database.get_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    plans = []
+    for sql in statements:
+        if sql.lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')):
+            steps = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+            plans.append((sql, ' | '.join(steps)))
+    return plans
+
+
+def export_bytes(database):
+    fp = io.BytesIO()
+    database.export_ndjson(fp)
+    return fp.getvalue()
+
+
+def fts_integrity_check(database):
+    conn = database.get_connection()
+    for table in ('plants_fts', 'photos_fts'):
+        # rank 為 1 時同時核對外部內容表
+        conn.execute(f"INSERT INTO {table}({table}, rank) VALUES ('integrity-check', 1)")
+
+
+def test_reimport_changed_export_keeps_fts_in_sync(db, tmp_path):
+    plant_id = db.add_plant("黃金葛", "Epipremnum aureum", "放在客廳窗邊")
+    db.add_photo(plant_id, str(tmp_path / "a.jpg"), ai_analysis="葉片邊緣發黃")
+    
+    target = PlantDatabase(str(tmp_path / "imported.db"))
+    try:
+        target.import_ndjson(io.BytesIO(export_bytes(db)))
+        
+        db.update_plant(plant_id, chinese_name="星點藤", notes="移到南面陽台")
+        target.import_ndjson(io.BytesIO(export_bytes(db)), mode='merge')
+        
+        names = [r['chinese_name'] for r in target.search("星點藤")]
+        assert names == ["星點藤"]
+        assert target.search("黃金葛") == []
+        assert target.search("客廳窗") == []
+        assert [r['type'] for r in target.search("南面陽台")] == ['plant']
+        assert [r['type'] for r in target.search("邊緣發黃")] == ['photo']
+        fts_integrity_check(target)
+    finally:
+        target.close()
+
+
+def test_import_into_non_empty_database_needs_mode(db, tmp_path):
+    db.add_plant("黃金葛")
+    target = PlantDatabase(str(tmp_path / "imported.db"))
+    try:
+        target.add_plant("龜背竹")
+        
+        with pytest.raises(ValueError):
+            target.import_ndjson(io.BytesIO(export_bytes(db)))
+        assert [p['chinese_name'] for p in target.get_all_plants()] == ["龜背竹"]
+        
+        with pytest.raises(ValueError):
+            target.import_ndjson(io.BytesIO(export_bytes(db)), mode='overwrite')
+    finally:
+        target.close()
+
+
+def test_import_replace_clears_existing_records(db, tmp_path):
+    plant_id = db.add_plant("黃金葛")
+    db.add_photo(plant_id, str(tmp_path / "a.jpg"), notes="新葉")
+    target = PlantDatabase(str(tmp_path / "imported.db"))
+    try:
+        old_id = target.add_plant("龜背竹", notes="舊日記")
+        target.add_plant("虎尾蘭")
+        
+        counts = target.import_ndjson(io.BytesIO(export_bytes(db)), mode='replace')
+        
+        assert counts['plant'] == 1 and counts['photo'] == 1
+        assert [p['chinese_name'] for p in target.get_all_plants()] == ["黃金葛"]
+        assert target.search("舊日記") == []
+        assert target.get_plant(old_id)['chinese_name'] == "黃金葛"
+        fts_integrity_check(target)
+    finally:
+        target.close()
+
+
+def test_import_skips_user_whose_username_is_taken(db, tmp_path):
+    db.create_user("alice", "secret")
+    target = PlantDatabase(str(tmp_path / "imported.db"))
+    try:
+        # 目標數據庫中 bob 佔用了源數據庫 alice 的 id，alice 則屬於另一個 id
+        target.create_user("bob", "secret")
+        target.create_user("alice", "other")
+        alice_id = target.get_connection().execute(
+            "SELECT id FROM users WHERE username = 'alice'").fetchone()[0]
+        
+        counts = target.import_ndjson(io.BytesIO(export_bytes(db)))
+        
+        assert counts['skipped_users'] == ["alice"]
+        users = dict(target.get_connection().execute('SELECT username, id FROM users').fetchall())
+        assert users['alice'] == alice_id
+        assert target.verify_user("alice", "other")
+    finally:
+        target.close()
+
+
+def test_plant_photo_queries_use_plant_taken_index(db):
+    plant_id = db.add_plant("龜背竹")
+    db.add_photo(plant_id, "a.jpg")
+    cursor = encode_page_cursor('2026-01-01T00:00:00', 100)
+    
+    for call in (lambda: db.get_plant_photos(plant_id),
+                 lambda: list(db.iter_photos(plant_id)),
+                 lambda: db.get_plant_photos_page(plant_id, limit=10, cursor=cursor),
+                 lambda: db.delete_plant(plant_id)):
+        plans = [(sql, plan) for sql, plan in query_plans(db, call) if 'photos' in sql]
+        assert plans
+        for sql, plan in plans:
+            assert 'idx_photos_plant_taken' in plan, sql
+            assert 'SCAN photos' not in plan, sql
+
+
+def test_plant_listing_queries_use_created_index(db):
+    db.add_plant("龜背竹")
+    cursor = encode_page_cursor('2026-01-01T00:00:00', 100)
+    
+    for call in (db.get_all_plants,
+                 lambda: list(db.iter_plants()),
+                 lambda: db.get_plants_page(limit=10, cursor=cursor)):
+        plans = [(sql, plan) for sql, plan in query_plans(db, call) if 'FROM plants' in sql]
+        assert plans
+        for sql, plan in plans:
+            assert 'idx_plants_created' in plan, sql
+            assert 'TEMP B-TREE' not in plan, sql
+            assert 'SCAN photos' not in plan, sql
+
+
+def test_plants_page_walks_all_plants_once(db):
+    ids = [db.add_plant(f"植物{i}") for i in range(25)]
+    conn = db.get_connection()
+    # 同一時間建立的植物按 id 排序，翻頁時不重複也不遺漏
+    conn.execute("UPDATE plants SET created_at = '2026-01-01T00:00:00' WHERE id % 3 = 0")
+    conn.commit()
+    expected = [row[0] for row in conn.execute(
+        'SELECT id FROM plants ORDER BY created_at DESC, id DESC')]
+    
+    seen = []
+    cursor = None
+    while True:
+        plants, cursor = db.get_plants_page(limit=10, cursor=cursor)
+        seen.extend(plant['id'] for plant in plants)
+        if cursor is None:
+            break
+    assert seen == expected
+    assert sorted(seen) == ids
+
+
+def test_plant_photos_page_walks_all_photos_once(db):
+    plant_id = db.add_plant("龜背竹")
+    other_id = db.add_plant("虎尾蘭")
+    db.add_photos_many(
+        {'plant_id': plant_id, 'photo_path': f"{i}.jpg",
+         'taken_at': '2026-01-01T00:00:00' if i % 2 else f'2026-01-{i + 2:02d}T00:00:00'}
+        for i in range(23)
+    )
+    db.add_photo(other_id, "other.jpg")
+    expected = [photo['id'] for photo in sorted(
+        db.get_plant_photos(plant_id), key=lambda p: (p['taken_at'], p['id']), reverse=True)]
+    
+    seen = []
+    cursor = None
+    while True:
+        photos, cursor = db.get_plant_photos_page(plant_id, limit=5, cursor=cursor)
+        seen.extend(photo['id'] for photo in photos)
+        if cursor is None:
+            break
+    assert seen == expected
+    assert len(seen) == 23
+
+
+def test_cache_skips_value_loaded_before_invalidation(db):
+    plant_id = db.add_plant("龜背竹")
+    db.get_plant(plant_id)
+    
+    def load_then_write():
+        # 模擬讀取完成後、寫入緩存前，另一個線程修改並提交了數據
+        value = db.get_connection().execute(
+            'SELECT chinese_name FROM plants WHERE id = ?', (plant_id,)).fetchone()[0]
+        db.update_plant(plant_id, chinese_name="鱗葉龜背竹")
+        return value
+    
+    assert db._cached(('name', plant_id), load_then_write) == "龜背竹"
+    assert db._cached(('name', plant_id), lambda: "重新讀取") == "重新讀取"
+    assert db.get_plant(plant_id)['chinese_name'] == "鱗葉龜背竹"
+
+
+def test_delete_photo_queues_file_for_collection(db):
+    plant_id = db.add_plant("龜背竹")
+    photo_ids = [db.add_photo(plant_id, f"{name}.jpg") for name in ("a", "b", "c")]
+    
+    assert db.delete_photo(photo_ids[0])
+    assert not db.delete_photo(photo_ids[0])
+    assert db.delete_photos_many(photo_ids[1:]) == 2
+    assert sorted(db.get_file_deletions()) == ["a.jpg", "b.jpg", "c.jpg"]
+
+
+def test_find_analysis_skips_failures_and_the_photo_itself(db):
+    plant_id = db.add_plant("龜背竹")
+    failed = db.add_photo(plant_id, "a.jpg", ai_analysis="AI 分析出錯：timeout", content_hash="h")
+    assert db.find_analysis_by_hash("h", plant_id) is None
+    
+    analyzed = db.add_photo(plant_id, "b.jpg", ai_analysis="葉片健康", care_suggestions="保持濕潤",
+                            content_hash="h")
+    assert db.find_analysis_by_hash("h", plant_id) == {'ai_analysis': "葉片健康",
+                                                       'care_suggestions': "保持濕潤"}
+    assert db.find_analysis_by_hash("h", plant_id, exclude_photo_id=failed)['ai_analysis'] == "葉片健康"
+    assert db.find_analysis_by_hash("h", plant_id, exclude_photo_id=analyzed) is None
+
+
+def drop_fts(database):
+    conn = database.get_connection()
+    for name in ('plants_fts_insert', 'plants_fts_delete', 'plants_fts_update',
+                 'photos_fts_insert', 'photos_fts_delete', 'photos_fts_update'):
+        conn.execute(f'DROP TRIGGER {name}')
+    conn.execute('DROP TABLE plants_fts')
+    conn.execute('DROP TABLE photos_fts')
+    conn.commit()
+
+
+def test_missing_fts_index_rebuilt_at_startup(db, tmp_path):
+    db.add_plant("黃金葛", notes="放在客廳窗邊")
+    drop_fts(db)
+    db.close()
+    
+    reopened = PlantDatabase(str(tmp_path / "plant_diary.db"))
+    try:
+        assert reopened._has_fts()
+        assert [r['snippet'] for r in reopened.search("客廳窗")] == ["放在【客廳窗】邊"]
+        fts_integrity_check(reopened)
+    finally:
+        reopened.close()
+
+
+def test_unavailable_fts_warns_and_falls_back(db, monkeypatch):
+    db.add_plant("黃金葛", notes="放在客廳窗邊")
+    drop_fts(db)
+    
+    def unavailable(cursor):
+        raise sqlite3.OperationalError("no such module: fts5")
+    monkeypatch.setattr(database, '_create_full_text_search', unavailable)
+    
+    with pytest.warns(RuntimeWarning, match="全文檢索不可用"):
+        assert not db.ensure_full_text_search()
+    assert [r['chinese_name'] for r in db.search("客廳窗")] == ["黃金葛"]
+
+
+def test_like_search_marks_every_term(db):
+    plant_id = db.add_plant("龜背竹", notes="放在客廳窗邊")
+    db.add_photo(plant_id, "a.jpg", ai_analysis="葉片發黃" + "，" * 40 + "需要減少澆水")
+    
+    # 兩個字的詞無法使用 trigram 索引，走 LIKE 查詢
+    assert [r['snippet'] for r in db.search("客廳 窗邊")] == ["龜背竹  放在【客廳】【窗邊】"]
+    snippet = db.search("發黃 澆水")[0]['snippet']
+    assert "【發黃】" in snippet and "【澆水】" in snippet
+    assert "…" in snippet
+
+
+def test_fts_search_ranks_name_matches_first(db):
+    noted = db.add_plant("綠蘿", notes="旁邊那盆虎尾蘭長得更好")
+    named = db.add_plant("虎尾蘭", "Sansevieria trifasciata")
+    db.add_photo(noted, "a.jpg", ai_analysis="和虎尾蘭一樣耐旱")
+    
+    plans = query_plans(db, lambda: db.search("虎尾蘭"))
+    assert any('MATCH' in sql for sql, _ in plans)
+    results = db.search("虎尾蘭")
+    assert [(r['type'], r['plant_id']) for r in results] == [
+        ('plant', named), ('plant', noted), ('photo', noted)]
+    assert results[0]['snippet'] == "【虎尾蘭】"
+    assert [r['score'] for r in results] == sorted(r['score'] for r in results)
+    
+    assert [r['plant_id'] for r in db.search("虎尾蘭", limit=1, offset=1)] == [noted]
+    assert db.search("虎尾蘭", offset=database.MAX_SEARCH_OFFSET + 1) == []
+
+
+def test_short_terms_use_like_fallback(db):
+    plant_id = db.add_plant("文竹", notes="喜歡半陰")
+    db.add_photo(plant_id, "a.jpg", notes="新芽")
+    
+    for query in ("文竹", "半陰 文竹", "新芽"):
+        plans = query_plans(db, lambda: db.search(query))
+        assert not any('MATCH' in sql for sql, _ in plans), query
+    assert [r['type'] for r in db.search("半陰 文竹")] == ['plant']
+    assert [r['photo_id'] for r in db.search("新芽")] == [db.get_plant_photos(plant_id)[0]['id']]
+    # 多個詞需全部匹配
+    assert db.search("文竹 全日照") == []
+
+
+def test_search_api_pages_results(web, client):
+    ids = [web.db.add_plant(f"仙人掌{i}", notes="多肉植物，少澆水") for i in range(3)]
+    
+    response = client.get('/api/search', query_string={'q': '多肉植物', 'limit': 2})
+    data = response.get_json()
+    assert response.status_code == 200
+    assert len(data['results']) == 2
+    assert data['next_offset'] == 2
+    assert data['results'][0]['snippet'] == "【多肉植物】，少澆水"
+    
+    data = client.get('/api/search', query_string={'q': '多肉植物', 'limit': 2, 'offset': 2}).get_json()
+    assert len(data['results']) == 1
+    assert data['next_offset'] is None
+    found = {r['plant_id'] for r in data['results']}
+    data = client.get('/api/search', query_string={'q': '多肉植物', 'limit': 2}).get_json()
+    assert found | {r['plant_id'] for r in data['results']} == set(ids)
+    
+    data = client.get('/api/search', query_string={'q': '多肉植物',
+                                                   'offset': database.MAX_SEARCH_OFFSET + 1}).get_json()
+    assert data['results'] == [] and data['next_offset'] is None
+    assert client.get('/api/search', query_string={'q': ' '}).status_code == 400
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""植物日記 - 照片標準化測試"""
+
+from PIL import Image
+
+from plant_diary.image_normalizer import ImageNormalizer
+
+
+def test_truncated_photo_falls_back_to_original(tmp_path):
+    source = tmp_path / "photo.jpg"
+    Image.new('RGB', (3000, 2000), 'green').save(source, quality=95)
+    data = source.read_bytes()
+    source.write_bytes(data[:len(data) // 3])
+    
+    assert ImageNormalizer().normalize(source, tmp_path / "out") == (None, None)
+    assert list(tmp_path.glob("out/*")) == []
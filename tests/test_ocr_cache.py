@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""植物日記 - OCR 結果緩存測試"""
+
+import io
+import itertools
+import json
+
+import pytest
+from PIL import Image
+
+from plant_diary import ocr_cache
+from plant_diary.ocr_cache import OCRCache, EVICT_TARGET, image_digest, raw_digest
+
+RESULT = {'chinese_name': "龜背竹", 'scientific_name': "Monstera deliciosa"}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # 每次寫入和命中的時間遞增，淘汰順序不受時鐘精度影響
+    clock = itertools.count(1000)
+    monkeypatch.setattr(ocr_cache.time, 'time', lambda: float(next(clock)))
+    cache = OCRCache(str(tmp_path / "ocr_cache.db"))
+    yield cache
+    cache.close()
+
+
+def encode(image, fmt, **params):
+    data = io.BytesIO()
+    image.save(data, fmt, **params)
+    return data.getvalue()
+
+
+def test_raw_alias_hit(cache):
+    cache.put("pixels", 'easyocr', 1, RESULT, raw_hash="raw")
+    
+    assert cache.get_raw("raw", 'easyocr', 1) == RESULT
+    assert cache.get_raw("raw", 'openai', 1) is None
+    assert cache.get_raw("raw", 'easyocr', 2) is None
+    assert cache.get_raw("other", 'easyocr', 1) is None
+
+
+def test_pixel_hash_hits_across_reencodes(cache):
+    image = Image.new('RGB', (32, 24), 'green')
+    image.putpixel((3, 4), (255, 0, 0))
+    png = encode(image, 'PNG')
+    webp = encode(image, 'WEBP', lossless=True)
+    assert raw_digest(png) != raw_digest(webp)
+    pixels = image_digest(Image.open(io.BytesIO(png)))
+    assert image_digest(Image.open(io.BytesIO(webp))) == pixels
+    
+    cache.put(pixels, 'easyocr', 1, RESULT, raw_hash=raw_digest(png))
+    assert cache.get_raw(raw_digest(webp), 'easyocr', 1) is None
+    assert cache.get(pixels, 'easyocr', 1, raw_hash=raw_digest(webp)) == RESULT
+    # 命中後記錄了新文件的對應，下次不需要解碼
+    assert cache.get_raw(raw_digest(webp), 'easyocr', 1) == RESULT
+
+
+def test_lru_eviction_to_target(cache):
+    size = len(json.dumps({'n': 0}).encode('utf-8'))
+    cache.max_bytes = size * 10
+    for n in range(10):
+        cache.put(f"image{n}", 'easyocr', 1, {'n': n}, raw_hash=f"raw{n}")
+    assert cache.stats()['entries'] == 10
+    # 最早寫入的結果剛被使用過，不會被淘汰
+    assert cache.get("image0", 'easyocr', 1) == {'n': 0}
+    
+    cache.put("image10", 'easyocr', 1, {'n': 10})
+    
+    stats = cache.stats()
+    assert stats['bytes'] <= cache.max_bytes * EVICT_TARGET
+    # 11 個結果共 89 字節，按最近使用時間刪到 72 字節以下
+    assert stats['entries'] == 8
+    assert stats['evictions'] == 3
+    for n in (1, 2, 3):
+        assert cache.get(f"image{n}", 'easyocr', 1) is None
+        assert cache.get_raw(f"raw{n}", 'easyocr', 1) is None
+    assert cache.get("image0", 'easyocr', 1) == {'n': 0}
+    assert cache.get_raw("raw4", 'easyocr', 1) == {'n': 4}
+
+
+def test_stats(cache):
+    assert cache.stats()['hit_rate'] == 0.0
+    cache.put("pixels", 'easyocr', 1, RESULT, raw_hash="raw")
+    cache.get_raw("raw", 'easyocr', 1)
+    cache.get("pixels", 'easyocr', 1)
+    cache.get("missing", 'easyocr', 1)
+    cache.get_raw("missing", 'easyocr', 1)
+    
+    stats = cache.stats()
+    assert stats['entries'] == 1
+    assert stats['bytes'] == len(json.dumps(RESULT, ensure_ascii=False).encode('utf-8'))
+    assert (stats['stores'], stats['raw_hits'], stats['hits'], stats['misses']) == (1, 1, 1, 1)
+    assert stats['hit_rate'] == pytest.approx(2 / 3)
+    
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+    assert cache.stats()['stores'] == 0
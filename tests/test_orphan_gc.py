@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""植物日記 - 孤兒文件清理測試"""
+
+import io
+import os
+import time
+
+import pytest
+
+from plant_diary.database import PlantDatabase
+from plant_diary.orphan_gc import OrphanCollector, GRACE_SECONDS
+from plant_diary.photo_store import PhotoStore
+from plant_diary.thumbnails import ThumbnailStore
+
+# 早於寬限期的修改時間
+OLD = time.time() - 2 * GRACE_SECONDS
+
+
+@pytest.fixture
+def gc_env(tmp_path):
+    db = PlantDatabase(str(tmp_path / "plant_diary.db"))
+    photos = PhotoStore(tmp_path / "plant_photos")
+    originals = PhotoStore(tmp_path / "plant_originals")
+    thumbnails = ThumbnailStore(tmp_path / "plant_thumbs")
+    collector = OrphanCollector(db, photos, thumbnails, originals)
+    yield db, photos, originals, thumbnails, collector
+    db.close()
+
+
+def put(store, data, old=True):
+    """保存一個文件，old 時把修改時間設為寬限期之前"""
+    content_hash, path, _ = store.put_stream(io.BytesIO(data), "photo.jpg")
+    if old:
+        os.utime(path, (OLD, OLD))
+    return content_hash, path
+
+
+def make_thumbs(thumbnails, photo_path):
+    """為照片建立假的 200 尺寸縮略圖"""
+    paths = [thumbnails.path_for(photo_path, 200, ext) for ext in ('jpg', 'webp')]
+    for path in paths:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'thumb')
+        os.utime(path, (OLD, OLD))
+    return paths
+
+
+def test_referenced_and_new_files_kept(gc_env):
+    db, photos, _, _, collector = gc_env
+    plant_id = db.add_plant("龜背竹")
+    content_hash, referenced = put(photos, b'referenced')
+    db.add_photo(plant_id, str(referenced), content_hash=content_hash)
+    _, new = put(photos, b'just uploaded', old=False)
+    _, orphan = put(photos, b'orphan')
+    
+    report = collector.run()
+    
+    assert referenced.exists()
+    assert new.exists()
+    assert not orphan.exists()
+    assert report['orphans'] == 1
+    assert report['deleted'] == 1
+    assert report['reclaimed_bytes'] == len(b'orphan')
+
+
+def test_dry_run_removes_nothing(gc_env):
+    _, photos, _, thumbnails, collector = gc_env
+    _, orphan = put(photos, b'orphan')
+    thumbs = make_thumbs(thumbnails, orphan)
+    
+    report = collector.run(dry_run=True)
+    
+    assert orphan.exists()
+    assert all(path.exists() for path in thumbs)
+    assert report['dry_run']
+    assert report['orphans'] == 3
+    assert report['deleted'] == 0
+    assert report['reclaimed_bytes'] == len(b'orphan') + 2 * len(b'thumb')
+
+
+def test_upload_and_pack_dirs_skipped(gc_env):
+    _, photos, _, _, collector = gc_env
+    kept = []
+    for name in ('.uploads/0123.part', '.packs/pack-000001.pack', '.packs/index.db'):
+        path = photos.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'data')
+        os.utime(path, (OLD, OLD))
+        kept.append(path)
+    
+    report = collector.run()
+    
+    assert all(path.exists() for path in kept)
+    assert report['scanned'] == 0
+
+
+def test_thumbnails_and_originals_cleaned(gc_env):
+    db, photos, originals, thumbnails, collector = gc_env
+    plant_id = db.add_plant("龜背竹")
+    content_hash, photo = put(photos, b'normalized')
+    original_hash, original = put(originals, b'original upload')
+    db.add_photo(plant_id, str(photo), content_hash=content_hash, original_hash=original_hash)
+    kept_thumbs = make_thumbs(thumbnails, photo)
+    _, orphan_original = put(originals, b'original of a deleted photo')
+    orphan_thumbs = make_thumbs(thumbnails, photos.root / "deleted.jpg")
+    
+    collector.run()
+    
+    assert original.exists()
+    assert all(path.exists() for path in kept_thumbs)
+    assert not orphan_original.exists()
+    assert not any(path.exists() for path in orphan_thumbs)
+
+
+def test_queued_photo_removed_with_thumbnails(gc_env):
+    db, photos, _, thumbnails, collector = gc_env
+    plant_id = db.add_plant("龜背竹")
+    content_hash, photo = put(photos, b'deleted later')
+    photo_id = db.add_photo(plant_id, str(photo), content_hash=content_hash)
+    thumbs = make_thumbs(thumbnails, photo)
+    
+    db.delete_photo(photo_id)
+    report = collector.drain_queue()
+    
+    assert not photo.exists()
+    assert not any(path.exists() for path in thumbs)
+    assert report['queued'] == 1
+    assert db.get_file_deletions() == []
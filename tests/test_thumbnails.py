@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""植物日記 - 縮略圖測試"""
+
+from PIL import Image
+
+from plant_diary.thumbnails import backfill
+
+
+def test_backfill_finds_sharded_photos(tmp_path):
+    photos_dir = tmp_path / "plant_photos"
+    shard = photos_dir / "ab" / "cd"
+    shard.mkdir(parents=True)
+    (photos_dir / ".tmp").mkdir()
+    Image.new('RGB', (64, 48), 'green').save(shard / "abcd1234.jpg")
+    Image.new('RGB', (64, 48), 'green').save(photos_dir / "legacy.png")
+    Image.new('RGB', (64, 48), 'green').save(photos_dir / ".tmp" / "partial.jpg")
+    
+    result = backfill(photos_dir, tmp_path / "plant_thumbs", workers=1)
+    
+    assert result['photos'] == 2
+    assert result['failed'] == 0
+    assert (tmp_path / "plant_thumbs" / "200" / "abcd1234.jpg.webp").exists()
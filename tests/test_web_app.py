@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""植物日記 Web 版 - 照片網址緩存和 pack 存儲測試"""
+
+import hashlib
+import io
+import mimetypes
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from plant_diary.chunked_upload import ChunkedUploads, MAX_UPLOAD_SIZE
+from plant_diary.pack_store import PackStore, open_photo
+
+WEB_DIR = Path(__file__).resolve().parent.parent / 'plant_diary_web'
+
+
+def jpeg_bytes(color):
+    data = io.BytesIO()
+    Image.new('RGB', (800, 600), color).save(data, 'JPEG')
+    return data.getvalue()
+
+
+def upload(web, client, color='green'):
+    plant_id = web.db.add_plant("龜背竹")
+    data = io.BytesIO(jpeg_bytes(color))
+    response = client.post(f'/api/plants/{plant_id}/photos',
+                           data={'photo': (data, 'photo.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_content_addressed_photo_is_immutable(web, client):
+    filename = upload(web, client)['filename']
+    content_hash = web.photo_store.content_hash_of(filename)
+    
+    response = client.get(f'/uploads/{filename}')
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{content_hash}"'
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == web.IMMUTABLE_MAX_AGE
+    body = response.data
+    
+    response = client.get(f'/uploads/{filename}', headers={'If-None-Match': f'"{content_hash}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+    
+    response = client.get(f'/uploads/{filename}', headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert response.data == body[:100]
+
+
+def test_thumbnail_etag_varies_by_format(web, client):
+    filename = upload(web, client)['filename']
+    content_hash = web.photo_store.content_hash_of(filename)
+    
+    response = client.get(f'/thumbs/200/{filename}', headers={'Accept': 'image/webp'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{content_hash}-200.webp"'
+    assert 'Accept' in response.vary
+    
+    response = client.get(f'/thumbs/200/{filename}',
+                          headers={'Accept': 'image/webp', 'If-None-Match': f'"{content_hash}-200.webp"'})
+    assert response.status_code == 304
+
+
+def test_logo_revalidates_with_etag(web, client):
+    logo = next(path for path in sorted((WEB_DIR.parent / 'LOGO').iterdir()) if path.is_file())
+    
+    response = client.get(f'/logo/{logo.name}')
+    assert response.status_code == 200
+    assert response.cache_control.max_age == web.MUTABLE_MAX_AGE
+    assert not response.cache_control.immutable
+    
+    response = client.get(f'/logo/{logo.name}', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+
+def test_deleted_photo_file_kept_while_shared(web, client):
+    first = upload(web, client, color='orange')
+    second = upload(web, client, color='orange')
+    assert second['duplicate']
+    path = web.photo_store.resolve(first['filename'])
+    
+    assert client.delete(f"/api/photos/{first['photo_id']}").status_code == 200
+    web.orphan_collector.drain_queue()
+    assert path.exists()
+    
+    assert client.delete(f"/api/photos/{second['photo_id']}").status_code == 200
+    web.orphan_collector.drain_queue()
+    # 重複上傳剛沿用過文件，寬限期內留在隊列中
+    assert path.exists()
+    
+    os.utime(path, (1, 1))
+    web.orphan_collector.drain_queue()
+    assert not path.exists()
+    assert client.delete(f"/api/photos/{second['photo_id']}").status_code == 404
+
+
+def pack_photo(web, filename):
+    """把上傳的照片移入 pack，刪除獨立文件"""
+    path = web.photo_store.resolve(filename)
+    web.pack_store.append([(filename, path)])
+    body = path.read_bytes()
+    path.unlink()
+    return body
+
+
+def test_pack_store_append_lookup_open(tmp_path):
+    first, second = tmp_path / 'a.jpg', tmp_path / 'b.jpg'
+    first.write_bytes(b'first photo')
+    second.write_bytes(b'second photo data')
+    store = PackStore(tmp_path / '.packs')
+    try:
+        assert store.lookup('a.jpg') is None
+        assert store.open('a.jpg') == (None, None)
+        
+        assert store.append([('a.jpg', first), ('b.jpg', second)]) == 28
+        pack, offset, length, mtime = store.lookup('b.jpg')
+        assert (offset, length) == (11, 17)
+        assert mtime == second.stat().st_mtime
+        
+        packed, packed_mtime = store.open('b.jpg')
+        assert packed_mtime == mtime
+        assert len(packed) == 17
+        assert packed.read() == b'second photo data'
+        packed.seek(7)
+        assert packed.read(5) == b'photo'
+        assert b''.join(packed.iter_range(0, 6, chunk_size=4)) == b'second'
+        
+        store.remove(['a.jpg'])
+        assert store.open('a.jpg') == (None, None)
+        assert store.stats()['dead_bytes'] == 11
+        assert store.compact()['reclaimed_bytes'] == 11
+        packed, _ = store.open('b.jpg')
+        assert packed.read() == b'second photo data'
+    finally:
+        store.close()
+
+
+def test_open_photo_falls_back_to_pack(tmp_path):
+    photo = tmp_path / 'a.jpg'
+    photo.write_bytes(b'loose file')
+    store = PackStore(tmp_path / '.packs')
+    try:
+        with open_photo(photo, store) as f:
+            assert f.read() == b'loose file'
+        
+        store.append([('a.jpg', photo)])
+        photo.unlink()
+        with open_photo(photo, store) as f:
+            assert f.read() == b'loose file'
+        
+        with pytest.raises(FileNotFoundError):
+            open_photo(tmp_path / 'missing.jpg', store)
+        with pytest.raises(FileNotFoundError):
+            open_photo(photo)
+    finally:
+        store.close()
+
+
+def test_packed_photo_served_with_ranges(web, client):
+    filename = upload(web, client, color='blue')['filename']
+    content_hash = web.photo_store.content_hash_of(filename)
+    body = pack_photo(web, filename)
+    
+    response = client.get(f'/uploads/{filename}')
+    assert response.status_code == 200
+    assert response.data == body
+    assert response.mimetype == mimetypes.guess_type(filename)[0]
+    assert response.headers['ETag'] == f'"{content_hash}"'
+    assert response.cache_control.immutable
+    
+    response = client.get(f'/uploads/{filename}', headers={'If-None-Match': f'"{content_hash}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+    
+    response = client.get(f'/uploads/{filename}', headers={'Range': 'bytes=10-109'})
+    assert response.status_code == 206
+    assert response.data == body[10:110]
+    assert response.headers['Content-Range'] == f'bytes 10-109/{len(body)}'
+
+
+class ImmediateThread:
+    """在 start() 中直接執行目標函數，讓後台分析在請求內完成"""
+    
+    def __init__(self, target, *args, **kwargs):
+        self.target = target
+        self.daemon = False
+    
+    def start(self):
+        self.target()
+
+
+class RecordingAnalyzer:
+    def __init__(self):
+        self.images = []
+    
+    def analyze_plant_photo(self, image, chinese_name=None, scientific_name=None, filename=None):
+        self.images.append(image.read())
+        return {'ai_analysis': '葉片健康', 'care_suggestions': '保持濕潤'}
+
+
+def test_analysis_reads_packed_photo(web, client, monkeypatch):
+    result = upload(web, client, color='purple')
+    body = pack_photo(web, result['filename'])
+    analyzer = RecordingAnalyzer()
+    monkeypatch.setattr(web, 'analyzer', analyzer)
+    monkeypatch.setattr(threading, 'Thread', ImmediateThread)
+    
+    response = client.post('/api/photos/analyze', json={'photo_ids': [result['photo_id']]})
+    assert response.status_code == 200
+    assert analyzer.images == [body]
+    assert web.db.get_photo(result['photo_id'])['ai_analysis'] == '葉片健康'
+
+
+def test_reanalysis_calls_analyzer(web, client, monkeypatch):
+    first = upload(web, client, color='yellow')
+    second = upload(web, client, color='yellow')
+    analyzer = RecordingAnalyzer()
+    monkeypatch.setattr(web, 'analyzer', analyzer)
+    monkeypatch.setattr(threading, 'Thread', ImmediateThread)
+    
+    client.post('/api/photos/analyze', json={'photo_ids': [first['photo_id']]})
+    assert len(analyzer.images) == 1
+    # 相同內容的照片沿用成功的結果
+    client.post('/api/photos/analyze', json={'photo_ids': [second['photo_id']]})
+    assert len(analyzer.images) == 1
+    assert web.db.get_photo(second['photo_id'])['ai_analysis'] == '葉片健康'
+    # 已有結果時是要求重新分析
+    client.post('/api/photos/analyze', json={'photo_ids': [first['photo_id']]})
+    assert len(analyzer.images) == 2
+
+
+def init_upload(web, client, size):
+    plant_id = web.db.add_plant("龜背竹")
+    response = client.post('/api/uploads', json={'plant_id': plant_id, 'filename': 'big.jpg',
+                                                 'size': size, 'notes': '分塊上傳'})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_chunked_upload_resumes_and_finalizes(web, client):
+    body = jpeg_bytes('teal')
+    upload_id = init_upload(web, client, len(body))['upload_id']
+    half = len(body) // 2
+    
+    response = client.put(f'/api/uploads/{upload_id}?offset=0', data=body[:half])
+    assert response.get_json() == {'success': True, 'offset': half}
+    
+    # 重複發送已接收的分塊時返回 409 和正確的偏移量
+    response = client.put(f'/api/uploads/{upload_id}?offset=0', data=body[:half])
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == half
+    
+    response = client.post(f'/api/uploads/{upload_id}/finalize')
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == half
+    
+    # 斷線後查詢偏移量繼續上傳
+    response = client.get(f'/api/uploads/{upload_id}')
+    assert response.get_json()['offset'] == half
+    response = client.put(f'/api/uploads/{upload_id}?offset={half}', data=body[half:])
+    assert response.get_json()['offset'] == len(body)
+    
+    response = client.post(f'/api/uploads/{upload_id}/finalize')
+    assert response.status_code == 200
+    result = response.get_json()
+    photo = web.db.get_photo(result['photo_id'])
+    assert photo['notes'] == '分塊上傳'
+    assert web.photo_store.resolve(result['filename']).is_file()
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 404
+
+
+def test_chunked_upload_rejects_oversize(web, client):
+    plant_id = web.db.add_plant("龜背竹")
+    response = client.post('/api/uploads', json={'plant_id': plant_id, 'filename': 'big.jpg',
+                                                 'size': MAX_UPLOAD_SIZE + 1})
+    assert response.status_code == 400
+    
+    upload_id = init_upload(web, client, 10)['upload_id']
+    response = client.put(f'/api/uploads/{upload_id}?offset=0', data=b'x' * 11)
+    assert response.status_code == 400
+    assert client.get(f'/api/uploads/{upload_id}').get_json()['offset'] == 0
+
+
+def test_chunked_upload_across_workers(tmp_path):
+    """兩個 ChunkedUploads 共用上傳目錄，模擬分塊交替由兩個 worker 處理"""
+    body = jpeg_bytes('navy')
+    first, second = ChunkedUploads(tmp_path), ChunkedUploads(tmp_path)
+    upload_id = first.create(1, 1, 'big.jpg', len(body))['upload_id']
+    third = len(body) // 3
+    
+    assert first.write_chunk(upload_id, 0, io.BytesIO(body[:third])) == third
+    assert second.write_chunk(upload_id, third, io.BytesIO(body[third:2 * third])) == 2 * third
+    assert first.write_chunk(upload_id, 2 * third, io.BytesIO(body[2 * third:])) == len(body)
+    
+    _, content_hash, part_path = second.finalize(upload_id)
+    assert content_hash == hashlib.sha256(body).hexdigest()
+    assert part_path.read_bytes() == body